@@ -6,8 +6,8 @@ from .models import Cart, CartItem
 class CartItemInline(admin.TabularInline):
     model = CartItem
     extra = 0
-    readonly_fields = ('subtotal', 'created_at', 'updated_at')
-    fields = ('product', 'quantity', 'subtotal', 'created_at')
+    readonly_fields = ('subtotal', 'reserved_quantity', 'reserved_until', 'created_at', 'updated_at')
+    fields = ('product', 'quantity', 'subtotal', 'reserved_quantity', 'reserved_until', 'created_at')
 
 
 @admin.register(Cart)
@@ -31,6 +31,10 @@ class CartAdmin(admin.ModelAdmin):
         }),
     )
     
+    def get_queryset(self, request):
+        # Totales del listado en la misma consulta
+        return super().get_queryset(request).select_related('user').with_totals()
+
     def total_items_display(self, obj):
         return obj.total_items
     total_items_display.short_description = 'Total Items'
@@ -42,10 +46,11 @@ class CartAdmin(admin.ModelAdmin):
 
 @admin.register(CartItem)
 class CartItemAdmin(admin.ModelAdmin):
-    list_display = ('id', 'cart', 'product', 'quantity', 'subtotal_display', 'created_at')
+    list_display = ('id', 'cart', 'product', 'quantity', 'reserved_quantity', 'reserved_until', 'subtotal_display', 'created_at')
     list_filter = ('created_at', 'updated_at')
     search_fields = ('cart__user__email', 'product__name')
-    readonly_fields = ('subtotal', 'created_at', 'updated_at')
+    readonly_fields = ('subtotal', 'reserved_quantity', 'reserved_until', 'created_at', 'updated_at')
+    list_select_related = ('cart__user', 'product')
     
     def subtotal_display(self, obj):
         return format_html('<strong>${}</strong>', obj.subtotal)
@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from cart.reservations import release_expired
+
+
+class Command(BaseCommand):
+    help = 'Libera las reservas de stock vencidas de los carritos (para ejecutar periódicamente, p. ej. con cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Reservas por lote y transacción')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size debe ser mayor a 0')
+        start = time.perf_counter()
+        released = release_expired(batch_size=options['batch_size'])
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(f'{released} reservas liberadas en {elapsed:.2f}s'))
@@ -1,35 +1,82 @@
-from django.db import models
+from django.db import connection, models, transaction
+from django.db.models import F, Sum, Value
+from django.db.models.functions import Coalesce
 from django.contrib.auth import get_user_model
-from products.models import Product
+from django.utils import timezone
+from products.models import Product, StockShard, live_stock
 from decimal import Decimal
 
 User = get_user_model()
 
 
+def totals_aggregates(prefix=''):
+    """SUM(quantity) y SUM(quantity * final_price) sobre los items (``prefix``: ruta desde el modelo consultado)"""
+    amount_field = models.DecimalField(max_digits=12, decimal_places=2)
+    return {
+        'items_quantity': Coalesce(Sum(f'{prefix}quantity'), 0),
+        'items_amount': Coalesce(
+            Sum(F(f'{prefix}quantity') * F(f'{prefix}product__final_price'), output_field=amount_field),
+            Value(Decimal('0.00')), output_field=amount_field,
+        ),
+    }
+
+
+class CartQuerySet(models.QuerySet):
+    def with_totals(self):
+        """Totales del carrito en la misma consulta (GROUP BY sobre items JOIN productos)"""
+        return self.annotate(**totals_aggregates('items__'))
+
+    def touch(self):
+        """Registrar un cambio en los items: versión + 1 con un solo UPDATE"""
+        return self.update(version=F('version') + 1, updated_at=timezone.now())
+
+
 class Cart(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='cart')
+    # Aumenta con cada cambio de items: el cliente sabe si su copia local está al día
+    version = models.PositiveIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = CartQuerySet.as_manager()
+
     class Meta:
         ordering = ['-updated_at']
 
     def __str__(self):
         return f"Carrito de {self.user.email}"
 
+    def load_totals(self):
+        """
+        Dejar items_quantity/items_amount en la instancia: de with_totals() si ya
+        vienen anotados, de los items precargados si los hay, o con un solo aggregate.
+        """
+        if hasattr(self, 'items_quantity'):
+            return
+        items = getattr(self, '_prefetched_objects_cache', {}).get('items')
+        if items is not None:
+            self.items_quantity = sum(item.quantity for item in items)
+            self.items_amount = sum((item.subtotal for item in items), Decimal('0.00'))
+        else:
+            totals = self.items.order_by().aggregate(**totals_aggregates())
+            self.items_quantity, self.items_amount = totals['items_quantity'], totals['items_amount']
+
+    def reset_totals(self):
+        """Descartar los totales cargados (tras modificar los items)"""
+        for name in ('items_quantity', 'items_amount'):
+            self.__dict__.pop(name, None)
+
     @property
     def total_items(self):
         """Retorna el total de items en el carrito"""
-        from django.db.models import Sum
-        return self.items.aggregate(total=Sum('quantity'))['total'] or 0
+        self.load_totals()
+        return self.items_quantity
 
     @property
     def total_amount(self):
         """Calcula el total del carrito"""
-        total = Decimal('0.00')
-        for item in self.items.all():
-            total += item.subtotal
-        return total
+        self.load_totals()
+        return Decimal(self.items_amount).quantize(Decimal('0.01'))
 
     @classmethod
     def get_or_create_cart(cls, user):
@@ -38,16 +85,92 @@ class Cart(models.Model):
         return cart
 
 
+class CartItemQuerySet(models.QuerySet):
+    def add_quantity(self, user, product_id, quantity):
+        """
+        Sumar ``quantity`` del producto al carrito de ``user`` en una sentencia.
+
+        INSERT ... ON CONFLICT DO UPDATE con el incremento y la validación de
+        stock en el mismo statement: dos peticiones simultáneas no pierden
+        cantidades ni superan el stock. Devuelve (id del item, cantidad, creado)
+        o None si no se aplicó (sin carrito, producto inactivo o sin stock).
+        """
+        features = connection.features
+        if not (features.supports_update_conflicts_with_target and features.can_return_columns_from_insert):
+            return self.add_quantity_locked(user, product_id, quantity)
+
+        item_table, cart_table, product_table, shard_table = (
+            model._meta.db_table for model in (CartItem, Cart, Product, StockShard)
+        )
+
+        def stock_of(alias):
+            # Stock real (ver products.models.live_stock): con contadores, su suma
+            return (f'CASE WHEN {alias}.stock_shards > 0 THEN COALESCE('
+                    f'(SELECT SUM(quantity) FROM {shard_table} WHERE product_id = {alias}.id), 0) '
+                    f'ELSE {alias}.stock END')
+
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {item_table} (cart_id, product_id, quantity, reserved_quantity, created_at, updated_at) '
+                f'SELECT c.id, p.id, %s, 0, %s, %s FROM {cart_table} c, {product_table} p '
+                f'WHERE c.user_id = %s AND p.id = %s AND p.is_active = %s AND {stock_of("p")} >= %s '
+                f'ON CONFLICT (cart_id, product_id) DO UPDATE '
+                f'SET quantity = {item_table}.quantity + excluded.quantity, updated_at = excluded.updated_at '
+                f'WHERE (SELECT {stock_of("sp")} FROM {product_table} sp WHERE sp.id = excluded.product_id) '
+                f'>= {item_table}.quantity + excluded.quantity '
+                f'RETURNING id, quantity',
+                [quantity, now, now, user.pk, product_id, True, quantity],
+            )
+            row = cursor.fetchone()
+        if row is None:
+            return None
+        # Un item existente tiene al menos 1 unidad: si quedó con ``quantity`` es nuevo
+        return row[0], row[1], row[1] == quantity
+
+    @transaction.atomic
+    def add_quantity_locked(self, user, product_id, quantity):
+        """add_quantity() para bases sin upsert con RETURNING: bloqueando producto e item"""
+        cart = Cart.objects.filter(user=user).first()
+        product = Product.objects.select_for_update().filter(id=product_id, is_active=True).first()
+        if cart is None or product is None:
+            return None
+        item = self.select_for_update().filter(cart=cart, product=product).first()
+        new_quantity = quantity + (item.quantity if item else 0)
+        if product.current_stock < new_quantity:
+            return None
+        if item is None:
+            item = self.create(cart=cart, product=product, quantity=quantity)
+            return item.pk, quantity, True
+        self.filter(pk=item.pk).update(quantity=new_quantity, updated_at=timezone.now())
+        return item.pk, new_quantity, False
+
+    def set_quantity(self, user, item_id, quantity):
+        """Fijar la cantidad de un item del usuario si hay stock, en un solo UPDATE (filas afectadas)"""
+        return self.alias(product_stock=live_stock('product__')).filter(
+            id=item_id, cart__user=user, product__is_active=True, product_stock__gte=quantity
+        ).update(quantity=quantity, updated_at=timezone.now())
+
+
 class CartItem(models.Model):
     cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='items')
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=1)
+    # Reserva de stock del item (ver cart.reservations): cantidad retenida y vencimiento
+    reserved_quantity = models.PositiveIntegerField(default=0)
+    reserved_until = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = CartItemQuerySet.as_manager()
+
     class Meta:
         unique_together = ['cart', 'product']
         ordering = ['-created_at']
+        indexes = [
+            # Barrido de reservas vencidas
+            models.Index(fields=['reserved_until']),
+        ]
 
     def __str__(self):
         return f"{self.quantity}x {self.product.name}"
@@ -60,11 +183,12 @@ class CartItem(models.Model):
     def clean(self):
         """Valida que haya stock disponible"""
         from django.core.exceptions import ValidationError
-        if not self.product.is_available(self.quantity):
-            raise ValidationError(f'Stock insuficiente. Disponible: {self.product.stock}')
+        # Lo que el item ya retiene cuenta como disponible para él
+        if not self.product.is_available(self.quantity - self.reserved_quantity):
+            raise ValidationError(f'Stock insuficiente. Disponible: {self.product.available_stock + self.reserved_quantity}')
 
     def save(self, *args, **kwargs):
         """Valida stock antes de guardar"""
-        if not self.product.is_available(self.quantity):
-            raise ValueError(f'Stock insuficiente. Disponible: {self.product.stock}')
+        if not self.product.is_available(self.quantity - self.reserved_quantity):
+            raise ValueError(f'Stock insuficiente. Disponible: {self.product.available_stock + self.reserved_quantity}')
         super().save(*args, **kwargs)
@@ -0,0 +1,145 @@
+"""
+Reservas de stock al agregar al carrito (opcional: CART_RESERVATIONS).
+
+Cada item retiene ``reserved_quantity`` unidades hasta ``reserved_until`` y
+Product.reserved_stock suma esas retenciones, así el disponible
+(stock real - reserved_stock) se lee de la fila del producto sin recorrer
+carritos. El contador se cambia con UPDATE condicionales dentro de la
+transacción del cambio en el carrito: nunca se retiene más que el
+disponible. Las reservas vencidas se liberan en lotes con el comando
+release_expired_reservations, y también cuando a un producto no le alcanza
+el disponible.
+"""
+from collections import defaultdict
+from contextlib import nullcontext
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+from products.models import Product, live_stock
+from .models import CartItem
+
+
+class InsufficientStock(Exception):
+    """No alcanza el disponible de alguno de ``product_ids``"""
+
+    def __init__(self, product_ids):
+        super().__init__(f'Stock insuficiente para los productos {sorted(product_ids)}')
+        self.product_ids = set(product_ids)
+
+
+def reservations_enabled():
+    return getattr(settings, 'CART_RESERVATIONS', False)
+
+
+def reservation_atomic():
+    """Transacción para un cambio del carrito solo con reservas (sin ellas es una sola sentencia)"""
+    return transaction.atomic() if reservations_enabled() else nullcontext()
+
+
+def available_for(product, reserved=0):
+    """Unidades que puede tener en el carrito quien ya retiene ``reserved`` de ``product``"""
+    return product.available_stock + (reserved if reservations_enabled() else 0)
+
+
+def reservation_expiry():
+    return timezone.now() + timedelta(seconds=settings.CART_RESERVATION_TTL)
+
+
+def product_counters():
+    # QuerySet base: el contador no cambia el contenido del producto (sin updated_at ni versión de caché)
+    return models.QuerySet(Product)
+
+
+def per_product(quantities):
+    return Case(
+        *[When(id=product_id, then=Value(quantity)) for product_id, quantity in quantities.items()],
+        output_field=models.IntegerField(),
+    )
+
+
+def reserve_stock(quantities):
+    """
+    Sumar ``{product_id: unidades}`` a reserved_stock, todo o nada.
+
+    Un solo UPDATE condicionado a que alcance el disponible de cada producto;
+    si no alcanza, se liberan las reservas vencidas de esos productos y se
+    reintenta una vez antes de lanzar InsufficientStock.
+    """
+    quantities = {product_id: quantity for product_id, quantity in quantities.items() if quantity > 0}
+    if not quantities:
+        return
+    for attempt in range(2):
+        try:
+            # Savepoint: si un producto no alcanza, se deshacen también los demás
+            with transaction.atomic():
+                amount = per_product(quantities)
+                rows = product_counters().alias(stock_total=live_stock()).filter(
+                    id__in=quantities, stock_total__gte=F('reserved_stock') + amount
+                ).update(reserved_stock=F('reserved_stock') + amount)
+                if rows != len(quantities):
+                    raise InsufficientStock(quantities)
+            return
+        except InsufficientStock:
+            if attempt or not release_expired(product_ids=list(quantities)):
+                raise
+
+
+def release_stock(quantities):
+    """Restar ``{product_id: unidades}`` de reserved_stock (sin bajar de 0) con un solo UPDATE"""
+    quantities = {product_id: quantity for product_id, quantity in quantities.items() if quantity > 0}
+    if not quantities:
+        return
+    amount = per_product(quantities)
+    product_counters().filter(id__in=quantities).update(
+        reserved_stock=Case(
+            When(reserved_stock__gte=amount, then=F('reserved_stock') - amount),
+            default=Value(0),
+        )
+    )
+
+
+def hold_item(item_id):
+    """Ajustar la reserva del item a su cantidad actual y renovar el vencimiento"""
+    item = CartItem.objects.filter(pk=item_id).values('product_id', 'quantity', 'reserved_quantity').get()
+    delta = item['quantity'] - item['reserved_quantity']
+    if delta > 0:
+        reserve_stock({item['product_id']: delta})
+    elif delta < 0:
+        release_stock({item['product_id']: -delta})
+    CartItem.objects.filter(pk=item_id).update(reserved_quantity=item['quantity'], reserved_until=reservation_expiry())
+
+
+def release_items(items):
+    """Liberar las reservas de los items de ``items`` (queryset), p. ej. antes de borrarlos"""
+    quantities = defaultdict(int)
+    for product_id, quantity in items.filter(reserved_quantity__gt=0).values_list('product_id', 'reserved_quantity'):
+        quantities[product_id] += quantity
+    release_stock(quantities)
+
+
+def release_expired(batch_size=1000, product_ids=None):
+    """Liberar las reservas vencidas en lotes (un SELECT y dos UPDATE por lote); devuelve cuántas"""
+    released = 0
+    while True:
+        with transaction.atomic():
+            expired = CartItem.objects.filter(reserved_quantity__gt=0, reserved_until__lt=timezone.now())
+            if product_ids is not None:
+                expired = expired.filter(product_id__in=product_ids)
+            rows = list(
+                expired.select_for_update().order_by('reserved_until')
+                .values_list('id', 'product_id', 'reserved_quantity')[:batch_size]
+            )
+            if not rows:
+                break
+            quantities = defaultdict(int)
+            for _, product_id, quantity in rows:
+                quantities[product_id] += quantity
+            release_stock(quantities)
+            CartItem.objects.filter(id__in=[row[0] for row in rows]).update(reserved_quantity=0, reserved_until=None)
+        released += len(rows)
+        if len(rows) < batch_size:
+            break
+    return released
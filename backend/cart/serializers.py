@@ -1,29 +1,214 @@
+from django.db import IntegrityError
+from django.db.models import Prefetch
+from django.utils import timezone
 from rest_framework import serializers
+from ecommerce.serializers import SparseFieldsetMixin
 from .models import Cart, CartItem
+from .reservations import (
+    InsufficientStock,
+    available_for,
+    release_stock,
+    reservation_expiry,
+    reservations_enabled,
+    reserve_stock,
+)
+from products.models import Product
 from products.serializers import ProductSerializer
 
 
-class CartItemSerializer(serializers.ModelSerializer):
+class CartItemSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     product = ProductSerializer(read_only=True)
     product_id = serializers.IntegerField(write_only=True)
     subtotal = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
 
     class Meta:
         model = CartItem
-        fields = ['id', 'product', 'product_id', 'quantity', 'subtotal', 'created_at', 'updated_at']
-        read_only_fields = ['id', 'created_at', 'updated_at']
+        fields = ['id', 'product', 'product_id', 'quantity', 'reserved_quantity', 'subtotal', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'reserved_quantity', 'created_at', 'updated_at']
 
 
-class CartSerializer(serializers.ModelSerializer):
+class CartSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     items = CartItemSerializer(many=True, read_only=True)
     total_items = serializers.IntegerField(read_only=True)
     total_amount = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
 
     class Meta:
         model = Cart
-        fields = ['id', 'items', 'total_items', 'total_amount', 'created_at', 'updated_at']
-        read_only_fields = ['id', 'created_at', 'updated_at']
+        fields = ['id', 'version', 'items', 'total_items', 'total_amount', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'version', 'created_at', 'updated_at']
 
+    def prepare_queryset(self, queryset):
+        # Sin items en la respuesta, los totales salen de la misma consulta del carrito
+        if not self.wants('items'):
+            if self.wants('total_items') or self.wants('total_amount'):
+                return queryset.with_totals()
+            return queryset
+        related, deferred = ProductSerializer.related_fields(self.wants, prefix='items.product.')
+        items = CartItem.objects.select_related('product', *[f'product__{name}' for name in related])
+        if deferred:
+            items = items.defer(*[f'product__{name}' for name in deferred])
+        return queryset.prefetch_related(Prefetch('items', queryset=items))
 
 
+class CartItemDeltaSerializer(serializers.ModelSerializer):
+    """Item cambiado en una respuesta ?view=delta (sin el producto anidado)"""
+    product_id = serializers.IntegerField(read_only=True)
+    subtotal = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+
+    class Meta:
+        model = CartItem
+        fields = ['id', 'product_id', 'quantity', 'reserved_quantity', 'subtotal']
+
+
+class CartTotalsSerializer(serializers.ModelSerializer):
+    """Totales y versión del carrito en una respuesta ?view=delta"""
+    total_items = serializers.IntegerField(read_only=True)
+    total_amount = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+
+    class Meta:
+        model = Cart
+        fields = ['id', 'version', 'total_items', 'total_amount']
+
+
+# Máximo de operaciones por petición a /api/cart/batch/
+BATCH_MAX_OPERATIONS = 100
+
+
+class CartOperationSerializer(serializers.Serializer):
+    """Una operación del lote: add (sumar), set (fijar cantidad) o remove"""
+    OPERATIONS = ['add', 'set', 'remove']
+
+    op = serializers.ChoiceField(choices=OPERATIONS)
+    product_id = serializers.IntegerField(required=False)
+    item_id = serializers.IntegerField(required=False)
+    quantity = serializers.IntegerField(min_value=1, required=False)
+
+    def validate(self, attrs):
+        if attrs['op'] == 'add':
+            if 'product_id' not in attrs:
+                raise serializers.ValidationError({'product_id': 'product_id es requerido para add.'})
+            attrs.setdefault('quantity', 1)
+        elif 'product_id' not in attrs and 'item_id' not in attrs:
+            raise serializers.ValidationError('Indique product_id o item_id.')
+        if attrs['op'] == 'set' and 'quantity' not in attrs:
+            raise serializers.ValidationError({'quantity': 'quantity es requerido para set.'})
+        return attrs
+
+
+class CartChanged(Exception):
+    """Otra petición agregó al carrito un producto que el lote iba a crear: repetir el lote"""
+
+
+class CartBatchSerializer(serializers.Serializer):
+    """
+    Varias operaciones sobre el carrito del usuario, aplicadas en orden.
+
+    Todo o nada: el stock de todos los productos afectados se valida contra
+    la cantidad final con una consulta, y los errores se devuelven por
+    operación en ``operations``. Los cambios se escriben con un DELETE, un
+    bulk_create y un bulk_update. Si un add_to_cart simultáneo inserta uno
+    de los items a crear, se lanza CartChanged (la transacción se deshace y
+    el lote se puede repetir: esa vez el item ya existe y se bloquea).
+    """
+    operations = CartOperationSerializer(many=True, allow_empty=False, max_length=BATCH_MAX_OPERATIONS)
+
+    def create(self, validated_data):
+        """Aplicar las operaciones (llamar dentro de una transacción); devuelve el carrito"""
+        operations = validated_data['operations']
+        cart, _ = Cart.objects.get_or_create(user=self.context['request'].user)
+        items = {item.product_id: item for item in CartItem.objects.select_for_update().filter(cart=cart)}
+        product_by_item = {item.pk: product_id for product_id, item in items.items()}
+
+        # Cantidad final de cada producto y la última operación que la fija
+        errors = [{} for _ in operations]
+        quantities = {product_id: item.quantity for product_id, item in items.items()}
+        last_operation = {}
+        for index, operation in enumerate(operations):
+            product_id = operation.get('product_id')
+            if product_id is None:
+                product_id = product_by_item.get(operation['item_id'])
+                if product_id is None:
+                    errors[index]['item_id'] = ['El item no está en tu carrito.']
+                    continue
+            if operation['op'] == 'add':
+                quantities[product_id] = quantities.get(product_id, 0) + operation['quantity']
+            elif operation['op'] == 'set':
+                quantities[product_id] = operation['quantity']
+            else:
+                quantities[product_id] = 0
+            last_operation[product_id] = index
+
+        products = Product.objects.filter(
+            id__in=[product_id for product_id in last_operation if quantities[product_id] > 0], is_active=True
+        ).only('id', 'name', 'stock', 'stock_shards', 'reserved_stock').with_live_stock().in_bulk()
+        reserved = {product_id: item.reserved_quantity for product_id, item in items.items()}
+
+        def check_stock(product_ids):
+            for product_id in product_ids:
+                index, quantity = last_operation[product_id], quantities[product_id]
+                if quantity == 0:
+                    continue
+                product = products.get(product_id)
+                if product is None:
+                    errors[index]['product_id'] = ['Producto no encontrado.']
+                elif available_for(product, reserved.get(product_id, 0)) < quantity:
+                    errors[index]['quantity'] = [
+                        f'Stock insuficiente para "{product.name}". '
+                        f'Disponible: {available_for(product, reserved.get(product_id, 0))}, solicitado: {quantity}'
+                    ]
+            if any(errors):
+                raise serializers.ValidationError({'operations': errors})
+
+        check_stock(last_operation)
+
+        reserve = reservations_enabled()
+        if reserve:
+            # Retener la diferencia entre la cantidad final y lo ya retenido (todo o nada)
+            deltas = {product_id: quantities[product_id] - reserved.get(product_id, 0) for product_id in last_operation}
+            try:
+                reserve_stock({product_id: delta for product_id, delta in deltas.items() if delta > 0})
+            except InsufficientStock as error:
+                # Otro carrito retuvo stock desde la lectura: releer esos productos
+                products.update(Product.objects.filter(id__in=error.product_ids).only(
+                    'id', 'name', 'stock', 'stock_shards', 'reserved_stock'
+                ).with_live_stock().in_bulk())
+                check_stock(error.product_ids)
+                for product_id in error.product_ids:
+                    errors[last_operation[product_id]]['quantity'] = ['Stock insuficiente.']
+                raise serializers.ValidationError({'operations': errors})
+            release_stock({product_id: -delta for product_id, delta in deltas.items() if delta < 0})
 
+        removed, created, updated = [], [], []
+        now = timezone.now()
+        expiry = reservation_expiry() if reserve else None
+        for product_id in last_operation:
+            quantity, item = quantities[product_id], items.get(product_id)
+            if quantity == 0:
+                if item is not None:
+                    removed.append(item.pk)
+            elif item is None:
+                created.append(CartItem(
+                    cart=cart, product_id=product_id, quantity=quantity,
+                    reserved_quantity=quantity if reserve else 0, reserved_until=expiry,
+                ))
+            elif item.quantity != quantity or reserve:
+                item.quantity, item.updated_at = quantity, now
+                if reserve:
+                    item.reserved_quantity, item.reserved_until = quantity, expiry
+                updated.append(item)
+        if removed:
+            CartItem.objects.filter(pk__in=removed).delete()
+        if created:
+            try:
+                CartItem.objects.bulk_create(created)
+            except IntegrityError as error:
+                raise CartChanged() from error
+        if updated:
+            fields = ['quantity', 'updated_at'] + (['reserved_quantity', 'reserved_until'] if reserve else [])
+            CartItem.objects.bulk_update(updated, fields)
+        if removed or created or updated:
+            Cart.objects.filter(pk=cart.pk).touch()
+        # Para la respuesta ?view=delta
+        self.changed_ids = [item.pk for item in created + updated]
+        self.removed_ids = removed
+        return cart
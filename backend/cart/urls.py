@@ -4,7 +4,8 @@ from .views import (
     add_to_cart,
     update_cart_item,
     remove_from_cart,
-    clear_cart
+    clear_cart,
+    cart_batch
 )
 
 urlpatterns = [
@@ -13,6 +14,7 @@ urlpatterns = [
     path('items/<int:item_id>/', update_cart_item, name='update_cart_item'),
     path('items/<int:item_id>/remove/', remove_from_cart, name='remove_from_cart'),
     path('clear/', clear_cart, name='clear_cart'),
+    path('batch/', cart_batch, name='cart_batch'),
 ]
 
 
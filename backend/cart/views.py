@@ -2,10 +2,29 @@ from rest_framework import generics, status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from django.db import transaction
 from django.shortcuts import get_object_or_404
 from products.models import Product
 from .models import Cart, CartItem
-from .serializers import CartSerializer, CartItemSerializer
+from .reservations import (
+    InsufficientStock,
+    available_for,
+    hold_item,
+    release_items,
+    reservation_atomic,
+    reservations_enabled,
+)
+from .serializers import (
+    CartSerializer,
+    CartItemSerializer,
+    CartBatchSerializer,
+    CartChanged,
+    CartItemDeltaSerializer,
+    CartTotalsSerializer,
+)
+
+# ?view=delta en las mutaciones: solo los items cambiados, los totales y la versión
+DELTA_VIEW = 'delta'
 
 
 class CartDetailView(generics.RetrieveAPIView):
@@ -14,66 +33,112 @@ class CartDetailView(generics.RetrieveAPIView):
     permission_classes = [IsAuthenticated]
 
     def get_object(self):
-        cart, _ = Cart.objects.get_or_create(user=self.request.user)
+        # Los items solo se precargan si la respuesta los incluye (?fields= / ?omit=)
+        queryset = self.get_serializer().prepare_queryset(Cart.objects.all())
+        cart, _ = queryset.get_or_create(user=self.request.user)
         return cart
 
 
+def parse_quantity(value):
+    """Cantidad entera mayor a 0 (None si es inválida)"""
+    try:
+        quantity = int(value)
+    except (ValueError, TypeError):
+        return None
+    return quantity if quantity > 0 else None
+
+
+def wants_delta(request):
+    return request.query_params.get('view') == DELTA_VIEW
+
+
+def cart_delta_response(user, item_ids=(), removed_ids=(), status_code=status.HTTP_200_OK):
+    """Respuesta compacta de una mutación: items cambiados, ids eliminados y totales con la versión"""
+    cart, _ = Cart.objects.with_totals().get_or_create(user=user)
+    items = []
+    if item_ids:
+        items = CartItem.objects.filter(pk__in=item_ids).select_related('product').only(
+            'id', 'product_id', 'quantity', 'reserved_quantity', 'product__final_price'
+        )
+    return Response({
+        'cart': CartTotalsSerializer(cart).data,
+        'items': CartItemDeltaSerializer(items, many=True).data,
+        'removed': list(removed_ids),
+    }, status=status_code)
+
+
+def cart_item_response(request, item_id, status_code=status.HTTP_200_OK):
+    Cart.objects.filter(user=request.user).touch()
+    if wants_delta(request):
+        return cart_delta_response(request.user, item_ids=[item_id], status_code=status_code)
+    cart_item = CartItem.objects.select_related('product__category', 'product__seller').get(pk=item_id)
+    return Response(CartItemSerializer(cart_item).data, status=status_code)
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def add_to_cart(request):
     """Añadir producto al carrito"""
-    cart, _ = Cart.objects.get_or_create(user=request.user)
     product_id = request.data.get('product_id')
-    quantity = int(request.data.get('quantity', 1))
+    quantity = parse_quantity(request.data.get('quantity', 1))
 
     if not product_id:
         return Response(
             {'error': 'product_id es requerido'},
             status=status.HTTP_400_BAD_REQUEST
         )
-
     try:
-        product = Product.objects.get(id=product_id, is_active=True)
-    except Product.DoesNotExist:
+        product_id = int(product_id)
+    except (ValueError, TypeError):
         return Response(
             {'error': 'Producto no encontrado'},
             status=status.HTTP_404_NOT_FOUND
         )
-
-    # Validar stock
-    if not product.is_available(quantity):
+    if quantity is None:
         return Response(
-            {'error': f'Stock insuficiente. Disponible: {product.stock}'},
+            {'error': 'La cantidad debe ser un número mayor a 0'},
             status=status.HTTP_400_BAD_REQUEST
         )
 
-    # Obtener o crear el item del carrito
-    cart_item, created = CartItem.objects.get_or_create(
-        cart=cart,
-        product=product,
-        defaults={'quantity': quantity}
-    )
-
-    if not created:
-        # Si ya existe, actualizar cantidad
-        new_quantity = cart_item.quantity + quantity
-        if not product.is_available(new_quantity):
+    # Camino habitual: una sola sentencia (upsert con incremento y validación de stock)
+    try:
+        with reservation_atomic():
+            result = CartItem.objects.add_quantity(request.user, product_id, quantity)
+            if result is None:
+                _, cart_created = Cart.objects.get_or_create(user=request.user)
+                if cart_created:
+                    result = CartItem.objects.add_quantity(request.user, product_id, quantity)
+            if result is not None and reservations_enabled():
+                hold_item(result[0])
+    except InsufficientStock:
+        result = None
+
+    if result is None:
+        # No se aplicó: averiguar por qué solo en este caso
+        product = Product.objects.filter(id=product_id, is_active=True).only(
+            'stock', 'stock_shards', 'reserved_stock'
+        ).with_live_stock().first()
+        if product is None:
             return Response(
-                {'error': f'Stock insuficiente. Disponible: {product.stock}, solicitado: {new_quantity}'},
-                status=status.HTTP_400_BAD_REQUEST
+                {'error': 'Producto no encontrado'},
+                status=status.HTTP_404_NOT_FOUND
             )
-        cart_item.quantity = new_quantity
-        cart_item.save()
+        in_cart, reserved = CartItem.objects.filter(
+            cart__user=request.user, product_id=product_id
+        ).values_list('quantity', 'reserved_quantity').first() or (0, 0)
+        return Response(
+            {'error': f'Stock insuficiente. Disponible: {available_for(product, reserved)}, solicitado: {in_cart + quantity}'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
 
-    serializer = CartItemSerializer(cart_item)
-    return Response(serializer.data, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+    item_id, _, created = result
+    return cart_item_response(request, item_id, status.HTTP_201_CREATED if created else status.HTTP_200_OK)
 
 
 @api_view(['PUT', 'PATCH'])
 @permission_classes([IsAuthenticated])
 def update_cart_item(request, item_id):
     """Actualizar cantidad de un item del carrito"""
-    cart_item = get_object_or_404(CartItem, id=item_id, cart__user=request.user)
     quantity = request.data.get('quantity')
 
     if quantity is None:
@@ -82,39 +147,48 @@ def update_cart_item(request, item_id):
             status=status.HTTP_400_BAD_REQUEST
         )
 
-    try:
-        quantity = int(quantity)
-        if quantity <= 0:
-            return Response(
-                {'error': 'La cantidad debe ser mayor a 0'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-    except (ValueError, TypeError):
+    quantity = parse_quantity(quantity)
+    if quantity is None:
         return Response(
-            {'error': 'quantity debe ser un número válido'},
+            {'error': 'La cantidad debe ser un número mayor a 0'},
             status=status.HTTP_400_BAD_REQUEST
         )
 
-    # Validar stock
-    if not cart_item.product.is_available(quantity):
+    # UPDATE con la validación de stock en el WHERE; si no aplica, explicar por qué
+    try:
+        with reservation_atomic():
+            updated = CartItem.objects.set_quantity(request.user, item_id, quantity)
+            if updated and reservations_enabled():
+                hold_item(item_id)
+    except InsufficientStock:
+        updated = 0
+    if not updated:
+        cart_item = get_object_or_404(CartItem.objects.select_related('product'), id=item_id, cart__user=request.user)
         return Response(
-            {'error': f'Stock insuficiente. Disponible: {cart_item.product.stock}'},
+            {'error': f'Stock insuficiente. Disponible: {available_for(cart_item.product, cart_item.reserved_quantity)}'},
             status=status.HTTP_400_BAD_REQUEST
         )
 
-    cart_item.quantity = quantity
-    cart_item.save()
-
-    serializer = CartItemSerializer(cart_item)
-    return Response(serializer.data)
+    return cart_item_response(request, item_id)
 
 
 @api_view(['DELETE'])
 @permission_classes([IsAuthenticated])
 def remove_from_cart(request, item_id):
     """Eliminar item del carrito"""
-    cart_item = get_object_or_404(CartItem, id=item_id, cart__user=request.user)
-    cart_item.delete()
+    items = CartItem.objects.filter(id=item_id, cart__user=request.user)
+    with reservation_atomic():
+        if reservations_enabled():
+            release_items(items)
+        deleted, _ = items.delete()
+    if not deleted:
+        return Response(
+            {'error': 'Item no encontrado'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    Cart.objects.filter(user=request.user).touch()
+    if wants_delta(request):
+        return cart_delta_response(request.user, removed_ids=[item_id])
     return Response(status=status.HTTP_204_NO_CONTENT)
 
 
@@ -122,10 +196,44 @@ def remove_from_cart(request, item_id):
 @permission_classes([IsAuthenticated])
 def clear_cart(request):
     """Vaciar el carrito"""
-    cart, _ = Cart.objects.get_or_create(user=request.user)
-    cart.items.all().delete()
+    removed_ids = list(CartItem.objects.filter(cart__user=request.user).values_list('id', flat=True))
+    if removed_ids:
+        items = CartItem.objects.filter(pk__in=removed_ids)
+        with reservation_atomic():
+            if reservations_enabled():
+                release_items(items)
+            items.delete()
+        Cart.objects.filter(user=request.user).touch()
+    if wants_delta(request):
+        return cart_delta_response(request.user, removed_ids=removed_ids)
     return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-
-
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def cart_batch(request):
+    """Aplicar varias operaciones (add, set, remove) y devolver el carrito actualizado"""
+    # Se acepta la lista de operaciones directamente o dentro de {"operations": [...]}
+    data = {'operations': request.data} if isinstance(request.data, list) else request.data
+    serializer = CartBatchSerializer(data=data, context={'request': request})
+    serializer.is_valid(raise_exception=True)
+    for attempt in range(2):
+        try:
+            with transaction.atomic():
+                cart = serializer.save()
+            break
+        except CartChanged:
+            # Otra petición insertó el mismo item: se repite una vez con el carrito actualizado
+            if attempt:
+                response = Response(
+                    {'error': 'El carrito cambió durante la operación. Intente nuevamente.'},
+                    status=status.HTTP_409_CONFLICT
+                )
+                response['Retry-After'] = '1'
+                return response
+
+    if wants_delta(request):
+        return cart_delta_response(request.user, serializer.changed_ids, serializer.removed_ids)
+    context = {'request': request}
+    queryset = CartSerializer(context=context).prepare_queryset(Cart.objects.filter(pk=cart.pk))
+    return Response(CartSerializer(queryset.get(), context=context).data)
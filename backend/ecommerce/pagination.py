@@ -0,0 +1,175 @@
+"""
+Paginación del API.
+
+``HybridPagination`` mantiene la paginación por número de página para los
+clientes existentes y activa la paginación por cursor (keyset) cuando se
+pide con ``?cursor=<token>`` o ``?pagination=cursor``. El modo cursor no
+ejecuta COUNT(*) ni OFFSET: filtra por los valores de la última fila vista
+según el orden del queryset, con ``id`` como desempate.
+"""
+import base64
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Paginación por cursor opaco sobre el orden del queryset más ``id``"""
+
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    invalid_cursor_message = 'Cursor inválido'
+
+    def __init__(self, page_size):
+        self.page_size = page_size
+
+    @staticmethod
+    def get_ordering(queryset):
+        """
+        Devuelve [(campo, descendente)] si el orden del queryset admite keyset,
+        o None si incluye expresiones, relaciones o columnas que aceptan NULL.
+        """
+        order_by = list(queryset.query.order_by) or list(queryset.model._meta.ordering)
+        ordering = []
+        for item in order_by:
+            if not isinstance(item, str):
+                return None
+            descending = item.startswith('-')
+            name = item.lstrip('-')
+            if name == 'pk':
+                name = queryset.model._meta.pk.name
+            try:
+                field = queryset.model._meta.get_field(name)
+            except FieldDoesNotExist:
+                return None
+            if field.is_relation or field.null:
+                return None
+            ordering.append((field.attname, descending))
+
+        pk_name = queryset.model._meta.pk.attname
+        if pk_name not in [name for name, _ in ordering]:
+            # Desempate con la misma dirección que el primer campo
+            ordering.append((pk_name, ordering[0][1] if ordering else False))
+        return ordering
+
+    @classmethod
+    def supports(cls, queryset):
+        return cls.get_ordering(queryset) is not None
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def encode_cursor(self, values, reverse):
+        payload = json.dumps({'v': values, 'r': reverse}, separators=(',', ':'), default=str)
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None, False
+        try:
+            padded = token + '=' * (-len(token) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+            values, reverse = payload['v'], bool(payload['r'])
+        except (ValueError, KeyError, TypeError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return values, reverse
+
+    def keyset_filter(self, values, reverse):
+        """Q equivalente a (f1, f2, ..., id) > (v1, v2, ..., vid) según el orden"""
+        condition = Q()
+        equal = Q()
+        for (name, descending), value in zip(self.ordering, values):
+            after = descending != reverse
+            condition |= equal & Q(**{f'{name}__{"lt" if after else "gt"}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.ordering = self.get_ordering(queryset)
+        self.page_size = self.get_page_size(request)
+        values, reverse = self.decode_cursor(request)
+
+        order_by = [('-' if descending != reverse else '') + name for name, descending in self.ordering]
+        queryset = queryset.order_by(*order_by)
+        if values is not None:
+            try:
+                queryset = queryset.filter(self.keyset_filter(values, reverse))
+            except (ValueError, TypeError):
+                raise NotFound(self.invalid_cursor_message)
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        self.has_next = has_more if not reverse else values is not None
+        self.has_previous = values is not None if not reverse else has_more
+        self.first_row = rows[0] if rows else None
+        self.last_row = rows[-1] if rows else None
+        return rows
+
+    def row_values(self, row):
+        return [getattr(row, name) for name, _ in self.ordering]
+
+    def build_link(self, row, reverse):
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, 'page')
+        cursor = self.encode_cursor(self.row_values(row), reverse)
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_next_link(self):
+        if not self.has_next or self.last_row is None:
+            return None
+        return self.build_link(self.last_row, reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or self.first_row is None:
+            return None
+        return self.build_link(self.first_row, reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+
+class HybridPagination(PageNumberPagination):
+    """Paginación por página por defecto; por cursor cuando el cliente lo pide"""
+
+    mode_query_param = 'pagination'
+
+    def wants_cursor(self, request):
+        return (
+            KeysetPagination.cursor_query_param in request.query_params
+            or request.query_params.get(self.mode_query_param) == 'cursor'
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if self.wants_cursor(request) and KeysetPagination.supports(queryset):
+            self.keyset = KeysetPagination(self.get_page_size(request))
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
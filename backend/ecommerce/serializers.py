@@ -0,0 +1,92 @@
+"""
+Campos a pedido (sparse fieldsets) para los serializers del API.
+
+- ``?fields=id,name,price``: solo esos campos.
+- ``?omit=description,category``: todos menos esos.
+- Rutas con punto para serializers anidados: ``?fields=items.product.name``,
+  ``?omit=items.product.description``.
+- ``Meta.fieldsets`` define representaciones con nombre (p. ej. ``card``) que
+  se piden con ``?view=card``; una vista puede usar una por defecto pasando
+  ``fieldset`` en el contexto, y ``?view=full`` la desactiva.
+
+Solo afecta la salida: los campos de escritura se validan igual. Los campos
+que no se emiten no se evalúan, y ``prepare_queryset`` permite a cada
+serializer quitar los JOIN/prefetch que solo necesitaban esos campos.
+"""
+from rest_framework import serializers
+
+FIELDS_PARAM = 'fields'
+OMIT_PARAM = 'omit'
+VIEW_PARAM = 'view'
+FULL_VIEW = 'full'
+
+
+def parse_paths(value):
+    """'a,b.c,b.d' -> {'a': {}, 'b': {'c': {}, 'd': {}}}"""
+    tree = {}
+    for path in (value or '').split(','):
+        node = tree
+        for part in path.strip().split('.'):
+            if not part:
+                break
+            node = node.setdefault(part, {})
+    return tree
+
+
+class SparseFieldsetMixin:
+    """Permite elegir los campos de la respuesta (ver módulo)"""
+
+    def get_field_spec(self):
+        """(campos a incluir o None para todos, árbol de campos omitidos) de este nivel"""
+        spec = getattr(self, '_field_spec', None)
+        if spec is not None:
+            return spec
+        if not self.is_root():
+            return None, {}
+
+        request = self.context.get('request')
+        params = getattr(request, 'query_params', {})
+        include = parse_paths(params.get(FIELDS_PARAM)) or None
+        if include is None:
+            fieldset = params.get(VIEW_PARAM) or self.context.get('fieldset')
+            names = getattr(getattr(self, 'Meta', None), 'fieldsets', {}).get(fieldset)
+            if names and fieldset != FULL_VIEW:
+                include = {name: {} for name in names}
+        self._field_spec = include, parse_paths(params.get(OMIT_PARAM))
+        return self._field_spec
+
+    def is_root(self):
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        return parent is None
+
+    def wants(self, path):
+        """Si la respuesta incluye el campo ``path`` (con puntos para anidados)"""
+        include, omit = self.get_field_spec()
+        for part in path.split('.'):
+            if include is not None and part not in include:
+                return False
+            if part in omit and not omit[part]:
+                return False
+            include = include.get(part) or None if include is not None else None
+            omit = omit.get(part, {})
+        return True
+
+    def prepare_queryset(self, queryset):
+        """Ajustar select_related/prefetch/defer a los campos pedidos"""
+        return queryset
+
+    @property
+    def _readable_fields(self):
+        include, omit = self.get_field_spec()
+        for field in super()._readable_fields:
+            name = field.field_name
+            if include is not None and name not in include:
+                continue
+            if name in omit and not omit[name]:
+                continue
+            nested = field.child if isinstance(field, serializers.ListSerializer) else field
+            if isinstance(nested, SparseFieldsetMixin):
+                nested._field_spec = (include.get(name) or None) if include is not None else None, omit.get(name, {})
+            yield field
@@ -10,7 +10,8 @@ except ImportError:
 
 from pathlib import Path
 from datetime import timedelta
-from decouple import config
+from decouple import config, Csv
+from corsheaders.defaults import default_headers
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -149,6 +150,42 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Búsqueda de productos (FTS5 en SQLite, LIKE en otras bases de datos)
+PRODUCT_SEARCH_BACKEND = config('PRODUCT_SEARCH_BACKEND', default='products.search.SQLiteFTS5Backend')
+
+# Límites de los rangos de precio de ?facets=price: [0, 25), [25, 50), ..., [500, ∞)
+PRODUCT_PRICE_BUCKETS = config('PRODUCT_PRICE_BUCKETS', default='25,50,100,250,500', cast=Csv(int))
+
+# Caché compartida por todos los procesos: la del catálogo se invalida cambiando
+# versiones, y con una caché por proceso (LocMemCache) solo se enteraría el worker
+# que escribió. Por defecto en la base de datos (python manage.py createcachetable);
+# en producción, Redis: CACHE_BACKEND=django.core.cache.backends.redis.RedisCache
+# y CACHE_LOCATION=redis://host:6379/1 (requiere el paquete redis)
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.db.DatabaseCache'),
+        'LOCATION': config('CACHE_LOCATION', default='django_cache'),
+    }
+}
+
+# Caché de respuestas del catálogo (segundos; 0 desactiva la caché del endpoint)
+CATALOG_CACHE_TIMEOUTS = {
+    'featured': config('CACHE_TTL_FEATURED', default=300, cast=int),
+    'recommended': config('CACHE_TTL_RECOMMENDED', default=600, cast=int),
+    'similar': config('CACHE_TTL_SIMILAR', default=600, cast=int),
+    'categories': config('CACHE_TTL_CATEGORIES', default=3600, cast=int),
+}
+
+# Reservas de stock al agregar al carrito (ver cart.reservations); TTL en segundos
+CART_RESERVATIONS = config('CART_RESERVATIONS', default=False, cast=bool)
+CART_RESERVATION_TTL = config('CART_RESERVATION_TTL', default=900, cast=int)
+
+# Claves de idempotencia (header Idempotency-Key) de las compras y pagos, en segundos:
+# cuánto se guarda la respuesta, y cuánto espera un duplicado a que termine la primera petición
+IDEMPOTENCY_KEY_TTL = config('IDEMPOTENCY_KEY_TTL', default=86400, cast=int)
+IDEMPOTENCY_WAIT = config('IDEMPOTENCY_WAIT', default=10, cast=int)
+IDEMPOTENCY_LOCK_TIMEOUT = config('IDEMPOTENCY_LOCK_TIMEOUT', default=120, cast=int)
+
 # JWT Settings
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(hours=1),
@@ -163,10 +200,27 @@ CORS_ALLOWED_ORIGINS = [
 ]
 
 CORS_ALLOW_CREDENTIALS = True
+CORS_ALLOW_HEADERS = (*default_headers, 'idempotency-key')
 
 # Stripe Settings
 STRIPE_SECRET_KEY = config('STRIPE_SECRET_KEY', default='')
 STRIPE_PUBLISHABLE_KEY = config('STRIPE_PUBLISHABLE_KEY', default='')
+# Secreto de firma del endpoint de webhooks (Dashboard de Stripe > Webhooks)
+STRIPE_WEBHOOK_SECRET = config('STRIPE_WEBHOOK_SECRET', default='')
+
+# Pasarela de pago (ver purchases.payments): purchases.payments.FakeGateway para pruebas sin red
+PAYMENT_GATEWAY = config('PAYMENT_GATEWAY', default='purchases.payments.StripeGateway')
+# Timeouts en segundos (conexión y respuesta), conexiones por proceso y reintentos de red
+PAYMENT_CONNECT_TIMEOUT = config('PAYMENT_CONNECT_TIMEOUT', default=3, cast=float)
+PAYMENT_TIMEOUT = config('PAYMENT_TIMEOUT', default=10, cast=float)
+PAYMENT_POOL_SIZE = config('PAYMENT_POOL_SIZE', default=10, cast=int)
+PAYMENT_MAX_RETRIES = config('PAYMENT_MAX_RETRIES', default=1, cast=int)
+# Circuit breaker: fallas seguidas para abrirlo y segundos hasta probar de nuevo
+PAYMENT_BREAKER_THRESHOLD = config('PAYMENT_BREAKER_THRESHOLD', default=5, cast=int)
+PAYMENT_BREAKER_RESET = config('PAYMENT_BREAKER_RESET', default=30, cast=int)
+# Demora simulada de FakeGateway en segundos, y secreto con el que firma sus webhooks
+PAYMENT_FAKE_LATENCY = config('PAYMENT_FAKE_LATENCY', default=0, cast=float)
+PAYMENT_FAKE_WEBHOOK_SECRET = config('PAYMENT_FAKE_WEBHOOK_SECRET', default='whsec_fake')
 
 # Debug: Verificar que Stripe se cargue correctamente
 if not STRIPE_SECRET_KEY or STRIPE_SECRET_KEY == '':
@@ -1,6 +1,7 @@
 from django.contrib import admin
+from django.db.models import Count
 from django.utils.html import format_html
-from .models import Product, Category
+from .models import Product, Category, ProductRecommendation, StockShard
 
 
 @admin.register(Category)
@@ -9,21 +10,41 @@ class CategoryAdmin(admin.ModelAdmin):
     prepopulated_fields = {'slug': ('name',)}
     search_fields = ('name', 'description')
     list_filter = ('created_at',)
-    readonly_fields = ('created_at', 'updated_at')
-    
+    readonly_fields = ('created_at', 'updated_at', 'active_products_count')
+
+    def get_queryset(self, request):
+        # Contar los productos en la misma consulta del listado
+        return super().get_queryset(request).annotate(products_total=Count('products'))
+
     def products_count(self, obj):
-        return obj.products.count()
+        return obj.products_total
     products_count.short_description = 'Productos'
+    products_count.admin_order_field = 'products_total'
+
+
+class StockShardInline(admin.TabularInline):
+    """Contadores de stock (solo lectura: se reparten con el comando shard_stock)"""
+    model = StockShard
+    extra = 0
+    can_delete = False
+    readonly_fields = ('shard', 'quantity')
+
+    def has_add_permission(self, request, obj=None):
+        return False
 
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
-    list_display = ('name', 'category', 'price_display', 'stock', 'is_featured', 'is_active', 'created_at')
+    list_display = ('name', 'category', 'price_display', 'stock', 'reserved_stock', 'is_featured', 'is_active', 'created_at')
     list_filter = ('category', 'is_featured', 'is_active', 'created_at')
     search_fields = ('name', 'description', 'slug')
     prepopulated_fields = {'slug': ('name',)}
     list_editable = ('is_featured', 'is_active', 'stock')
-    readonly_fields = ('created_at', 'updated_at', 'final_price_display', 'discount_percentage_display')
+    readonly_fields = (
+        'created_at', 'updated_at', 'final_price_display', 'discount_percentage_display', 'reserved_stock',
+        'stock_shards',
+    )
+    inlines = [StockShardInline]
     
     fieldsets = (
         ('Información Básica', {
@@ -33,7 +54,7 @@ class ProductAdmin(admin.ModelAdmin):
             'fields': ('price', 'discount_price', 'final_price_display', 'discount_percentage_display')
         }),
         ('Inventario', {
-            'fields': ('stock', 'is_active')
+            'fields': ('stock', 'reserved_stock', 'stock_shards', 'is_active')
         }),
         ('Marketing', {
             'fields': ('is_featured', 'image_url')
@@ -56,6 +77,7 @@ class ProductAdmin(admin.ModelAdmin):
             )
         return f'${obj.price}'
     price_display.short_description = 'Precio'
+    price_display.admin_order_field = 'final_price'
     
     def final_price_display(self, obj):
         return f'${obj.final_price}'
@@ -67,3 +89,12 @@ class ProductAdmin(admin.ModelAdmin):
         return 'Sin descuento'
     discount_percentage_display.short_description = 'Descuento'
 
+
+@admin.register(ProductRecommendation)
+class ProductRecommendationAdmin(admin.ModelAdmin):
+    list_display = ('product', 'rank', 'recommended', 'kind', 'score', 'computed_at')
+    list_filter = ('kind',)
+    search_fields = ('product__name', 'recommended__name')
+    list_select_related = ('product', 'recommended')
+    raw_id_fields = ('product', 'recommended')
+    readonly_fields = ('computed_at',)
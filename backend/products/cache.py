@@ -0,0 +1,110 @@
+"""
+Caché de respuestas del catálogo con claves versionadas por modelo.
+
+Cada endpoint declara de qué modelos depende; la clave incluye la versión
+actual de cada uno. Al guardar/borrar (o actualizar en bloque) productos o
+categorías se incrementa su versión, de modo que las entradas viejas dejan
+de usarse sin tener que borrarlas una por una.
+
+Versiones y estadísticas viven en la caché ``default``, que tiene que ser
+compartida entre procesos (CACHES en settings; el check products.W001
+avisa si es local).
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+DEFAULT_TIMEOUTS = {
+    'featured': 300,
+    'recommended': 600,
+    'similar': 600,
+    'categories': 3600,
+}
+
+
+def get_timeout(namespace):
+    timeouts = getattr(settings, 'CATALOG_CACHE_TIMEOUTS', {})
+    return timeouts.get(namespace, DEFAULT_TIMEOUTS.get(namespace, 300))
+
+
+def version_key(model_name):
+    return f'catalog:version:{model_name}'
+
+
+def get_versions(model_names):
+    keys = [version_key(name) for name in model_names]
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    for key in missing:
+        cache.add(key, 1, timeout=None)
+        versions[key] = cache.get(key, 1)
+    return [versions[key] for key in keys]
+
+
+def bump_version(*model_names):
+    """Invalidar las respuestas que dependen de estos modelos (al confirmar la transacción)"""
+    def bump():
+        for name in model_names:
+            key = version_key(name)
+            cache.add(key, 1, timeout=None)
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.set(key, 2, timeout=None)
+    transaction.on_commit(bump)
+
+
+def record(namespace, outcome):
+    key = f'catalog:stats:{namespace}:{outcome}'
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        pass
+
+
+def cached_data(namespace, request, depends_on, build):
+    """
+    Devolver los datos serializados de la caché o construirlos con ``build()``.
+
+    La clave combina el namespace, las versiones de ``depends_on`` y la ruta
+    completa de la petición (incluida la query string).
+    """
+    timeout = get_timeout(namespace)
+    if not timeout:
+        return build()
+
+    versions = '.'.join(str(version) for version in get_versions(depends_on))
+    path_hash = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    key = f'catalog:{namespace}:{versions}:{path_hash}'
+
+    data = cache.get(key)
+    if data is not None:
+        record(namespace, 'hits')
+        return data
+
+    record(namespace, 'misses')
+    data = build()
+    cache.set(key, data, timeout)
+    return data
+
+
+def cache_stats():
+    """Aciertos y fallos por namespace"""
+    namespaces = set(DEFAULT_TIMEOUTS) | set(getattr(settings, 'CATALOG_CACHE_TIMEOUTS', {}))
+    keys = [f'catalog:stats:{ns}:{outcome}' for ns in sorted(namespaces) for outcome in ('hits', 'misses')]
+    values = cache.get_many(keys)
+    stats = {}
+    for namespace in sorted(namespaces):
+        hits = values.get(f'catalog:stats:{namespace}:hits', 0)
+        misses = values.get(f'catalog:stats:{namespace}:misses', 0)
+        total = hits + misses
+        stats[namespace] = {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / total, 3) if total else None,
+            'timeout': get_timeout(namespace),
+        }
+    return stats
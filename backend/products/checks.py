@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.core.checks import Warning, register, Tags
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """La caché del catálogo debe ser compartida entre procesos (ver products.cache)"""
+    backend = settings.CACHES.get('default', {}).get('BACKEND', '')
+    if backend.endswith(('LocMemCache', 'DummyCache')):
+        return [Warning(
+            f'CACHES["default"] usa {backend.rsplit(".", 1)[-1]}, que no se comparte entre procesos: '
+            'con varios workers, invalidar la caché del catálogo solo afecta al que escribió '
+            'y las estadísticas de cache-stats son de un solo proceso.',
+            hint='Configurar CACHE_BACKEND con DatabaseCache o RedisCache.',
+            id='products.W001',
+        )]
+    return []
@@ -0,0 +1,63 @@
+"""
+Soporte de GET condicional (ETag / Last-Modified) para el catálogo.
+
+Las huellas se calculan con una consulta indexada sobre ``updated_at`` sin
+serializar nada; si el cliente ya tiene la versión actual se responde 304.
+"""
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+
+def make_etag(*parts):
+    raw = ':'.join(str(part) for part in parts)
+    return quote_etag(hashlib.md5(raw.encode()).hexdigest())
+
+
+def latest(*values):
+    values = [value for value in values if value is not None]
+    return max(values) if values else None
+
+
+def product_fingerprint(queryset, **lookup):
+    """(etag, last_modified) de un producto, o None si no existe"""
+    row = queryset.filter(**lookup).order_by().values_list(
+        'id', 'updated_at', 'category__updated_at'
+    ).first()
+    if row is None:
+        return None
+    product_id, updated_at, category_updated_at = row
+    return make_etag(product_id, updated_at, category_updated_at), latest(updated_at, category_updated_at)
+
+
+def list_fingerprint(request, queryset):
+    """(etag, last_modified) de un listado: max(updated_at) + cantidad + query string"""
+    summary = queryset.order_by().aggregate(
+        last=Max('updated_at'), category_last=Max('category__updated_at'), total=Count('id')
+    )
+    return (
+        make_etag(request.get_full_path(), summary['last'], summary['category_last'], summary['total']),
+        latest(summary['last'], summary['category_last']),
+    )
+
+
+def conditional_response(request, fingerprint, build):
+    """Responder 304 si el cliente tiene la versión actual; si no, construir la respuesta"""
+    if fingerprint is None:
+        return build()
+    etag, last_modified = fingerprint
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is None:
+        response = build()
+        if response.status_code != 200:
+            return response
+    response['ETag'] = etag
+    if timestamp is not None:
+        response['Last-Modified'] = http_date(timestamp)
+    # El navegador siempre revalida, pero puede reutilizar el cuerpo con un 304
+    patch_cache_control(response, no_cache=True)
+    return response
@@ -0,0 +1,127 @@
+"""
+Conteos por faceta para el listado de productos (?facets=category,price,in_stock).
+
+Cada faceta se cuenta sobre los resultados filtrados por todo lo demás
+(búsqueda, categoría, precio, stock) salvo su propio filtro, para que el
+cliente vea cuántos productos obtendría al cambiarlo. Los conteos salen de
+consultas agregadas: un GROUP BY para las categorías y COUNT(...) FILTER
+para los rangos de precio y el stock, combinados en una sola consulta
+cuando comparten la misma base. El costo es de 1 a 3 consultas sin importar
+cuántas categorías o rangos haya.
+"""
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db.models import Count, Q
+from .models import in_stock_condition
+
+FACETS = ('category', 'price', 'in_stock')
+
+# Límites de los rangos de precio: [0, 25), [25, 50), ..., [500, ∞)
+DEFAULT_PRICE_BUCKETS = [25, 50, 100, 250, 500]
+MAX_PRICE_BUCKETS = 20
+
+# Parámetros de filtro que cada faceta ignora al contarse
+FACET_FILTERS = {
+    'category': ('category',),
+    'price': ('min_price', 'max_price'),
+    'in_stock': ('in_stock',),
+}
+
+
+def parse_facets(value):
+    """Facetas pedidas, en orden y sin repetir (las desconocidas se ignoran)"""
+    requested = [name.strip() for name in (value or '').split(',')]
+    return [name for name in FACETS if name in requested]
+
+
+def price_bounds(value=None):
+    """Límites de los rangos de precio: ``?price_buckets=10,50,100`` o PRODUCT_PRICE_BUCKETS"""
+    bounds = getattr(settings, 'PRODUCT_PRICE_BUCKETS', DEFAULT_PRICE_BUCKETS)
+    if value:
+        try:
+            bounds = [Decimal(bound.strip()) for bound in value.split(',') if bound.strip()]
+        except InvalidOperation:
+            pass
+    bounds = {Decimal(str(bound)) for bound in bounds}
+    return sorted(bound for bound in bounds if bound.is_finite() and bound > 0)[:MAX_PRICE_BUCKETS]
+
+
+def format_price(value):
+    return None if value is None else f'{value.normalize():f}'
+
+
+def price_ranges(bounds):
+    """[(clave, mínimo, máximo)] con máximo None en el último rango"""
+    edges = [Decimal('0')] + list(bounds)
+    ranges = []
+    for index, low in enumerate(edges):
+        high = edges[index + 1] if index + 1 < len(edges) else None
+        ranges.append((f'{format_price(low)}-{format_price(high) or ""}', low, high))
+    return ranges
+
+
+def price_aggregates(ranges):
+    aggregates = {}
+    for index, (_, low, high) in enumerate(ranges):
+        condition = Q(final_price__gte=low)
+        if high is not None:
+            condition &= Q(final_price__lt=high)
+        aggregates[f'price_{index}'] = Count('id', filter=condition)
+    return aggregates
+
+
+def stock_aggregates():
+    return {
+        'in_stock_true': Count('id', filter=in_stock_condition()),
+        'in_stock_false': Count('id', filter=~in_stock_condition()),
+    }
+
+
+def category_counts(queryset):
+    rows = (
+        queryset.order_by().values('category__slug', 'category__name')
+        .annotate(count=Count('id')).order_by('-count', 'category__name')
+    )
+    return [
+        {'slug': row['category__slug'], 'name': row['category__name'], 'count': row['count']}
+        for row in rows if row['category__slug'] is not None
+    ]
+
+
+def compute_facets(names, base_queryset, active_filters, bounds):
+    """
+    Calcular las facetas ``names``.
+
+    ``base_queryset(facet)`` devuelve los resultados filtrados sin el filtro
+    de esa faceta; ``active_filters`` son los parámetros de filtro presentes
+    en la petición. Las facetas cuyo filtro no está activo comparten la base
+    completa (``facet=None``) y se agregan en la misma consulta.
+    """
+    facets = {}
+    ranges = price_ranges(bounds)
+
+    def own_base(name):
+        return name if any(param in active_filters for param in FACET_FILTERS[name]) else None
+
+    if 'category' in names:
+        facets['category'] = category_counts(base_queryset(own_base('category')))
+
+    groups = {}
+    if 'price' in names:
+        groups.setdefault(own_base('price'), {}).update(price_aggregates(ranges))
+    if 'in_stock' in names:
+        groups.setdefault(own_base('in_stock'), {}).update(stock_aggregates())
+
+    counts = {}
+    for base, aggregates in groups.items():
+        counts.update(base_queryset(base).order_by().aggregate(**aggregates))
+
+    if 'price' in names:
+        facets['price'] = [
+            {'key': key, 'min': format_price(low), 'max': format_price(high), 'count': counts[f'price_{index}']}
+            for index, (key, low, high) in enumerate(ranges)
+        ]
+    if 'in_stock' in names:
+        facets['in_stock'] = {'true': counts['in_stock_true'], 'false': counts['in_stock_false']}
+    return facets
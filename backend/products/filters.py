@@ -0,0 +1,19 @@
+from rest_framework import filters
+from .search import get_search_backend
+
+
+class ProductSearchFilter(filters.SearchFilter):
+    """Búsqueda de productos respaldada por el índice de texto completo"""
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query:
+            return queryset
+
+        backend = get_search_backend()
+        queryset = backend.search(queryset, query)
+
+        # Ordenar por relevancia salvo que el cliente pida otro orden
+        if not request.query_params.get('ordering'):
+            queryset = backend.order_by_rank(queryset)
+        return queryset
@@ -0,0 +1,456 @@
+"""
+Importación masiva de productos desde CSV o JSONL.
+
+El archivo se lee en streaming y se procesa por lotes, así que la memoria no
+depende del tamaño del archivo. Las categorías se resuelven por slug desde un
+mapa en memoria y los slugs únicos se generan por lote, sin consultas por
+fila. Cada lote se escribe con bulk_create/bulk_update en su
+propia transacción (los QuerySet de producto mantienen precios, contadores y
+caché) y se reindexa en el buscador en bloque.
+
+Columnas: name, slug, description, price, discount_price, stock, category
+(slug), image_url, is_featured, is_active. Solo name y price son
+obligatorias. Si la fila trae un slug que ya existe, el producto se actualiza
+solo si cambió su huella de contenido (Product.content_hash); si el producto
+es de otro vendedor, la fila se omite. El stock se escribe solo si difiere
+del que trajo la importación anterior (Product.imported_stock): las ventas
+desde entonces no se pisan.
+
+En modo sincronización (``sync=True``) el archivo es el catálogo completo: se
+insertan los nuevos, se actualizan los que cambiaron y se desactivan los que
+ya no aparecen, todo en lotes. Una fila sin slug se identifica por su nombre,
+solo entre los productos del vendedor: el de ese nombre cuyo slug es el del
+nombre o lleva el sufijo que le dio SlugAllocator ("lampara-2" si "lampara"
+es de otro vendedor). Si no hay ninguno, se crea con un slug nuevo.
+"""
+import csv
+import json
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from decimal import Decimal, InvalidOperation
+
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils.text import slugify
+from .cache import bump_version
+from .models import CONTENT_HASH_FIELDS, Category, Product, content_hash
+from .search import get_search_backend
+
+FORMATS = ('csv', 'jsonl')
+# Campos que la importación escribe (además del slug, que identifica al producto)
+IMPORT_FIELDS = CONTENT_HASH_FIELDS + ['stock']
+STOCK_FIELDS = ['stock', 'imported_stock']
+TRUE_VALUES = {'1', 'true', 'yes', 'si', 'sí', 'y', 't'}
+SLUG_MAX_LENGTH = Product._meta.get_field('slug').max_length
+MAX_REPORTED_ERRORS = 20
+# DecimalField(max_digits=10, decimal_places=2)
+MAX_PRICE = Decimal('1e8')
+
+
+class RowError(ValueError):
+    """Fila inválida: se omite y se informa en el resumen"""
+
+
+def read_rows(stream, fmt):
+    """Iterar (número de línea, dict) del CSV o JSONL sin cargar el archivo completo"""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_number, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as error:
+            yield line_number, RowError(f'JSON inválido: {error}')
+            continue
+        yield line_number, row if isinstance(row, dict) else RowError('Se esperaba un objeto JSON')
+
+
+def chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def parse_decimal(value, field, required=False):
+    if value is None or str(value).strip() == '':
+        if required:
+            raise RowError(f'{field} es requerido')
+        return None
+    try:
+        number = Decimal(str(value).strip())
+    except InvalidOperation:
+        raise RowError(f'{field} inválido: {value!r}')
+    if not number.is_finite() or number < 0 or number >= MAX_PRICE:
+        raise RowError(f'{field} inválido: {value!r}')
+    return number.quantize(Decimal('0.01'))
+
+
+def parse_bool(value, default):
+    if value is None or str(value).strip() == '':
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in TRUE_VALUES
+
+
+def slug_base(value):
+    """Slug base de SlugAllocator para un texto (sin sufijo)"""
+    return slugify(value)[:SLUG_MAX_LENGTH - 8] or 'producto'
+
+
+def parse_stock(value):
+    if value is None or str(value).strip() == '':
+        return 0
+    try:
+        stock = int(str(value).strip())
+    except ValueError:
+        raise RowError(f'stock inválido: {value!r}')
+    if stock < 0:
+        raise RowError(f'stock inválido: {value!r}')
+    return stock
+
+
+class SlugAllocator:
+    """Slugs únicos para un lote sin consultas por fila (existentes y sufijos ya usados)"""
+
+    def allocate(self, bases):
+        bases = [slug_base(base) for base in bases]
+        counts = Counter(bases)
+        taken = set(Product.objects.filter(slug__in=list(counts)).order_by().values_list('slug', flat=True))
+
+        # Bases ocupadas o repetidas en el lote: buscar los sufijos usados (base-2, base-3, ...)
+        next_suffix = {}
+        collided = {base for base, count in counts.items() if base in taken or count > 1}
+        ordered = sorted(collided)
+        table = Product._meta.db_table
+        with connection.cursor() as cursor:
+            for start in range(0, len(ordered), 200):
+                batch = ordered[start:start + 200]
+                # Rangos sobre el índice único del slug (LIKE 'base-%' no lo usa en SQLite)
+                cursor.execute(
+                    f'SELECT slug FROM {table} WHERE ' + ' OR '.join(['(slug > %s AND slug < %s)'] * len(batch)),
+                    [bound for base in batch for bound in (f'{base}-', f'{base}.')],
+                )
+                for (slug,) in cursor.fetchall():
+                    base, _, suffix = slug.rpartition('-')
+                    if base in collided and suffix.isdigit():
+                        next_suffix[base] = max(next_suffix.get(base, 1), int(suffix))
+                        taken.add(slug)
+
+        slugs = []
+        for base in bases:
+            slug = base
+            while slug in taken:
+                next_suffix[base] = next_suffix.get(base, 1) + 1
+                slug = f'{base}-{next_suffix[base]}'
+            taken.add(slug)
+            slugs.append(slug)
+        return slugs
+
+
+class SeenProducts:
+    """Tabla temporal con los ids presentes en el snapshot (la memoria no crece con el catálogo)"""
+
+    table = 'products_sync_seen'
+
+    def create(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {self.table}')
+            cursor.execute(f'CREATE TEMPORARY TABLE {self.table} (id integer NOT NULL)')
+
+    def add(self, ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(f'INSERT INTO {self.table} (id) VALUES (%s)', [(product_id,) for product_id in ids])
+
+    def drop(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {self.table}')
+
+    def as_subquery(self):
+        return RawSQL(f'SELECT id FROM {self.table}', [])
+
+
+class ProductImporter:
+    """
+    Importa filas de productos por lotes (ver módulo).
+
+    Con ``sync=True`` el archivo es un snapshot completo del catálogo del
+    vendedor (o de los productos sin vendedor): los productos que no aparecen
+    se desactivan al final.
+    """
+
+    def __init__(self, seller=None, chunk_size=1000, create_categories=False, sync=False, progress=None):
+        self.seller = seller
+        self.chunk_size = chunk_size
+        self.create_categories = create_categories
+        self.sync = sync
+        self.progress = progress
+        self.categories = dict(Category.objects.values_list('slug', 'id'))
+        self.slugs = SlugAllocator()
+        self.search_backend = get_search_backend()
+        self.seen = SeenProducts() if sync else None
+        self.stats = {
+            'rows': 0, 'created': 0, 'updated': 0, 'unchanged': 0, 'deactivated': 0, 'skipped': 0,
+            'categories_created': 0,
+        }
+        self.timings = defaultdict(float)
+        self.errors = []
+
+    @contextmanager
+    def timed(self, phase):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[phase] += time.perf_counter() - start
+
+    def run(self, rows):
+        start = time.perf_counter()
+        chunks = chunked(rows, self.chunk_size)
+        if self.sync:
+            self.seen.create()
+        try:
+            while True:
+                with self.timed('read'):
+                    chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                with transaction.atomic():
+                    self.write_chunk(chunk)
+                if self.progress:
+                    self.progress(self.stats, time.perf_counter() - start)
+            if self.sync:
+                with self.timed('deactivate'):
+                    self.deactivate_missing()
+        finally:
+            if self.sync:
+                self.seen.drop()
+        self.stats['seconds'] = time.perf_counter() - start
+        return self.stats
+
+    def scope(self):
+        """Productos que administra la sincronización: los del vendedor (o los que no tienen)"""
+        if self.seller is None:
+            return Product.objects.filter(seller__isnull=True)
+        return Product.objects.filter(seller=self.seller)
+
+    def error(self, line_number, message):
+        self.stats['skipped'] += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f'línea {line_number}: {message}')
+
+    def clean(self, raw):
+        """Convertir una fila en valores del modelo (RowError si es inválida)"""
+        if isinstance(raw, RowError):
+            raise raw
+        name = str(raw.get('name') or '').strip()
+        if not name:
+            raise RowError('name es requerido')
+        price = parse_decimal(raw.get('price'), 'price', required=True)
+        discount_price = parse_decimal(raw.get('discount_price'), 'discount_price')
+        if discount_price is not None and discount_price >= price:
+            discount_price = None
+
+        category_slug = str(raw.get('category') or '').strip()
+        category_id = None
+        if category_slug:
+            category_id = self.categories.get(category_slug)
+            if category_id is None and not self.create_categories:
+                raise RowError(f'categoría {category_slug!r} no existe')
+
+        slug = slugify(str(raw.get('slug') or '').strip())
+        return {
+            'slug': slug[:SLUG_MAX_LENGTH - 8],
+            'category_slug': category_slug,
+            'name': name[:255],
+            'description': str(raw.get('description') or ''),
+            'price': price,
+            'discount_price': discount_price,
+            'stock': parse_stock(raw.get('stock')),
+            'category_id': category_id,
+            'image_url': str(raw.get('image_url') or '').strip() or None,
+            'is_featured': parse_bool(raw.get('is_featured'), False),
+            'is_active': parse_bool(raw.get('is_active'), True),
+        }
+
+    def match_by_name(self, bases, exclude_ids):
+        """
+        Productos del alcance para filas sin slug: los de ese nombre cuyo slug es
+        el base o lleva el sufijo que les dio SlugAllocator (nunca de otro vendedor)
+        """
+        bases = sorted(bases)
+        found = {}
+        for start in range(0, len(bases), 200):
+            batch = bases[start:start + 200]
+            # Rangos sobre el índice único del slug, como en SlugAllocator
+            condition = Q(slug__in=batch)
+            for base in batch:
+                condition |= Q(slug__gt=f'{base}-', slug__lt=f'{base}.')
+            candidates = self.scope().filter(condition).exclude(id__in=exclude_ids).order_by().values_list(
+                'name', 'slug', 'id', 'seller_id', 'content_hash', 'imported_stock'
+            )
+            wanted = set(batch)
+            for name, slug, *match in candidates:
+                # "lampara-2" puede ser otra "Lampara" o la "Lampara 2": decide el nombre
+                base = slug_base(name)
+                if base not in wanted:
+                    continue
+                if slug == base:
+                    rank = 0
+                else:
+                    prefix, _, suffix = slug.rpartition('-')
+                    if prefix != base or not suffix.isdigit():
+                        continue
+                    rank = int(suffix)
+                if base not in found or rank < found[base][0]:
+                    found[base] = (rank, tuple(match))
+        return {base: match for base, (rank, match) in found.items()}
+
+    def ensure_categories(self, rows):
+        """Crear en bloque las categorías que faltan (con --create-categories); devuelve las filas resueltas"""
+        missing = {row['category_slug'] for row in rows if row['category_slug'] and row['category_id'] is None}
+        if not missing:
+            return rows
+        # Las que otro proceso creó desde que se cargó el mapa no cuentan como creadas
+        existing = set(Category.objects.filter(slug__in=missing).values_list('slug', flat=True))
+        Category.objects.bulk_create(
+            [Category(name=slug.replace('-', ' ').title(), slug=slug) for slug in sorted(missing - existing)],
+            ignore_conflicts=True,
+        )
+        # ignore_conflicts omite en silencio las que chocan (por ejemplo, con el nombre de otra categoría)
+        found = dict(Category.objects.filter(slug__in=missing).values_list('slug', 'id'))
+        self.categories.update(found)
+        created = len(found.keys() - existing)
+        if created:
+            self.stats['categories_created'] += created
+            bump_version('category')
+        resolved = []
+        for row in rows:
+            if row['category_id'] is None and row['category_slug']:
+                row['category_id'] = self.categories.get(row['category_slug'])
+                if row['category_id'] is None:
+                    self.error(row['line'], f'no se pudo crear la categoría {row["category_slug"]!r} '
+                                            f'(¿otra categoría con el mismo nombre?)')
+                    continue
+            resolved.append(row)
+        return resolved
+
+    def write_chunk(self, chunk):
+        with self.timed('parse'):
+            rows = []
+            for line_number, raw in chunk:
+                self.stats['rows'] += 1
+                try:
+                    row = self.clean(raw)
+                except RowError as error:
+                    self.error(line_number, error)
+                    continue
+                row['line'] = line_number
+                rows.append(row)
+            if self.create_categories:
+                rows = self.ensure_categories(rows)
+
+        with self.timed('diff'):
+            # Un slug explícito repetido en el lote: gana la última fila
+            explicit = {row['slug']: row for row in rows if row['slug']}
+            implicit = [row for row in rows if not row['slug']]
+            existing = {
+                slug: (product_id, seller_id, stored_hash, imported_stock)
+                for slug, product_id, seller_id, stored_hash, imported_stock in Product.objects.filter(
+                    slug__in=list(explicit)
+                ).order_by().values_list('slug', 'id', 'seller_id', 'content_hash', 'imported_stock')
+            }
+            by_name = {}
+            if self.sync and implicit:
+                # En un snapshot cada fila identifica a un producto: sin slug, por el
+                # de su nombre dentro del alcance (gana la última fila repetida)
+                implicit = list({slug_base(row['name']): row for row in implicit}.values())
+                by_name = self.match_by_name(
+                    {slug_base(row['name']) for row in implicit},
+                    [match[0] for match in existing.values()],
+                )
+            rows = implicit + list(explicit.values())
+
+            seller_id = getattr(self.seller, 'pk', None)
+            to_create, changed, seen = [], {}, []
+            for row in rows:
+                if row['slug']:
+                    match = existing.get(row['slug'])
+                else:
+                    match = by_name.get(slug_base(row['name']))
+                if match is None:
+                    to_create.append(row)
+                    continue
+                product_id, product_seller_id, stored_hash, imported_stock = match
+                # Con o sin --sync: un slug de otro vendedor no se pisa
+                if product_seller_id != seller_id:
+                    self.error(row['line'], f'el slug {row["slug"]!r} pertenece a otro vendedor')
+                    continue
+                seen.append(product_id)
+                # Solo se reescriben los productos cuya huella (o stock del archivo) cambió
+                fields = []
+                if stored_hash != content_hash(row):
+                    fields += CONTENT_HASH_FIELDS
+                if imported_stock != row['stock']:
+                    fields += STOCK_FIELDS
+                if fields:
+                    changed[product_id] = (row, tuple(fields))
+                else:
+                    self.stats['unchanged'] += 1
+            to_update = list(Product.objects.in_bulk(list(changed)).values()) if changed else []
+
+        with self.timed('insert'):
+            slugs = self.slugs.allocate([row['slug'] or slugify(row['name']) for row in to_create])
+            new_products = [
+                Product(slug=slug, seller=self.seller, imported_stock=row['stock'],
+                        **{field: row[field] for field in IMPORT_FIELDS})
+                for slug, row in zip(slugs, to_create)
+            ]
+            if new_products:
+                Product.objects.bulk_create(new_products, batch_size=self.chunk_size)
+            created_ids = [product.pk for product in new_products if product.pk is not None]
+            if len(created_ids) < len(new_products):
+                # Bases de datos que no devuelven los ids del INSERT en bloque
+                created_ids = list(Product.objects.filter(slug__in=slugs).values_list('id', flat=True))
+
+        with self.timed('update'):
+            # Un bulk_update por combinación de campos: el stock solo se escribe donde cambió en el archivo
+            by_fields = defaultdict(list)
+            for product in to_update:
+                row, fields = changed[product.pk]
+                row['imported_stock'] = row['stock']
+                for field in fields:
+                    setattr(product, field, row[field])
+                by_fields[fields].append(product)
+            for fields, products in by_fields.items():
+                Product.objects.bulk_update(products, list(fields), batch_size=self.chunk_size)
+
+        with self.timed('index'):
+            self.search_backend.index_products(created_ids + [product.pk for product in to_update])
+        if self.sync:
+            self.seen.add(created_ids + seen)
+
+        self.stats['created'] += len(new_products)
+        self.stats['updated'] += len(to_update)
+
+    def deactivate_missing(self):
+        """Desactivar los productos del alcance que no aparecieron en el snapshot"""
+        if self.stats['rows'] == self.stats['skipped']:
+            # Snapshot vacío o ilegible: no se desactiva el catálogo completo
+            self.errors.append('ninguna fila válida: no se desactivaron productos')
+            return
+        with transaction.atomic():
+            missing = self.scope().filter(is_active=True).exclude(id__in=self.seen.as_subquery())
+            self.stats['deactivated'] = missing.update(is_active=False)
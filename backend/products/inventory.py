@@ -0,0 +1,123 @@
+"""
+Stock repartido en contadores para productos muy vendidos.
+
+Cada compra de un producto actualiza su fila, así que en una oferta todas
+las compras de ese producto se serializan en el mismo bloqueo de fila. Con
+``split_stock(product, n)`` el stock pasa a n filas StockShard y cada compra
+descuenta de una al azar con un UPDATE condicional (``quantity >= n``), de
+modo que hasta n compras avanzan en paralelo. Si la elegida no alcanza se
+bloquean todos los contadores del producto y se descuenta de varios.
+
+Las compras no tocan la fila del producto (es lo que evita el bloqueo), así
+que Product.stock de un producto repartido queda atrasado hasta que
+``sync_sharded_stock`` lo recalcula con un solo UPDATE (comando
+``shard_stock --sync``, periódico). Las validaciones de stock leen la suma
+de los contadores (Product.current_stock, models.live_stock()). Asignar un
+stock nuevo con save()/bulk_update() lo vuelve a repartir; los UPDATE en
+bloque sobre ``stock`` de un producto repartido no lo hacen.
+"""
+from django.db import models, transaction
+from django.db.models import F, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from .models import Product, StockShard
+
+# Máximo de contadores por producto
+MAX_SHARDS = 64
+
+
+def sharded_total(product_id):
+    return StockShard.objects.filter(product_id=product_id).aggregate(total=Sum('quantity'))['total'] or 0
+
+
+@transaction.atomic
+def split_stock(product, shards):
+    """Repartir el stock del producto en ``shards`` contadores (0 o 1: volver a una sola fila)"""
+    shards = min(shards, MAX_SHARDS)
+    if shards <= 1:
+        return merge_stock(product)
+    if product.stock_shards and not product.stock_changed():
+        # Ya repartido y sin un stock nuevo asignado: lo vendido desde la última
+        # sincronización solo está en los contadores, así que se reparte su suma
+        product.stock = sum(
+            StockShard.objects.select_for_update().filter(product=product).values_list('quantity', flat=True)
+        )
+    StockShard.objects.filter(product=product).delete()
+    base, extra = divmod(product.stock, shards)
+    StockShard.objects.bulk_create([
+        StockShard(product=product, shard=index, quantity=base + (1 if index < extra else 0))
+        for index in range(shards)
+    ])
+    # QuerySet base: cambiar la cantidad de contadores no cambia el contenido del producto
+    models.QuerySet(Product).filter(pk=product.pk).update(stock=product.stock, stock_shards=shards)
+    product.stock_shards = shards
+    product._loaded_stock = product.stock
+
+
+@transaction.atomic
+def merge_stock(product):
+    """Volver a llevar el stock en la fila del producto, con lo que quede en los contadores"""
+    if product.stock_shards:
+        product.stock = sharded_total(product.pk)
+        Product.objects.filter(pk=product.pk).update(stock=product.stock, stock_shards=0)
+        StockShard.objects.filter(product=product).delete()
+    product.stock_shards = 0
+    product._loaded_stock = product.stock
+
+
+def take_stock(product, quantity, held=None):
+    """
+    Descontar ``quantity`` unidades (llamar dentro de una transacción).
+
+    Con ``held`` (unidades que el comprador retiene, ver cart.reservations)
+    no se venden las que retienen otros carritos. Devuelve False sin cambiar
+    nada si no alcanza el stock.
+    """
+    if not product.stock_shards:
+        condition = Q(stock__gte=quantity)
+        if held is not None:
+            condition = Q(stock__gte=F('reserved_stock') + quantity - held)
+        return bool(Product.objects.filter(condition, pk=product.pk).update(stock=F('stock') - quantity))
+
+    if held is None or product.reserved_stock <= held:
+        # Un contador al azar con cantidad suficiente; la condición se vuelve a evaluar al actualizar
+        candidate = StockShard.objects.filter(
+            product_id=product.pk, quantity__gte=quantity
+        ).order_by('?').values('id')[:1]
+        if StockShard.objects.filter(id=Subquery(candidate), quantity__gte=quantity).update(
+            quantity=F('quantity') - quantity
+        ):
+            return True
+
+    # Ninguno alcanza solo, hubo carrera u otros carritos retienen unidades:
+    # descontar de varios con todos bloqueados
+    kept = 0
+    if held is not None:
+        # Las reservas actualizan la fila del producto: bloquearla deja fijo lo retenido
+        reserved = models.QuerySet(Product).select_for_update().filter(pk=product.pk).values_list(
+            'reserved_stock', flat=True
+        ).get()
+        kept = max(reserved - held, 0)
+    shards = list(StockShard.objects.select_for_update().filter(product_id=product.pk).order_by('shard'))
+    if sum(shard.quantity for shard in shards) - kept < quantity:
+        return False
+    remaining = quantity
+    for shard in sorted(shards, key=lambda shard: -shard.quantity):
+        taken = min(shard.quantity, remaining)
+        shard.quantity -= taken
+        remaining -= taken
+        if not remaining:
+            break
+    StockShard.objects.bulk_update(shards, ['quantity'])
+    return True
+
+
+def sync_sharded_stock():
+    """Copiar a Product.stock la suma de los contadores de los productos repartidos que cambiaron (un UPDATE)"""
+    totals = StockShard.objects.filter(product=OuterRef('pk')).order_by().values('product').annotate(
+        total=Sum('quantity')
+    ).values('total')
+    total = Coalesce(Subquery(totals), 0)
+    # Solo los que difieren: no tocar updated_at ni la versión de caché si no hubo compras
+    return Product.objects.filter(stock_shards__gt=0).alias(sharded=total).exclude(
+        stock=F('sharded')
+    ).update(stock=total)
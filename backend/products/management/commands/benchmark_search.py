@@ -0,0 +1,86 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from products.models import Product
+from products.search import get_search_backend
+
+WORDS = [
+    'laptop', 'gaming', 'teléfono', 'cámara', 'monitor', 'teclado', 'mouse', 'altavoz',
+    'bluetooth', 'inalámbrico', 'batería', 'pantalla', 'procesador', 'memoria', 'disco',
+    'portátil', 'resistente', 'agua', 'sonido', 'digital', 'profesional', 'compacto',
+    'salchichón', 'ibérico', 'curado', 'artesanal', 'queso', 'jamón', 'embutido', 'picante',
+]
+
+
+class Command(BaseCommand):
+    help = 'Compara la búsqueda con LIKE (SearchFilter) contra el índice de texto completo'
+
+    def add_arguments(self, parser):
+        parser.add_argument('terms', nargs='*', default=['laptop', 'bluetooth batería', 'salchichón curado'])
+        parser.add_argument('--populate', type=int, default=0,
+                            help='Crear N productos sintéticos (se revierten al terminar)')
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            if options['populate']:
+                self.populate(options['populate'])
+            self.run(options['terms'], options['repeat'])
+            # Nunca dejar los datos sintéticos en la base de datos
+            transaction.set_rollback(True)
+
+    def populate(self, count):
+        self.stdout.write(f'Creando {count} productos sintéticos...')
+        rng = random.Random(42)
+        # Vocabulario amplio para que cada término sea selectivo, como en un catálogo real
+        syllables = ['ca', 'lo', 'mi', 'tre', 'sa', 'pu', 'ver', 'gon', 'di', 'ta', 'ble', 'ro']
+        vocabulary = WORDS + [
+            ''.join(rng.choices(syllables, k=rng.randint(2, 4))) for _ in range(5000)
+        ]
+        batch = []
+        for i in range(count):
+            batch.append(Product(
+                name=' '.join(rng.choices(vocabulary, k=3)),
+                slug=f'bench-{i}',
+                description=' '.join(rng.choices(vocabulary, k=30)),
+                price=rng.randint(1, 1000),
+            ))
+            if len(batch) >= 5000:
+                Product.objects.bulk_create(batch)
+                batch = []
+        Product.objects.bulk_create(batch)
+        get_search_backend().rebuild()
+
+    def time_query(self, build, repeat):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            ids = list(build().values_list('id', flat=True)[:10])
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best, ids
+
+    def run(self, terms, repeat):
+        backend = get_search_backend()
+        base = Product.objects.filter(is_active=True)
+        self.stdout.write(f'Backend: {type(backend).__name__} | productos: {base.count()}')
+
+        for term in terms:
+            def like():
+                queryset = base
+                for word in term.split():
+                    queryset = queryset.filter(Q(name__icontains=word) | Q(description__icontains=word))
+                return queryset.order_by('-created_at')
+
+            def indexed():
+                return backend.order_by_rank(backend.search(base, term))
+
+            like_time, _ = self.time_query(like, repeat)
+            index_time, _ = self.time_query(indexed, repeat)
+            speedup = like_time / index_time if index_time else float('inf')
+            self.stdout.write(
+                f'"{term}": LIKE {like_time * 1000:.2f}ms | índice {index_time * 1000:.2f}ms | x{speedup:.1f}'
+            )
@@ -0,0 +1,77 @@
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, transaction
+from products.inventory import take_stock, sync_sharded_stock, split_stock
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide compras concurrentes de un mismo producto con el stock en una fila contra el stock '
+        'repartido en contadores (los productos de prueba se borran al terminar)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8, help='Compras simultáneas')
+        parser.add_argument('--orders', type=int, default=100, help='Compras por hilo')
+        parser.add_argument('--shards', type=int, default=16)
+        parser.add_argument('--hold-ms', type=float, default=2.0,
+                            help='Resto de la transacción de compra tras descontar el stock (ms)')
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite':
+            self.stdout.write(self.style.WARNING(
+                'SQLite bloquea toda la base en cada escritura: ambas variantes se serializan igual. '
+                'La diferencia se mide en PostgreSQL o MySQL, con bloqueo por fila.'
+            ))
+        results = {}
+        for label, shards in (('una fila', 0), (f'{options["shards"]} contadores', options['shards'])):
+            results[label] = self.measure(shards, options)
+        base = results['una fila'][0]
+        for label, (rate, sold, failed) in results.items():
+            self.stdout.write(
+                f'{label}: {rate:.0f} compras/s ({sold} vendidas, {failed} fallidas) '
+                f'x{rate / base if base else 0:.2f}'
+            )
+
+    def measure(self, shards, options):
+        total = options['threads'] * options['orders']
+        product = Product.objects.create(
+            name='Benchmark stock', slug=f'benchmark-stock-{shards}', description='', price=1, stock=total
+        )
+        try:
+            if shards > 1:
+                split_stock(product, shards)
+            sold, failed = [], []
+
+            def buy():
+                for _ in range(options['orders']):
+                    try:
+                        with transaction.atomic():
+                            if not take_stock(product, 1):
+                                failed.append(1)
+                                continue
+                            # El resto de la compra (items, pago) mantiene los bloqueos tomados
+                            time.sleep(options['hold_ms'] / 1000)
+                        sold.append(1)
+                    except OperationalError:
+                        failed.append(1)
+                connection.close()
+
+            threads = [threading.Thread(target=buy) for _ in range(options['threads'])]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+
+            sync_sharded_stock()
+            product.refresh_from_db()
+            if product.stock != total - len(sold):
+                self.stdout.write(self.style.ERROR(f'Stock final {product.stock}, esperado {total - len(sold)}'))
+            return len(sold) / elapsed, len(sold), len(failed)
+        finally:
+            product.delete()
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+from products.recommendations import build_bought_together
+
+
+class Command(BaseCommand):
+    help = 'Calcula las recomendaciones "comprados juntos" a partir del historial de compras'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--incremental', action='store_true',
+                            help='Recalcular solo los productos con compras nuevas desde el último cálculo y sus vecinos')
+        parser.add_argument('--top-k', type=int, default=10, help='Vecinos a guardar por producto')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        result = build_bought_together(top_k=options['top_k'], incremental=options['incremental'])
+        elapsed = time.perf_counter() - start
+
+        for phase, seconds in result['timings'].items():
+            self.stdout.write(f'  {phase}: {seconds:.3f}s')
+        mode = 'incremental' if options['incremental'] else 'completo'
+        self.stdout.write(self.style.SUCCESS(
+            f'Cálculo {mode}: {result["products"]} productos, {result["rows"]} recomendaciones en {elapsed:.2f}s'
+        ))
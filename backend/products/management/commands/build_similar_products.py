@@ -0,0 +1,75 @@
+import random
+import sys
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from products.similarity import build_similar_products, neighbours, vectorize
+
+
+def peak_memory_mb():
+    """Pico de memoria del proceso en MB (None donde no hay módulo resource, como en Windows)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss está en bytes en macOS y en KB en Linux
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def format_memory():
+    peak = peak_memory_mb()
+    return 'n/d' if peak is None else f'{peak:.0f} MB'
+
+
+class Command(BaseCommand):
+    help = 'Calcula los productos similares por contenido (TF-IDF sobre nombre y descripción)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--incremental', action='store_true',
+                            help='Recalcular solo los productos cuyo texto cambió desde el último cálculo')
+        parser.add_argument('--top-k', type=int, default=10, help='Vecinos a guardar por producto')
+        parser.add_argument('--synthetic', type=int, default=0,
+                            help='Medir tiempo y memoria con N productos sintéticos (no escribe en la base de datos)')
+
+    def handle(self, *args, **options):
+        if options['synthetic']:
+            return self.benchmark(options['synthetic'], options['top_k'])
+
+        start = time.perf_counter()
+        result = build_similar_products(top=options['top_k'], incremental=options['incremental'])
+        elapsed = time.perf_counter() - start
+
+        for phase, seconds in result['timings'].items():
+            self.stdout.write(f'  {phase}: {seconds:.3f}s')
+        mode = 'incremental' if options['incremental'] else 'completo'
+        self.stdout.write(self.style.SUCCESS(
+            f'Cálculo {mode}: {result["products"]} productos, {result["rows"]} filas, '
+            f'{result["nnz"]} términos en la matriz, {elapsed:.2f}s, pico de memoria {format_memory()}'
+        ))
+
+    def benchmark(self, count, top):
+        rng = random.Random(42)
+        syllables = ['ca', 'lo', 'mi', 'tre', 'sa', 'pu', 'ver', 'gon', 'di', 'ta', 'ble', 'ro', 'nu', 'fe']
+        vocabulary = sorted({''.join(rng.choices(syllables, k=rng.randint(3, 5))) for _ in range(30000)})
+        rng.shuffle(vocabulary)
+        # Frecuencias tipo Zipf, como en un catálogo real
+        weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+        documents = [
+            (' '.join(rng.choices(vocabulary, weights, k=4)), ' '.join(rng.choices(vocabulary, weights, k=40)))
+            for _ in range(count)
+        ]
+        categories = np.asarray([rng.randrange(20) for _ in range(count)], dtype=np.int64)
+        self.stdout.write(f'{count} productos sintéticos generados (memoria {format_memory()})')
+
+        start = time.perf_counter()
+        matrix = vectorize(documents)
+        self.stdout.write(f'  vectorize: {time.perf_counter() - start:.2f}s, {matrix.nnz} términos')
+
+        start = time.perf_counter()
+        total = 0
+        for _, global_neighbours, _ in neighbours(matrix, categories, list(range(count)), top):
+            total += len(global_neighbours[0])
+        self.stdout.write(f'  similarity: {time.perf_counter() - start:.2f}s, {total} vecinos')
+        self.stdout.write(self.style.SUCCESS(f'Pico de memoria: {format_memory()}'))
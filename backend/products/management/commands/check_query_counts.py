@@ -0,0 +1,107 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+from cart.models import Cart, CartItem
+from cart.views import CartDetailView
+from ecommerce.views import home
+from products.models import Category, Product
+from products.views import (
+    ProductListView,
+    ProductsByCategoryView,
+    MyProductsView,
+    featured_products,
+    recommended_products,
+)
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Verifica que el número de consultas de los listados de productos (y del carrito) '
+        'no crece con la cantidad de productos (detecta N+1). Los datos se revierten al terminar.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1, 8],
+                            help='Cantidades de productos a comparar (máx. 10, una página)')
+
+    def handle(self, *args, **options):
+        sizes = sorted(options['sizes'])
+        # Sin caché de respuestas: se mide el costo real de construir cada listado
+        no_cache = {namespace: 0 for namespace in ('featured', 'recommended', 'similar', 'categories')}
+        with override_settings(CATALOG_CACHE_TIMEOUTS=no_cache), transaction.atomic():
+            results = self.measure(sizes)
+            transaction.set_rollback(True)
+
+        failures = []
+        for name, counts in results.items():
+            flat = len(set(counts)) == 1
+            line = f'{name}: ' + ', '.join(f'N={size} -> {count}' for size, count in zip(sizes, counts))
+            if flat:
+                self.stdout.write(self.style.SUCCESS(line))
+            else:
+                self.stdout.write(self.style.ERROR(line))
+                failures.append(name)
+
+        if failures:
+            raise CommandError(f'El número de consultas crece con N en: {", ".join(failures)}')
+
+    def measure(self, sizes):
+        factory = APIRequestFactory(SERVER_NAME='localhost')
+        seller = User.objects.create_user(
+            email='query-count@example.com', username='query-count', password='query-count'
+        )
+        categories = [
+            Category.objects.create(name=f'Query Count {i}', slug=f'query-count-{i}') for i in range(3)
+        ]
+        cart = Cart.objects.create(user=seller)
+        anchor = Product.objects.create(
+            name='Query Count Anchor', slug='query-count-anchor', description='', price=1,
+            category=categories[0], seller=seller,
+        )
+
+        def authenticated(request):
+            force_authenticate(request, user=seller)
+            return request
+
+        endpoints = {
+            'product_list': lambda: ProductListView.as_view()(factory.get('/api/products/')),
+            'product_facets': lambda: ProductListView.as_view()(
+                factory.get('/api/products/', {'facets': 'category,price,in_stock', 'in_stock': 'true'})
+            ),
+            'products_by_category': lambda: ProductsByCategoryView.as_view()(
+                factory.get('/'), slug=categories[0].slug
+            ),
+            'featured_products': lambda: featured_products(factory.get('/api/products/featured/')),
+            'recommended_products': lambda: recommended_products(
+                authenticated(factory.get('/')), product_id=anchor.id
+            ),
+            'my_products': lambda: MyProductsView.as_view()(authenticated(factory.get('/'))),
+            'home': lambda: home(factory.get('/')),
+            'cart_detail': lambda: CartDetailView.as_view()(authenticated(factory.get('/api/cart/'))),
+            'cart_totals': lambda: CartDetailView.as_view()(
+                authenticated(factory.get('/api/cart/', {'fields': 'total_items,total_amount'}))
+            ),
+        }
+
+        results = {name: [] for name in endpoints}
+        created = 0
+        for size in sizes:
+            while created < size:
+                product = Product.objects.create(
+                    name=f'Query Count {created}', slug=f'query-count-{created}', description='',
+                    price=10, category=categories[created % len(categories)], seller=seller,
+                    is_featured=True, stock=5,
+                )
+                CartItem.objects.create(cart=cart, product=product, quantity=2)
+                created += 1
+            for name, call in endpoints.items():
+                with CaptureQueriesContext(connection) as context:
+                    response = call()
+                    if hasattr(response, 'render'):
+                        response.render()
+                results[name].append(len(context))
+        return results
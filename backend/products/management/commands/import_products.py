@@ -0,0 +1,77 @@
+import io
+import sys
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from products.importer import FORMATS, ProductImporter, read_rows
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Importa productos desde un archivo CSV o JSONL (o la entrada estándar con "-") '
+        'en lotes con bulk_create/bulk_update'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Archivo a importar, o "-" para leer de la entrada estándar')
+        parser.add_argument('--format', choices=FORMATS,
+                            help='Formato del archivo (por defecto se deduce de la extensión)')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Filas por lote y transacción')
+        parser.add_argument('--seller', help='Email del vendedor asignado a los productos nuevos')
+        parser.add_argument('--create-categories', action='store_true',
+                            help='Crear las categorías que no existen en vez de omitir esas filas')
+        parser.add_argument('--sync', action='store_true',
+                            help='El archivo es el catálogo completo del vendedor (o de los productos sin '
+                                 'vendedor): solo se escriben los cambios y se desactivan los que faltan')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size debe ser mayor a 0')
+
+        seller = None
+        if options['seller']:
+            seller = User.objects.filter(email=options['seller']).first()
+            if seller is None:
+                raise CommandError(f'No existe un usuario con email {options["seller"]}')
+
+        importer = ProductImporter(
+            seller=seller,
+            chunk_size=options['chunk_size'],
+            create_categories=options['create_categories'],
+            sync=options['sync'],
+            progress=self.report_progress,
+        )
+        if path == '-':
+            stream = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8-sig', newline='')
+            stats = importer.run(read_rows(stream, fmt))
+        else:
+            try:
+                with open(path, encoding='utf-8-sig', newline='') as stream:
+                    stats = importer.run(read_rows(stream, fmt))
+            except OSError as error:
+                raise CommandError(f'No se pudo leer {path}: {error}')
+
+        for message in importer.errors:
+            self.stdout.write(self.style.WARNING(f'  {message}'))
+        for phase, seconds in importer.timings.items():
+            self.stdout.write(f'  {phase}: {seconds:.2f}s')
+        rate = stats['rows'] / stats['seconds'] if stats['seconds'] else 0
+        summary = (
+            f'{stats["rows"]} filas en {stats["seconds"]:.2f}s ({rate:.0f} filas/s): '
+            f'{stats["created"]} creados, {stats["updated"]} actualizados, {stats["unchanged"]} sin cambios, '
+        )
+        if options['sync']:
+            summary += f'{stats["deactivated"]} desactivados, '
+        summary += f'{stats["skipped"]} omitidos, {stats["categories_created"]} categorías nuevas'
+        self.stdout.write(self.style.SUCCESS(summary))
+
+    def report_progress(self, stats, elapsed):
+        # Como mucho una línea por segundo
+        if elapsed - getattr(self, 'last_report', 0) < 1:
+            return
+        self.last_report = elapsed
+        self.stderr.write(f'  {stats["rows"]} filas ({stats["rows"] / elapsed:.0f} filas/s)')
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+from products.inventory import MAX_SHARDS, merge_stock, split_stock, sync_sharded_stock
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        'Reparte el stock de productos muy vendidos en varios contadores (--shards N) o lo vuelve '
+        'a unificar (--shards 0); con --sync recalcula el stock mostrado de los productos repartidos'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('slugs', nargs='*', help='Slugs de los productos')
+        parser.add_argument('--shards', type=int, help=f'Cantidad de contadores (0 para unificar, máx. {MAX_SHARDS})')
+        parser.add_argument('--sync', action='store_true',
+                            help='Copiar a Product.stock la suma de los contadores (para ejecutar periódicamente)')
+
+    def handle(self, *args, **options):
+        if options['sync']:
+            updated = sync_sharded_stock()
+            self.stdout.write(self.style.SUCCESS(f'Stock actualizado en {updated} productos repartidos'))
+        if not options['slugs']:
+            if not options['sync']:
+                raise CommandError('Indique los slugs de los productos o --sync')
+            return
+        if options['shards'] is None or not 0 <= options['shards'] <= MAX_SHARDS:
+            raise CommandError(f'--shards debe estar entre 0 y {MAX_SHARDS}')
+
+        products = Product.objects.filter(slug__in=options['slugs'])
+        missing = set(options['slugs']) - {product.slug for product in products}
+        if missing:
+            raise CommandError(f'No existen los productos: {", ".join(sorted(missing))}')
+        for product in products:
+            if options['shards'] > 1:
+                split_stock(product, options['shards'])
+            else:
+                merge_stock(product)
+            self.stdout.write(f'{product.slug}: {product.stock} unidades en {product.stock_shards or 1} contador(es)')
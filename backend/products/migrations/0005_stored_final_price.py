@@ -0,0 +1,43 @@
+# Generated by Django 4.2.7 on 2026-10-18 05:24
+
+from django.db import migrations, models
+
+
+def populate_pricing(apps, schema_editor):
+    """Calcular las columnas de precio para los productos existentes"""
+    from products.models import pricing_expressions
+    Product = apps.get_model('products', 'Product')
+    Product.objects.update(**pricing_expressions())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_product_search_index'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='product',
+            name='products_pr_categor_50f5f1_idx',
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='discount_percentage',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='final_price',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10),
+        ),
+        migrations.RunPython(populate_pricing, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'is_active', 'final_price'], name='products_pr_categor_8acb40_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['is_active', 'final_price'], name='products_pr_is_acti_814f68_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2026-10-18 05:26
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_counts(apps, schema_editor):
+    """Calcular el contador para las categorías existentes"""
+    Category = apps.get_model('products', 'Category')
+    Product = apps.get_model('products', 'Product')
+    active_products = Product.objects.filter(
+        category=OuterRef('pk'), is_active=True
+    ).order_by().values('category').annotate(total=Count('id')).values('total')
+    Category.objects.update(active_products_count=Coalesce(Subquery(active_products), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='active_products_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 05:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0008_productrecommendation'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='productrecommendation',
+            name='kind',
+            field=models.CharField(choices=[('bought_together', 'Comprados juntos'), ('similar', 'Similares'), ('similar_category', 'Similares en la categoría')], default='bought_together', max_length=30),
+        ),
+    ]
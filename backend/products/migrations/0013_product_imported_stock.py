@@ -0,0 +1,35 @@
+# Generated by Django 4.2.7 on 2026-10-18 06:47
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def populate_import_state(apps, schema_editor):
+    """Tomar el stock actual como el importado y recalcular las huellas (ya sin el stock)"""
+    from products.models import CONTENT_HASH_FIELDS, content_hash
+    Product = apps.get_model('products', 'Product')
+    Product.objects.update(imported_stock=F('stock'))
+    batch = []
+    for product in Product.objects.only('id', *CONTENT_HASH_FIELDS).iterator(chunk_size=1000):
+        product.content_hash = content_hash({name: getattr(product, name) for name in CONTENT_HASH_FIELDS})
+        batch.append(product)
+        if len(batch) == 1000:
+            Product.objects.bulk_update(batch, ['content_hash'])
+            batch = []
+    Product.objects.bulk_update(batch, ['content_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0012_stock_shards'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='imported_stock',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(populate_import_state, migrations.RunPython.noop),
+    ]
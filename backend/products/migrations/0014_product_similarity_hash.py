@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 06:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0013_product_imported_stock'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='similarity_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=32),
+        ),
+    ]
@@ -1,18 +1,238 @@
 from django.db import models
+from django.db.models import Case, Count, Exists, F, IntegerField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce, Floor
+from django.db.models.lookups import GreaterThan, LessThan
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.utils import timezone
+import hashlib
+from collections import Counter, defaultdict
 from decimal import Decimal
+from .cache import bump_version
 
 User = get_user_model()
 
+# Campos de los que dependen las columnas de precio almacenadas
+PRICING_SOURCE_FIELDS = {'price', 'discount_price'}
+PRICING_STORED_FIELDS = ['final_price', 'discount_percentage']
+# Campos que afectan Category.active_products_count
+CATEGORY_COUNTER_FIELDS = {'category', 'category_id', 'is_active'}
+# Campos cubiertos por Product.content_hash (los que escribe la importación de catálogo).
+# El stock no: cambia con cada venta; la importación lo compara con Product.imported_stock
+CONTENT_HASH_FIELDS = [
+    'name', 'description', 'price', 'discount_price', 'category_id',
+    'image_url', 'is_featured', 'is_active',
+]
+# Nombres con los que esos campos pueden aparecer en update()/bulk_update()/update_fields
+CONTENT_HASH_SOURCE_FIELDS = set(CONTENT_HASH_FIELDS) | {'category'}
+
+
+def content_hash(values):
+    """Huella de los campos de CONTENT_HASH_FIELDS (``values``: dict con esos campos)"""
+    parts = []
+    for name in CONTENT_HASH_FIELDS:
+        value = values.get(name)
+        if value is None:
+            value = ''
+        elif name in ('price', 'discount_price'):
+            value = Decimal(str(value)).quantize(Decimal('0.01'))
+        parts.append(str(value))
+    return hashlib.md5('\x1f'.join(parts).encode()).hexdigest()
+
+
+def pricing_expressions(values=None):
+    """
+    Expresiones SQL equivalentes a Product.update_pricing().
+
+    ``values`` permite sustituir price/discount_price por los valores nuevos de
+    un UPDATE, ya que en SQL las columnas del lado derecho conservan el valor viejo.
+    """
+    values = values or {}
+    decimal_field = models.DecimalField(max_digits=10, decimal_places=2)
+
+    def as_expression(name):
+        value = values.get(name, F(name))
+        if hasattr(value, 'resolve_expression'):
+            return value
+        return Value(value, output_field=decimal_field)
+
+    price = as_expression('price')
+    discount_price = as_expression('discount_price')
+    return {
+        'final_price': Case(
+            When(GreaterThan(discount_price, 0), then=discount_price),
+            default=price,
+            output_field=decimal_field,
+        ),
+        'discount_percentage': Case(
+            When(
+                LessThan(discount_price, price),
+                then=Cast(Floor((price - discount_price) * 100 / price), IntegerField()),
+            ),
+            default=Value(0),
+            output_field=IntegerField(),
+        ),
+    }
+
+
+def live_stock(prefix=''):
+    """
+    Stock real en SQL: la columna stock, o la suma de los contadores si el
+    producto está repartido (ahí Product.stock solo se sincroniza periódicamente).
+    ``prefix``: 'product__' para usarla desde un modelo relacionado.
+    """
+    totals = StockShard.objects.filter(product=OuterRef(f'{prefix}pk')).order_by().values('product').annotate(
+        total=Sum('quantity')
+    ).values('total')
+    return Case(
+        When(**{f'{prefix}stock_shards__gt': 0}, then=Coalesce(Subquery(totals), 0)),
+        default=F(f'{prefix}stock'),
+        output_field=IntegerField(),
+    )
+
+
+def in_stock_condition():
+    """Q de los productos con stock (los repartidos: con algún contador con unidades)"""
+    shard_with_stock = StockShard.objects.filter(product=OuterRef('pk'), quantity__gt=0)
+    return Q(stock_shards=0, stock__gt=0) | (Q(stock_shards__gt=0) & Exists(shard_with_stock))
+
+
+class ProductQuerySet(models.QuerySet):
+    """QuerySet que mantiene final_price/discount_percentage en operaciones masivas"""
+
+    def active(self):
+        return self.filter(is_active=True)
+
+    def for_catalog(self):
+        """Queryset de lectura para ProductSerializer: categoría y vendedor en el mismo JOIN"""
+        return self.select_related('category', 'seller').with_live_stock()
+
+    def with_live_stock(self):
+        """Anotar ``live_stock`` (ver live_stock()): Product.current_stock sin consultas extra"""
+        return self.annotate(live_stock=live_stock())
+
+    def update(self, **kwargs):
+        # Como auto_now, pero para UPDATE en bloque: lo usan los ETag del catálogo
+        kwargs.setdefault('updated_at', timezone.now())
+        if PRICING_SOURCE_FIELDS.intersection(kwargs):
+            kwargs.update(pricing_expressions(kwargs))
+        if CONTENT_HASH_SOURCE_FIELDS.intersection(kwargs):
+            # La huella no se puede calcular en SQL: vacía obliga a reescribir en la próxima sincronización
+            kwargs.setdefault('content_hash', '')
+
+        category_ids = None
+        if CATEGORY_COUNTER_FIELDS.intersection(kwargs):
+            # Categorías afectadas antes del UPDATE (más la nueva, si cambia)
+            category_ids = set(
+                self.exclude(category=None).order_by().values_list('category_id', flat=True).distinct()
+            )
+            new_category = kwargs.get('category', kwargs.get('category_id'))
+            if new_category is not None:
+                category_ids.add(getattr(new_category, 'pk', new_category))
+
+        rows = super().update(**kwargs)
+        if category_ids:
+            Category.objects.filter(id__in=category_ids).refresh_products_count()
+        bump_version('product')
+        return rows
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for obj in objs:
+            obj.update_pricing()
+            obj.content_hash = obj.compute_content_hash()
+        created = super().bulk_create(objs, *args, **kwargs)
+        added = Counter(obj.category_id for obj in objs if obj.category_id and obj.is_active)
+        if added and (kwargs.get('ignore_conflicts') or kwargs.get('update_conflicts')):
+            # No se sabe qué filas se insertaron: recontar
+            Category.objects.filter(id__in=added).refresh_products_count()
+        elif added:
+            # Filas nuevas: sumar sin recorrer los productos existentes (un UPDATE por incremento distinto)
+            by_amount = defaultdict(list)
+            for category_id, amount in added.items():
+                by_amount[amount].append(category_id)
+            for amount, category_ids in by_amount.items():
+                Category.objects.filter(id__in=category_ids).update(
+                    active_products_count=F('active_products_count') + amount
+                )
+        for obj in objs:
+            obj._counted_state = obj.counter_state()
+        bump_version('product')
+        return created
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        fields = list(fields)
+        # Como auto_now, igual que update()
+        now = timezone.now()
+        for obj in objs:
+            obj.updated_at = now
+        if 'updated_at' not in fields:
+            fields.append('updated_at')
+        if PRICING_SOURCE_FIELDS.intersection(fields):
+            for obj in objs:
+                obj.update_pricing()
+            fields += [name for name in PRICING_STORED_FIELDS if name not in fields]
+        if CONTENT_HASH_SOURCE_FIELDS.intersection(fields):
+            for obj in objs:
+                obj.content_hash = obj.compute_content_hash()
+            if 'content_hash' not in fields:
+                fields.append('content_hash')
+        # Con el QuerySet base: su update() por lote no debe repetir precios, contadores ni versión
+        rows = models.QuerySet(self.model, using=self._db).bulk_update(objs, fields, *args, **kwargs)
+        if 'stock' in fields:
+            from .inventory import split_stock
+            for obj in objs:
+                if obj.stock_changed():
+                    split_stock(obj, obj.stock_shards)
+                obj._loaded_stock = obj.stock
+        if CATEGORY_COUNTER_FIELDS.intersection(fields):
+            # Solo las categorías de los productos que cambiaron de categoría o de estado
+            category_ids = set()
+            for obj in objs:
+                if obj._counted_state != obj.counter_state():
+                    category_ids.update([obj._counted_state[0], obj.category_id])
+                obj._counted_state = obj.counter_state()
+            category_ids.discard(None)
+            if category_ids:
+                Category.objects.filter(id__in=category_ids).refresh_products_count()
+        bump_version('product')
+        return rows
+
+    def refresh_pricing(self):
+        """Recalcular las columnas de precio almacenadas con un solo UPDATE"""
+        rows = super().update(**pricing_expressions())
+        bump_version('product')
+        return rows
+
+
+class CategoryQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        kwargs.setdefault('updated_at', timezone.now())
+        rows = super().update(**kwargs)
+        bump_version('category')
+        return rows
+
+    def refresh_products_count(self):
+        """Recontar los productos activos de estas categorías con un solo UPDATE"""
+        active_products = Product.objects.filter(
+            category=OuterRef('pk'), is_active=True
+        ).order_by().values('category').annotate(total=Count('id')).values('total')
+        return self.update(active_products_count=Coalesce(Subquery(active_products), 0))
+
 
 class Category(models.Model):
     name = models.CharField(max_length=255, unique=True)
     slug = models.SlugField(max_length=255, unique=True)
     description = models.TextField(blank=True)
     image_url = models.URLField(blank=True, null=True)
+    # Contador mantenido de productos activos (ver products.signals)
+    active_products_count = models.PositiveIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = CategoryQuerySet.as_manager()
+
     class Meta:
         verbose_name_plural = 'Categories'
         ordering = ['name']
@@ -27,8 +247,21 @@ class Product(models.Model):
     description = models.TextField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
     discount_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    # Columnas derivadas de price/discount_price, almacenadas para poder filtrar y ordenar en SQL
+    final_price = models.DecimalField(max_digits=10, decimal_places=2, default=0, editable=False)
+    discount_percentage = models.PositiveSmallIntegerField(default=0, editable=False)
+    # Huella de CONTENT_HASH_FIELDS: la sincronización de catálogo solo reescribe lo que cambió
+    content_hash = models.CharField(max_length=32, blank=True, default='', editable=False)
+    # Huella de nombre, descripción y categoría del último cálculo de similares (ver products.similarity)
+    similarity_hash = models.CharField(max_length=32, blank=True, default='', editable=False)
     image_url = models.URLField(blank=True, null=True)
     stock = models.PositiveIntegerField(default=0)
+    # Stock que trajo la última importación de catálogo: si el archivo no lo cambia, no se pisan las ventas
+    imported_stock = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    # Unidades retenidas por carritos (ver cart.reservations): disponible = stock - reserved_stock
+    reserved_stock = models.PositiveIntegerField(default=0, editable=False)
+    # Contadores StockShard en los que se reparte el stock (ver products.inventory); 0: el stock vive en esta fila
+    stock_shards = models.PositiveSmallIntegerField(default=0, editable=False)
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, related_name='products')
     seller = models.ForeignKey(User, on_delete=models.CASCADE, related_name='products_sold', null=True, blank=True)
     is_featured = models.BooleanField(default=False)
@@ -36,27 +269,90 @@ class Product(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ProductQuerySet.as_manager()
+
+    # (category_id, is_active) tal como está contado en la base de datos
+    _counted_state = (None, False)
+    # Stock leído de la base de datos: si cambia, se reparte de nuevo entre los contadores
+    _loaded_stock = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._counted_state = (instance.__dict__.get('category_id'), instance.__dict__.get('is_active', False))
+        instance._loaded_stock = instance.__dict__.get('stock')
+        return instance
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._counted_state = self.counter_state()
+        self._loaded_stock = self.__dict__.get('stock')
+
+    def stock_changed(self):
+        """Si se asignó un stock nuevo a un producto con contadores (hay que repartirlo)"""
+        return bool(self.stock_shards) and self._loaded_stock is not None and self.stock != self._loaded_stock
+
+    def counter_state(self):
+        return (self.category_id, self.is_active)
+
     def save(self, *args, **kwargs):
         if not self.slug:
             from django.utils.text import slugify
             self.slug = slugify(self.name)
+        self.update_pricing()
+        self.content_hash = self.compute_content_hash()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            if PRICING_SOURCE_FIELDS.intersection(update_fields):
+                update_fields |= set(PRICING_STORED_FIELDS)
+            if CONTENT_HASH_SOURCE_FIELDS.intersection(update_fields):
+                update_fields.add('content_hash')
+            kwargs['update_fields'] = update_fields
         super().save(*args, **kwargs)
+        if self.stock_changed() and (update_fields is None or 'stock' in update_fields):
+            from .inventory import split_stock
+            split_stock(self, self.stock_shards)
+            self.__dict__.pop('live_stock', None)
+        self._loaded_stock = self.stock
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        if update_fields is None:
+            # reserved_stock lo cambian las reservas con UPDATE atómicos: un save completo no lo pisa
+            # (si la fila no existe, el INSERT posterior lo incluye como siempre)
+            values = [value for value in values if value[0].name != 'reserved_stock']
+        return super()._do_update(base_qs, using, pk_val, values, update_fields, forced_update)
 
     class Meta:
         ordering = ['-created_at']
         indexes = [
-            models.Index(fields=['category', 'is_active']),
+            models.Index(fields=['category', 'is_active', 'final_price']),
             models.Index(fields=['is_featured', 'is_active']),
             models.Index(fields=['seller', 'is_active']),
+            models.Index(fields=['is_active', 'final_price']),
+            # Índices para la paginación por cursor sobre (created_at, id)
+            models.Index(fields=['is_active', 'created_at', 'id']),
+            models.Index(fields=['category', 'is_active', 'created_at', 'id']),
+            models.Index(fields=['seller', 'created_at', 'id']),
         ]
 
     def __str__(self):
         return self.name
 
-    @property
-    def final_price(self):
-        """Retorna el precio final (con descuento si existe)"""
-        return self.discount_price if self.discount_price else self.price
+    def compute_content_hash(self):
+        return content_hash({name: getattr(self, name) for name in CONTENT_HASH_FIELDS})
+
+    def update_pricing(self):
+        """Recalcula final_price y discount_percentage a partir de los precios"""
+        price = Decimal(str(self.price))
+        discount_price = None if self.discount_price is None else Decimal(str(self.discount_price))
+        # Precio final (con descuento si existe)
+        self.final_price = discount_price if discount_price else price
+        # Porcentaje de descuento
+        if discount_price is not None and discount_price < price:
+            self.discount_percentage = int(((price - discount_price) / price) * 100)
+        else:
+            self.discount_percentage = 0
 
     @property
     def has_discount(self):
@@ -64,13 +360,66 @@ class Product(models.Model):
         return self.discount_price is not None and self.discount_price < self.price
 
     @property
-    def discount_percentage(self):
-        """Calcula el porcentaje de descuento"""
-        if self.has_discount:
-            return int(((self.price - self.discount_price) / self.price) * 100)
-        return 0
+    def current_stock(self):
+        """Stock real: con contadores, su suma (Product.stock se sincroniza periódicamente)"""
+        if not self.stock_shards:
+            return self.stock
+        if 'live_stock' in self.__dict__:
+            return self.live_stock
+        return self.shards.aggregate(total=Sum('quantity'))['total'] or 0
 
     def is_available(self, quantity=1):
-        """Verifica si hay stock disponible"""
-        return self.stock >= quantity and self.is_active
+        """Verifica si hay stock disponible (sin contar lo retenido por carritos)"""
+        return self.available_stock >= quantity and self.is_active
+
+    @property
+    def available_stock(self):
+        """Stock que no está retenido por ningún carrito (con CART_RESERVATIONS)"""
+        if not getattr(settings, 'CART_RESERVATIONS', False):
+            return self.current_stock
+        return max(self.current_stock - self.reserved_stock, 0)
+
+
+class StockShard(models.Model):
+    """Parte del stock de un producto muy vendido: cada compra descuenta de una al azar"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='shards')
+    shard = models.PositiveSmallIntegerField()
+    quantity = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['product', 'shard']
+        unique_together = ['product', 'shard']
+
+    def __str__(self):
+        return f"{self.product} #{self.shard}: {self.quantity}"
+
+
+class ProductRecommendation(models.Model):
+    """Vecinos precalculados de un producto (top-K), servidos con una consulta indexada"""
+    KIND_BOUGHT_TOGETHER = 'bought_together'
+    KIND_SIMILAR = 'similar'
+    KIND_SIMILAR_CATEGORY = 'similar_category'
+    KIND_CHOICES = [
+        (KIND_BOUGHT_TOGETHER, 'Comprados juntos'),
+        (KIND_SIMILAR, 'Similares'),
+        (KIND_SIMILAR_CATEGORY, 'Similares en la categoría'),
+    ]
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='recommendations')
+    recommended = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='recommended_for')
+    kind = models.CharField(max_length=30, choices=KIND_CHOICES, default=KIND_BOUGHT_TOGETHER)
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+    # Inicio del cálculo que generó la fila: sirve de marca para las reconstrucciones incrementales
+    computed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['product', 'kind', 'rank']
+        unique_together = ['product', 'kind', 'recommended']
+        indexes = [
+            models.Index(fields=['product', 'kind', 'rank']),
+        ]
+
+    def __str__(self):
+        return f"{self.product} -> {self.recommended} ({self.get_kind_display()} #{self.rank})"
 
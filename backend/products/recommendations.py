@@ -0,0 +1,166 @@
+"""
+Recomendaciones "comprados juntos" a partir del historial de compras.
+
+La matriz de co-compras producto x producto se calcula en la base de datos
+con un self-join de PurchaseItem agrupado por pares (equivalente a A^T A
+sobre la matriz dispersa compra x producto). Para cada producto se guardan
+los K vecinos con mayor similitud coseno en ProductRecommendation.
+"""
+import heapq
+import math
+import time
+
+from django.apps import apps
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from .cache import bump_version
+from .models import ProductRecommendation
+
+CHUNK_SIZE = 500
+
+
+def chunks(values, size=CHUNK_SIZE):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def purchase_counts(cursor, table):
+    """Cantidad de compras distintas en las que aparece cada producto"""
+    cursor.execute(
+        f'SELECT product_id, COUNT(DISTINCT purchase_id) FROM {table} '
+        f'WHERE product_id IS NOT NULL GROUP BY product_id'
+    )
+    return dict(cursor.fetchall())
+
+
+def co_purchase_pairs(cursor, table, product_ids=None):
+    """Iterar (producto, vecino, compras en común) ordenado por producto"""
+    sql = (
+        f'SELECT a.product_id, b.product_id, COUNT(DISTINCT a.purchase_id) '
+        f'FROM {table} a JOIN {table} b '
+        f'ON a.purchase_id = b.purchase_id AND a.product_id <> b.product_id '
+        f'WHERE a.product_id IS NOT NULL AND b.product_id IS NOT NULL '
+    )
+    batches = [None] if product_ids is None else list(chunks(sorted(product_ids)))
+    for batch in batches:
+        params = []
+        batch_sql = sql
+        if batch is not None:
+            batch_sql += f'AND a.product_id IN ({", ".join(["%s"] * len(batch))}) '
+            params = batch
+        cursor.execute(batch_sql + 'GROUP BY a.product_id, b.product_id ORDER BY a.product_id', params)
+        while True:
+            rows = cursor.fetchmany(5000)
+            if not rows:
+                break
+            yield from rows
+
+
+def top_neighbours(pairs, counts, top_k):
+    """Agrupar los pares por producto y quedarse con los top_k por similitud coseno"""
+    current, heap = None, []
+    for product_id, other_id, together in pairs:
+        if product_id != current:
+            if current is not None:
+                yield current, sorted(heap, reverse=True)
+            current, heap = product_id, []
+        score = together / math.sqrt(counts[product_id] * counts[other_id])
+        item = (score, together, -other_id)
+        if len(heap) < top_k:
+            heapq.heappush(heap, item)
+        else:
+            heapq.heappushpop(heap, item)
+    if current is not None:
+        yield current, sorted(heap, reverse=True)
+
+
+def last_build_time(kind=ProductRecommendation.KIND_BOUGHT_TOGETHER):
+    return ProductRecommendation.objects.filter(kind=kind).aggregate(last=Max('computed_at'))['last']
+
+
+def changed_products_since(since):
+    """Productos que aparecen en compras creadas después de ``since``"""
+    PurchaseItem = apps.get_model('purchases', 'PurchaseItem')
+    return set(
+        PurchaseItem.objects.filter(purchase__created_at__gt=since, product__isnull=False)
+        .values_list('product_id', flat=True).distinct()
+    )
+
+
+def co_purchased_with(cursor, table, product_ids):
+    """Productos que alguna vez se compraron junto con alguno de ``product_ids``"""
+    partners = set()
+    for batch in chunks(sorted(product_ids)):
+        cursor.execute(
+            f'SELECT DISTINCT b.product_id FROM {table} a JOIN {table} b '
+            f'ON a.purchase_id = b.purchase_id AND a.product_id <> b.product_id '
+            f'WHERE b.product_id IS NOT NULL AND a.product_id IN ({", ".join(["%s"] * len(batch))})',
+            batch,
+        )
+        partners.update(product_id for product_id, in cursor.fetchall())
+    return partners
+
+
+def build_bought_together(top_k=10, incremental=False):
+    """
+    Reconstruir las recomendaciones "comprados juntos".
+
+    En modo incremental se recalculan los productos que aparecen en compras
+    posteriores al último cálculo y los que alguna vez se compraron con
+    ellos: la similitud se normaliza por la cantidad de compras de cada
+    producto del par, así que al cambiar esa cantidad cambian también los
+    puntajes de sus vecinos. Los demás productos no tienen pares afectados.
+    Devuelve un diccionario con los tiempos de cada fase.
+    """
+    PurchaseItem = apps.get_model('purchases', 'PurchaseItem')
+    table = PurchaseItem._meta.db_table
+    kind = ProductRecommendation.KIND_BOUGHT_TOGETHER
+    timings = {}
+    computed_at = timezone.now()
+
+    start = time.perf_counter()
+    product_ids = None
+    if incremental:
+        since = last_build_time(kind)
+        if since is not None:
+            product_ids = changed_products_since(since)
+    timings['scope'] = time.perf_counter() - start
+
+    if product_ids is not None and not product_ids:
+        return {'products': 0, 'rows': 0, 'timings': timings}
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        if product_ids is not None:
+            start = time.perf_counter()
+            product_ids |= co_purchased_with(cursor, table, product_ids)
+            timings['scope'] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        counts = purchase_counts(cursor, table)
+        timings['counts'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        rows, products = [], set()
+        for product_id, neighbours in top_neighbours(co_purchase_pairs(cursor, table, product_ids), counts, top_k):
+            products.add(product_id)
+            for rank, (score, _, negative_id) in enumerate(neighbours, start=1):
+                rows.append(ProductRecommendation(
+                    product_id=product_id, recommended_id=-negative_id, kind=kind, rank=rank, score=score,
+                    computed_at=computed_at,
+                ))
+        timings['matrix'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        existing = ProductRecommendation.objects.filter(kind=kind)
+        if product_ids is None:
+            existing.delete()
+        else:
+            for batch in chunks(product_ids | products):
+                existing.filter(product_id__in=batch).delete()
+        ProductRecommendation.objects.bulk_create(rows, batch_size=1000)
+        timings['write'] = time.perf_counter() - start
+
+    bump_version('recommendation')
+    return {'products': len(products), 'rows': len(rows), 'timings': timings}
@@ -0,0 +1,153 @@
+"""
+Backends de búsqueda de texto completo para el catálogo de productos.
+
+El backend activo se elige con ``PRODUCT_SEARCH_BACKEND`` en settings.
+Por defecto se usa un índice FTS5 de SQLite; para otras bases de datos
+se cae a ``LikeSearchBackend`` (el comportamiento anterior con icontains).
+
+FTS5 busca cada término como prefijo de una palabra ("wid" encuentra
+"Widget", "idget" no). Para no perder las búsquedas por subcadena del
+SearchFilter anterior, si el índice no devuelve nada se repite la búsqueda
+con icontains.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils.module_loading import import_string
+
+DEFAULT_SEARCH_BACKEND = 'products.search.SQLiteFTS5Backend'
+
+TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+
+class BaseSearchBackend:
+    """Interfaz común para los backends de búsqueda de productos"""
+
+    def is_supported(self):
+        """Indica si el backend puede usarse con la base de datos actual"""
+        return True
+
+    def search(self, queryset, query):
+        """Filtrar el queryset por el texto buscado y anotar ``search_rank``"""
+        raise NotImplementedError
+
+    def order_by_rank(self, queryset):
+        """Ordenar los resultados de ``search`` por relevancia"""
+        return queryset
+
+    def index_product(self, product):
+        """Agregar o actualizar un producto en el índice"""
+
+    def index_products(self, product_ids):
+        """Reindexar en bloque los productos indicados"""
+
+    def remove_product(self, product_id):
+        """Eliminar un producto del índice"""
+
+    def rebuild(self):
+        """Reconstruir el índice completo a partir de la tabla de productos"""
+
+
+class LikeSearchBackend(BaseSearchBackend):
+    """Búsqueda con LIKE '%term%' (equivalente al SearchFilter de DRF)"""
+
+    def search(self, queryset, query):
+        terms = TERM_RE.findall(query)
+        for term in terms:
+            queryset = queryset.filter(Q(name__icontains=term) | Q(description__icontains=term))
+        return queryset
+
+
+class SQLiteFTS5Backend(BaseSearchBackend):
+    """Índice FTS5 de SQLite sincronizado con la tabla de productos"""
+
+    table = 'products_product_fts'
+    # Pesos de bm25 por columna: una coincidencia en el nombre vale más
+    name_weight = 10.0
+    description_weight = 1.0
+
+    def is_supported(self):
+        return connection.vendor == 'sqlite'
+
+    def build_match(self, query):
+        """Convertir el texto del usuario en una expresión MATCH segura"""
+        terms = TERM_RE.findall(query.lower())
+        # Cada término se cita para evitar errores de sintaxis FTS5 y se
+        # busca por prefijo; las subcadenas las cubre el respaldo de search()
+        return ' '.join(f'"{term}"*' for term in terms)
+
+    def search(self, queryset, query):
+        match = self.build_match(query)
+        if not match:
+            return queryset
+        table = self.table
+        # JOIN directo con la tabla FTS: una sola búsqueda en el índice por consulta
+        results = queryset.extra(
+            tables=[table],
+            where=[f'{table}.rowid = products_product.id', f'{table} MATCH %s'],
+            params=[match],
+            select={'search_rank': f'bm25({table}, {self.name_weight}, {self.description_weight})'},
+        )
+        if not results.exists():
+            # Sin coincidencias por prefijo: probar por subcadena como el
+            # SearchFilter anterior ("idget" -> "Widget"), sin ranking
+            return LikeSearchBackend().search(queryset, query)
+        return results
+
+    def order_by_rank(self, queryset):
+        if 'search_rank' not in queryset.query.extra:
+            return queryset
+        return queryset.order_by('search_rank', '-created_at')
+
+    def index_product(self, product):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid = %s', [product.pk])
+            cursor.execute(
+                f'INSERT INTO {self.table} (rowid, name, description) VALUES (%s, %s, %s)',
+                [product.pk, product.name, product.description]
+            )
+
+    def index_products(self, product_ids):
+        product_ids = list(product_ids)
+        if not product_ids:
+            return
+        with connection.cursor() as cursor:
+            # SQLite limita el número de parámetros por sentencia
+            for start in range(0, len(product_ids), 500):
+                chunk = product_ids[start:start + 500]
+                placeholders = ', '.join(['%s'] * len(chunk))
+                cursor.execute(f'DELETE FROM {self.table} WHERE rowid IN ({placeholders})', chunk)
+                cursor.execute(
+                    f'INSERT INTO {self.table} (rowid, name, description) '
+                    f'SELECT id, name, description FROM products_product WHERE id IN ({placeholders})',
+                    chunk
+                )
+
+    def remove_product(self, product_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid = %s', [product_id])
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+            cursor.execute(
+                f'INSERT INTO {self.table} (rowid, name, description) '
+                f'SELECT id, name, description FROM products_product'
+            )
+
+
+_backend = None
+
+
+def get_search_backend():
+    """Obtener la instancia del backend configurado (o el de LIKE si no es compatible)"""
+    global _backend
+    if _backend is None:
+        path = getattr(settings, 'PRODUCT_SEARCH_BACKEND', DEFAULT_SEARCH_BACKEND)
+        backend = import_string(path)()
+        if not backend.is_supported():
+            backend = LikeSearchBackend()
+        _backend = backend
+    return _backend
@@ -1,21 +1,20 @@
+from decimal import Decimal
 from rest_framework import serializers
+from ecommerce.serializers import SparseFieldsetMixin
 from .models import Product, Category
 
 
-class CategorySerializer(serializers.ModelSerializer):
-    products_count = serializers.SerializerMethodField()
+class CategorySerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    # Contador mantenido en la categoría: no requiere consultas por fila
+    products_count = serializers.IntegerField(source='active_products_count', read_only=True)
 
     class Meta:
         model = Category
         fields = ['id', 'name', 'slug', 'description', 'image_url', 'products_count', 'created_at', 'updated_at']
         read_only_fields = ['id', 'created_at', 'updated_at']
-    
-    def get_products_count(self, obj):
-        """Obtener el conteo de productos activos en la categoría"""
-        return obj.products.filter(is_active=True).count()
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     category = CategorySerializer(read_only=True)
     category_id = serializers.IntegerField(write_only=True, required=False, allow_null=True)
     seller_email = serializers.EmailField(source='seller.email', read_only=True)
@@ -23,18 +22,54 @@ class ProductSerializer(serializers.ModelSerializer):
     has_discount = serializers.BooleanField(read_only=True)
     discount_percentage = serializers.IntegerField(read_only=True)
     is_available = serializers.BooleanField(read_only=True)
+    # Stock menos lo retenido por carritos (igual a stock sin CART_RESERVATIONS)
+    available_stock = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = Product
         fields = [
             'id', 'name', 'slug', 'description', 'price', 'discount_price',
             'final_price', 'has_discount', 'discount_percentage',
-            'image_url', 'stock', 'category', 'category_id',
+            'image_url', 'stock', 'available_stock', 'category', 'category_id',
             'seller', 'seller_email', 'is_featured', 'is_active', 'is_available',
             'created_at', 'updated_at'
         ]
         read_only_fields = ['id', 'created_at', 'updated_at', 'is_active', 'seller']
+        # Representación compacta para grillas y listados (?view=full para la completa)
+        fieldsets = {
+            'card': [
+                'id', 'name', 'slug', 'description', 'price', 'final_price', 'has_discount',
+                'discount_percentage', 'image_url', 'stock', 'available_stock', 'is_available',
+            ],
+            # Lo que cambia la edición en bloque de "mis productos"
+            'pricing': [
+                'id', 'price', 'discount_price', 'final_price', 'has_discount',
+                'discount_percentage', 'stock', 'available_stock', 'is_available', 'is_featured', 'updated_at',
+            ],
+        }
+
+    @staticmethod
+    def related_fields(wants, prefix=''):
+        """(select_related, defer) según los campos pedidos; ``prefix`` si el producto va anidado"""
+        related = [relation for relation, field in (('category', 'category'), ('seller', 'seller_email'))
+                   if wants(prefix + field)]
+        deferred = [] if wants(prefix + 'description') else ['description']
+        return related, deferred
+
+    def prepare_queryset(self, queryset):
+        related, deferred = self.related_fields(self.wants)
+        queryset = queryset.select_related(None)
+        if related:
+            queryset = queryset.select_related(*related)
+        return queryset.defer(*deferred) if deferred else queryset
     
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if 'stock' in data:
+            # Con contadores (products.inventory) la columna se sincroniza periódicamente
+            data['stock'] = instance.current_stock
+        return data
+
     def validate_category_id(self, value):
         """Validar que la categoría existe si se proporciona"""
         if value is not None:
@@ -101,3 +136,80 @@ class ProductSerializer(serializers.ModelSerializer):
         
         # Actualizar el producto
         return super().update(instance, validated_data)
+
+
+# Edición en bloque: máximo de productos por petición y por UPDATE
+BULK_MAX_ITEMS = 1000
+BULK_BATCH_SIZE = 500
+
+
+class ProductBulkItemSerializer(serializers.Serializer):
+    """Cambio de un producto en la edición en bloque"""
+    BULK_FIELDS = ['price', 'discount_price', 'stock', 'is_featured']
+
+    id = serializers.IntegerField()
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0.01'), required=False)
+    discount_price = serializers.DecimalField(
+        max_digits=10, decimal_places=2, min_value=Decimal('0'), required=False, allow_null=True
+    )
+    stock = serializers.IntegerField(min_value=0, required=False)
+    is_featured = serializers.BooleanField(required=False)
+
+    def validate(self, attrs):
+        if not any(name in attrs for name in self.BULK_FIELDS):
+            raise serializers.ValidationError(
+                f'Indique al menos uno de: {", ".join(self.BULK_FIELDS)}.'
+            )
+        return attrs
+
+
+class ProductBulkUpdateSerializer(serializers.Serializer):
+    """
+    Cambios de precio, stock y destacado para varios productos del vendedor.
+
+    Todo o nada: los errores se devuelven por ítem en ``items`` (una entrada
+    por cambio, vacía si ese cambio es válido) y no se aplica ninguno. Los
+    cambios válidos se escriben con bulk_update, un UPDATE cada
+    BULK_BATCH_SIZE productos.
+    """
+    items = ProductBulkItemSerializer(many=True, allow_empty=False, max_length=BULK_MAX_ITEMS)
+
+    def validate_items(self, items):
+        errors = [{} for _ in items]
+        seen = set()
+        for index, item in enumerate(items):
+            if item['id'] in seen:
+                errors[index]['id'] = ['Producto repetido en la petición.']
+            seen.add(item['id'])
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return items
+
+    def create(self, validated_data):
+        """Aplicar los cambios (llamar dentro de una transacción); devuelve los productos"""
+        items = validated_data['items']
+        # Bloqueados hasta el final de la transacción: la validación cruzada usa estos valores
+        products = Product.objects.select_for_update().filter(
+            seller=self.context['request'].user, id__in=[item['id'] for item in items]
+        ).in_bulk()
+
+        errors = [{} for _ in items]
+        fields = []
+        for index, item in enumerate(items):
+            product = products.get(item['id'])
+            if product is None:
+                errors[index]['id'] = ['No existe un producto tuyo con este ID.']
+                continue
+            for name in ProductBulkItemSerializer.BULK_FIELDS:
+                if name in item:
+                    setattr(product, name, item[name])
+                    if name not in fields:
+                        fields.append(name)
+            if product.discount_price is not None and product.discount_price >= product.price:
+                errors[index]['discount_price'] = ['El precio con descuento debe ser menor que el precio normal.']
+        if any(errors):
+            raise serializers.ValidationError({'items': errors})
+
+        changed = [products[item['id']] for item in items]
+        Product.objects.bulk_update(changed, fields, batch_size=BULK_BATCH_SIZE)
+        return changed
@@ -0,0 +1,59 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .cache import bump_version
+from .models import Category, Product
+from .search import get_search_backend
+
+
+def refresh_category_counts(*category_ids):
+    """Recontar los productos activos de las categorías indicadas"""
+    category_ids = {category_id for category_id in category_ids if category_id}
+    if category_ids:
+        Category.objects.filter(pk__in=category_ids).refresh_products_count()
+
+
+@receiver(post_save, sender=Product)
+def index_product_on_save(sender, instance, raw=False, **kwargs):
+    """Mantener el índice de búsqueda sincronizado al guardar un producto"""
+    if raw:
+        return
+    get_search_backend().index_product(instance)
+
+
+@receiver(post_delete, sender=Product)
+def remove_product_from_index(sender, instance, **kwargs):
+    """Eliminar el producto del índice de búsqueda al borrarlo"""
+    get_search_backend().remove_product(instance.pk)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_cache(sender, **kwargs):
+    """Invalidar las respuestas cacheadas que incluyen productos"""
+    bump_version('product')
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_cache(sender, **kwargs):
+    """Invalidar las respuestas cacheadas que incluyen categorías"""
+    bump_version('category')
+
+
+@receiver(post_save, sender=Product)
+def update_category_count_on_save(sender, instance, raw=False, **kwargs):
+    """Actualizar el contador de productos activos al crear, activar o recategorizar"""
+    if raw:
+        return
+    old_state, new_state = instance._counted_state, instance.counter_state()
+    if old_state != new_state:
+        # Se recuenta en vez de sumar/restar para que el contador no acumule desvíos
+        refresh_category_counts(old_state[0], new_state[0])
+        instance._counted_state = new_state
+
+
+@receiver(post_delete, sender=Product)
+def update_category_count_on_delete(sender, instance, **kwargs):
+    """Descontar el producto de su categoría al borrarlo"""
+    refresh_category_counts(instance._counted_state[0], instance.category_id)
+    instance._counted_state = (None, False)
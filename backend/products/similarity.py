@@ -0,0 +1,277 @@
+"""
+Productos similares por contenido (TF-IDF sobre nombre y descripción).
+
+Los textos se vectorizan con hashing de términos (no hace falta guardar un
+vocabulario), ponderación TF-IDF y normalización L2, en una matriz dispersa
+de SciPy. La similitud coseno es el producto X[filas] @ X.T, calculado por
+bloques para acotar la memoria. Se guardan los top-K vecinos de cada
+producto en ProductRecommendation: globales y dentro de su categoría.
+
+El modo incremental vectoriza el catálogo (costo lineal) pero solo calcula
+similitudes para los productos cuyo texto cambió y para los que los tenían,
+o deberían tenerlos, entre sus vecinos. El cambio se detecta con una huella
+de nombre, descripción y categoría (Product.similarity_hash, la del último
+cálculo), no con updated_at: las ventas y cambios de precio no cuentan.
+"""
+import hashlib
+import math
+import re
+import time
+import unicodedata
+import zlib
+from collections import Counter
+
+import numpy as np
+from scipy import sparse
+
+from django.db import models, transaction
+from django.db.models import Count, Max, Min
+from django.utils import timezone
+from .cache import bump_version
+from .models import Product, ProductRecommendation
+
+N_FEATURES = 2 ** 18
+NAME_WEIGHT = 2
+MAX_DF = 0.1
+MAX_TERMS = 32
+CHUNK_SIZE = 256
+
+TOKEN_RE = re.compile(r'[a-z0-9]{2,}')
+STOPWORDS = {
+    'de', 'la', 'el', 'en', 'con', 'para', 'por', 'los', 'las', 'del', 'un', 'una', 'y', 'o',
+    'al', 'es', 'se', 'su', 'sus', 'que', 'mas', 'muy', 'sin', 'lo', 'le', 'the', 'and', 'for', 'with',
+}
+
+KINDS = {
+    'global': ProductRecommendation.KIND_SIMILAR,
+    'category': ProductRecommendation.KIND_SIMILAR_CATEGORY,
+}
+
+
+def tokenize(text):
+    """Minúsculas, sin tildes y sin palabras vacías"""
+    text = unicodedata.normalize('NFKD', text or '').encode('ascii', 'ignore').decode().lower()
+    return [token for token in TOKEN_RE.findall(text) if token not in STOPWORDS and not token.isdigit()]
+
+
+def feature(token):
+    return zlib.crc32(token.encode()) % N_FEATURES
+
+
+def vectorize(documents):
+    """
+    Matriz TF-IDF dispersa (una fila por documento, normalizada en L2).
+
+    ``documents`` es una lista de (nombre, descripción).
+    """
+    rows, cols, values = [], [], []
+    for row, (name, description) in enumerate(documents):
+        counts = Counter()
+        for token in tokenize(name):
+            counts[feature(token)] += NAME_WEIGHT
+        for token in tokenize(description):
+            counts[feature(token)] += 1
+        for col, count in counts.items():
+            rows.append(row)
+            cols.append(col)
+            values.append(1.0 + math.log(count))
+
+    n_docs = len(documents)
+    matrix = sparse.csr_matrix(
+        (np.asarray(values, dtype=np.float32), (np.asarray(rows), np.asarray(cols))),
+        shape=(n_docs, N_FEATURES),
+    )
+    if not n_docs:
+        return matrix
+
+    df = np.bincount(matrix.indices, minlength=N_FEATURES)
+    idf = np.log((1 + n_docs) / (1 + df)) + 1
+    # Términos demasiado comunes no discriminan y densifican el producto X @ X.T
+    if n_docs >= 50:
+        idf[df > MAX_DF * n_docs] = 0
+    matrix = sparse.csr_matrix(matrix.dot(sparse.diags(idf.astype(np.float32))))
+    matrix.eliminate_zeros()
+    matrix = keep_top_terms(matrix, MAX_TERMS)
+
+    norms = np.sqrt(np.asarray(matrix.power(2).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return sparse.csr_matrix(sparse.diags((1 / norms).astype(np.float32)).dot(matrix))
+
+
+def keep_top_terms(matrix, limit):
+    """Conservar los ``limit`` términos de mayor peso por fila (acota el costo de X @ X.T)"""
+    lengths = np.diff(matrix.indptr)
+    if not len(lengths) or lengths.max() <= limit:
+        return matrix
+    keep = np.ones(matrix.nnz, dtype=bool)
+    for row in np.nonzero(lengths > limit)[0]:
+        begin, end = matrix.indptr[row], matrix.indptr[row + 1]
+        weakest = np.argpartition(matrix.data[begin:end], end - begin - limit)[:end - begin - limit]
+        keep[begin + weakest] = False
+    matrix.data = np.where(keep, matrix.data, 0).astype(matrix.data.dtype)
+    matrix.eliminate_zeros()
+    return matrix
+
+
+def top_k(similarities, positions, top):
+    """Índices y puntajes de los ``top`` mayores de una fila dispersa"""
+    if len(similarities) > top:
+        best = np.argpartition(-similarities, top)[:top]
+        positions, similarities = positions[best], similarities[best]
+    order = np.argsort(-similarities, kind='stable')
+    return positions[order], similarities[order]
+
+
+def neighbours(matrix, categories, row_indexes, top):
+    """Generar (fila, vecinos globales, vecinos de la misma categoría) por bloques"""
+    transposed = matrix.T.tocsr()
+    for start in range(0, len(row_indexes), CHUNK_SIZE):
+        chunk = row_indexes[start:start + CHUNK_SIZE]
+        scores = sparse.csr_matrix(matrix[chunk].dot(transposed))
+        for offset, row in enumerate(chunk):
+            begin, end = scores.indptr[offset], scores.indptr[offset + 1]
+            positions, values = scores.indices[begin:end], scores.data[begin:end]
+            keep = (positions != row) & (values > 0)
+            positions, values = positions[keep], values[keep]
+
+            same = categories[positions] == categories[row]
+            if categories[row] < 0:
+                same[:] = False
+            yield (
+                row,
+                top_k(values, positions, top),
+                top_k(values[same], positions[same], top),
+            )
+
+
+def text_hash(name, description, category_id):
+    """Huella de lo que determina los similares de un producto"""
+    return hashlib.md5(f'{name}\x1f{description}\x1f{category_id or ""}'.encode()).hexdigest()
+
+
+def load_catalog():
+    """
+    ids, categorías (-1 si no tiene) y textos de todos los productos, más
+    ``{id: huella}`` de los que cambiaron desde el último cálculo
+    """
+    rows = list(Product.objects.order_by('id').values_list(
+        'id', 'category_id', 'name', 'description', 'similarity_hash'
+    ))
+    ids = np.asarray([row[0] for row in rows], dtype=np.int64)
+    categories = np.asarray([row[1] if row[1] is not None else -1 for row in rows], dtype=np.int64)
+    documents = [(row[2], row[3]) for row in rows]
+    changed = {}
+    for product_id, category_id, name, description, stored in rows:
+        current = text_hash(name, description, category_id)
+        if current != stored:
+            changed[product_id] = current
+    return ids, categories, documents, changed
+
+
+def save_text_hashes(changed):
+    """Guardar las huellas calculadas (QuerySet base: no es un cambio del producto, sin updated_at ni caché)"""
+    products = [Product(id=product_id, similarity_hash=value) for product_id, value in changed.items()]
+    models.QuerySet(Product).bulk_update(products, ['similarity_hash'], batch_size=1000)
+
+
+def recommendation_rows(ids, results, computed_at):
+    rows = []
+    for row, global_neighbours, category_neighbours in results:
+        for kind, (positions, scores) in (
+            (KINDS['global'], global_neighbours),
+            (KINDS['category'], category_neighbours),
+        ):
+            for rank, (position, score) in enumerate(zip(positions, scores), start=1):
+                rows.append(ProductRecommendation(
+                    product_id=int(ids[row]), recommended_id=int(ids[position]), kind=kind,
+                    rank=rank, score=float(score), computed_at=computed_at,
+                ))
+    return rows
+
+
+def affected_rows(matrix, ids, index_of, changed_rows, top):
+    """
+    Filas cuyo top-K puede cambiar por los productos modificados: las que ya
+    los tenían como vecinos y las que tienen un puntaje mayor a su K-ésimo.
+    """
+    changed_ids = [int(ids[row]) for row in changed_rows]
+    kinds = list(KINDS.values())
+    affected = set(
+        ProductRecommendation.objects.filter(kind__in=kinds, recommended_id__in=changed_ids)
+        .values_list('product_id', flat=True)
+    )
+
+    # Puntaje mínimo para entrar en alguna de las listas de cada producto
+    thresholds = {}
+    for product_id, lowest, total in (
+        ProductRecommendation.objects.filter(kind__in=kinds)
+        .values('product_id', 'kind').annotate(lowest=Min('score'), total=Count('id'))
+        .values_list('product_id', 'lowest', 'total')
+    ):
+        threshold = lowest if total >= top else 0.0
+        thresholds[product_id] = min(threshold, thresholds.get(product_id, threshold))
+
+    scores = sparse.csr_matrix(matrix[changed_rows].dot(matrix.T.tocsr()))
+    scores.eliminate_zeros()
+    for position, value in zip(scores.indices, scores.data):
+        product_id = int(ids[position])
+        if value > thresholds.get(product_id, 0.0):
+            affected.add(product_id)
+
+    affected.update(changed_ids)
+    return sorted(index_of[product_id] for product_id in affected if product_id in index_of)
+
+
+def last_build_time():
+    return ProductRecommendation.objects.filter(kind=KINDS['global']).aggregate(last=Max('computed_at'))['last']
+
+
+def build_similar_products(top=10, incremental=False):
+    """
+    Calcular los productos similares por contenido.
+
+    Devuelve la cantidad de productos recalculados, filas escritas y los
+    tiempos por fase.
+    """
+    timings = {}
+    computed_at = timezone.now()
+
+    start = time.perf_counter()
+    ids, categories, documents, changed = load_catalog()
+    index_of = {int(product_id): row for row, product_id in enumerate(ids)}
+    timings['load'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    matrix = vectorize(documents)
+    timings['vectorize'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    since = last_build_time() if incremental else None
+    if since is None:
+        rows = list(range(len(ids)))
+    else:
+        changed_rows = [index_of[product_id] for product_id in changed]
+        rows = affected_rows(matrix, ids, index_of, changed_rows, top) if changed_rows else []
+    timings['scope'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    results = list(neighbours(matrix, categories, rows, top))
+    new_rows = recommendation_rows(ids, results, computed_at)
+    timings['similarity'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with transaction.atomic():
+        existing = ProductRecommendation.objects.filter(kind__in=list(KINDS.values()))
+        if since is None:
+            existing.delete()
+        else:
+            product_ids = [int(ids[row]) for row in rows]
+            for begin in range(0, len(product_ids), 500):
+                existing.filter(product_id__in=product_ids[begin:begin + 500]).delete()
+        ProductRecommendation.objects.bulk_create(new_rows, batch_size=1000)
+        save_text_hashes(changed)
+    timings['write'] = time.perf_counter() - start
+
+    if rows:
+        bump_version('recommendation')
+    return {'products': len(rows), 'rows': len(new_rows), 'timings': timings, 'nnz': matrix.nnz}
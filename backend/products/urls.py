@@ -6,8 +6,11 @@ from .views import (
     ProductsByCategoryView,
     featured_products,
     recommended_products,
+    similar_products,
+    catalog_cache_stats,
     MyProductsView,
-    MyProductDetailView
+    MyProductDetailView,
+    MyProductBulkUpdateView
 )
 
 urlpatterns = [
@@ -15,10 +18,13 @@ urlpatterns = [
     path('categories/<slug:slug>/products/', ProductsByCategoryView.as_view(), name='products_by_category'),
     path('', ProductListView.as_view(), name='product_list'),
     path('my-products/', MyProductsView.as_view(), name='my_products'),
+    path('my-products/bulk/', MyProductBulkUpdateView.as_view(), name='my_products_bulk'),
     path('my-products/<int:pk>/', MyProductDetailView.as_view(), name='my_product_detail'),
     path('featured/', featured_products, name='featured_products'),
+    path('cache-stats/', catalog_cache_stats, name='catalog_cache_stats'),
     path('<slug:slug>/', ProductDetailView.as_view(), name='product_detail'),
     path('<int:product_id>/recommended/', recommended_products, name='recommended_products'),
+    path('<int:product_id>/similar/', similar_products, name='similar_products'),
 ]
 
 
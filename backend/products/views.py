@@ -1,11 +1,48 @@
 from rest_framework import generics, filters
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticatedOrReadOnly, AllowAny, IsAuthenticated
+from rest_framework.permissions import IsAuthenticatedOrReadOnly, AllowAny, IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
+from django.db import transaction
 from django.db.models import Q
+from decimal import Decimal, InvalidOperation
 from django.shortcuts import get_object_or_404
-from .models import Product, Category
-from .serializers import ProductSerializer, CategorySerializer
+from .models import Product, Category, ProductRecommendation, in_stock_condition
+from .serializers import ProductSerializer, CategorySerializer, ProductBulkUpdateSerializer
+from .filters import ProductSearchFilter
+from .facets import FACET_FILTERS, compute_facets, parse_facets, price_bounds
+from .cache import cached_data, cache_stats
+from .conditional import conditional_response, list_fingerprint, product_fingerprint
+from ecommerce.pagination import HybridPagination
+
+
+def serialize_cards(request, queryset, limit):
+    """Serializar un listado corto en representación card (admite ?fields=, ?omit= y ?view=full)"""
+    context = {'request': request, 'fieldset': 'card'}
+    products = ProductSerializer(context=context).prepare_queryset(queryset)[:limit]
+    return ProductSerializer(products, many=True, context=context).data
+
+
+class CardListMixin:
+    """Listados del catálogo: representación card por defecto y solo los JOIN que usa"""
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.request.method == 'GET':
+            context['fieldset'] = 'card'
+        return context
+
+    def catalog_queryset(self, queryset):
+        return self.get_serializer().prepare_queryset(queryset)
+
+
+def parse_price(value):
+    """Convertir un parámetro de precio a Decimal (None si es inválido)"""
+    if not value:
+        return None
+    try:
+        return Decimal(value)
+    except InvalidOperation:
+        return None
 
 
 class CategoryListView(generics.ListAPIView):
@@ -14,22 +51,33 @@ class CategoryListView(generics.ListAPIView):
     serializer_class = CategorySerializer
     permission_classes = [AllowAny]  # Permitir acceso público a las categorías
 
+    def list(self, request, *args, **kwargs):
+        data = cached_data(
+            'categories', request, ['category', 'product'],
+            lambda: super(CategoryListView, self).list(request, *args, **kwargs).data
+        )
+        return Response(data)
 
-class ProductListView(generics.ListCreateAPIView):
+
+class ProductListView(CardListMixin, generics.ListCreateAPIView):
     """Listar y crear productos con búsqueda y filtrado"""
     serializer_class = ProductSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
+    pagination_class = HybridPagination
+    # La búsqueda va después del ordenamiento para poder ordenar por relevancia
+    filter_backends = [filters.OrderingFilter, ProductSearchFilter]
     search_fields = ['name', 'description']
-    ordering_fields = ['price', 'created_at', 'name']
+    ordering_fields = ['price', 'final_price', 'created_at', 'name']
     ordering = ['-created_at']
 
     def get_queryset(self):
-        queryset = Product.objects.filter(is_active=True)
-        
+        return self.filter_catalog(self.catalog_queryset(Product.objects.active().for_catalog()))
+
+    def filter_catalog(self, queryset, skip=None):
+        """Aplicar los filtros de la query string (``skip``: faceta cuyo filtro se omite)"""
         # Filtro por categoría
         category_slug = self.request.query_params.get('category', None)
-        if category_slug:
+        if category_slug and skip != 'category':
             queryset = queryset.filter(category__slug=category_slug)
         
         # Filtro por featured
@@ -37,21 +85,43 @@ class ProductListView(generics.ListCreateAPIView):
         if featured == 'true':
             queryset = queryset.filter(is_featured=True)
         
-        # Filtro por precio
-        min_price = self.request.query_params.get('min_price', None)
-        max_price = self.request.query_params.get('max_price', None)
-        if min_price:
+        # Filtro por precio (final_price es una columna indexada)
+        min_price = parse_price(self.request.query_params.get('min_price', None))
+        max_price = parse_price(self.request.query_params.get('max_price', None))
+        if min_price is not None and skip != 'price':
             queryset = queryset.filter(final_price__gte=min_price)
-        if max_price:
+        if max_price is not None and skip != 'price':
             queryset = queryset.filter(final_price__lte=max_price)
         
         # Filtro por stock disponible
         in_stock = self.request.query_params.get('in_stock', None)
-        if in_stock == 'true':
-            queryset = queryset.filter(stock__gt=0)
+        if in_stock == 'true' and skip != 'in_stock':
+            queryset = queryset.filter(in_stock_condition())
         
         return queryset
-    
+
+    def list(self, request, *args, **kwargs):
+        fingerprint = list_fingerprint(request, self.filter_queryset(self.get_queryset()))
+        return conditional_response(request, fingerprint, lambda: self.build_list(request, *args, **kwargs))
+
+    def build_list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        names = parse_facets(request.query_params.get('facets'))
+        if names and isinstance(response.data, dict):
+            response.data['facets'] = self.get_facets(names)
+        return response
+
+    def get_facets(self, names):
+        """Conteos por categoría, rango de precio y stock (ver products/facets.py)"""
+        params = self.request.query_params
+        active = {param for facet_params in FACET_FILTERS.values() for param in facet_params if params.get(param)}
+        return compute_facets(
+            names,
+            lambda skip: self.filter_queryset(self.filter_catalog(Product.objects.active(), skip=skip)),
+            active,
+            price_bounds(params.get('price_buckets')),
+        )
+
     def perform_create(self, serializer):
         # Los productos creados por usuarios no autenticados como admin se crean como inactivos
         # para revisión (a menos que el usuario sea staff)
@@ -63,55 +133,111 @@ class ProductListView(generics.ListCreateAPIView):
 
 class ProductDetailView(generics.RetrieveAPIView):
     """Detalle de un producto"""
-    queryset = Product.objects.filter(is_active=True)
     serializer_class = ProductSerializer
     lookup_field = 'slug'
 
+    def get_queryset(self):
+        return self.get_serializer().prepare_queryset(Product.objects.active().for_catalog())
+
+    def retrieve(self, request, *args, **kwargs):
+        fingerprint = product_fingerprint(self.get_queryset(), slug=kwargs['slug'])
+        return conditional_response(
+            request, fingerprint, lambda: super(ProductDetailView, self).retrieve(request, *args, **kwargs)
+        )
 
-class ProductsByCategoryView(generics.ListAPIView):
+
+class ProductsByCategoryView(CardListMixin, generics.ListAPIView):
     """Listar productos por categoría"""
     serializer_class = ProductSerializer
+    pagination_class = HybridPagination
     permission_classes = [AllowAny]  # Permitir acceso público
 
+    def get_category(self):
+        # Se consulta una sola vez por petición (lo usan el ETag y el listado)
+        if not hasattr(self, '_category'):
+            self._category = get_object_or_404(Category, slug=self.kwargs['slug'])
+        return self._category
+
     def get_queryset(self):
-        category_slug = self.kwargs['slug']
-        category = get_object_or_404(Category, slug=category_slug)
-        return Product.objects.filter(category=category, is_active=True)
+        category = self.get_category()
+        return self.catalog_queryset(Product.objects.active().for_catalog()).filter(category=category)
+
+    def list(self, request, *args, **kwargs):
+        fingerprint = list_fingerprint(request, self.get_queryset())
+        return conditional_response(
+            request, fingerprint, lambda: super(ProductsByCategoryView, self).list(request, *args, **kwargs)
+        )
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticatedOrReadOnly])
 def featured_products(request):
     """Obtener productos destacados"""
-    products = Product.objects.filter(is_featured=True, is_active=True)[:8]
-    serializer = ProductSerializer(products, many=True)
-    return Response(serializer.data)
+    def build():
+        return serialize_cards(request, Product.objects.active().for_catalog().filter(is_featured=True), 8)
+    return Response(cached_data('featured', request, ['product', 'category'], build))
 
 
 @api_view(['GET'])
 def recommended_products(request, product_id):
     """Obtener productos recomendados basados en un producto"""
+    def build():
+        # "Comprados juntos" precalculados (ver build_recommendations): una consulta indexada
+        recommended = serialize_cards(request, Product.objects.active().for_catalog().filter(
+            recommended_for__product_id=product_id,
+            recommended_for__product__is_active=True,
+            recommended_for__kind=ProductRecommendation.KIND_BOUGHT_TOGETHER,
+        ).order_by('recommended_for__rank'), 6)
+
+        if not recommended:
+            # Sin historial de compras: misma categoría o productos destacados
+            product = Product.objects.get(id=product_id, is_active=True)
+            recommended = serialize_cards(request, Product.objects.active().for_catalog().filter(
+                Q(category=product.category_id) | Q(is_featured=True)
+            ).exclude(id=product_id), 6)
+        return recommended
+
     try:
-        product = Product.objects.get(id=product_id, is_active=True)
-        # Recomendar productos de la misma categoría o productos destacados
-        recommended = Product.objects.filter(
-            Q(category=product.category) | Q(is_featured=True),
-            is_active=True
-        ).exclude(id=product_id)[:6]
-        serializer = ProductSerializer(recommended, many=True)
-        return Response(serializer.data)
+        return Response(cached_data('recommended', request, ['product', 'category', 'recommendation'], build))
     except Product.DoesNotExist:
         return Response({'error': 'Producto no encontrado'}, status=404)
 
 
+@api_view(['GET'])
+def similar_products(request, product_id):
+    """Obtener productos similares por contenido (?scope=category para la misma categoría)"""
+    kind = ProductRecommendation.KIND_SIMILAR
+    if request.query_params.get('scope') == 'category':
+        kind = ProductRecommendation.KIND_SIMILAR_CATEGORY
+
+    def build():
+        # Vecinos precalculados (ver build_similar_products): una consulta indexada
+        return serialize_cards(request, Product.objects.active().for_catalog().filter(
+            recommended_for__product_id=product_id,
+            recommended_for__product__is_active=True,
+            recommended_for__kind=kind,
+        ).order_by('recommended_for__rank'), 6)
+
+    return Response(cached_data('similar', request, ['product', 'category', 'recommendation'], build))
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def catalog_cache_stats(request):
+    """Aciertos y fallos de la caché del catálogo (solo staff)"""
+    return Response(cache_stats())
+
+
 class MyProductsView(generics.ListAPIView):
     """Listar productos del usuario actual (productos por vender)"""
     serializer_class = ProductSerializer
+    pagination_class = HybridPagination
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
         # Retornar todos los productos del usuario, activos e inactivos
-        return Product.objects.filter(seller=self.request.user).order_by('-created_at')
+        queryset = Product.objects.for_catalog().filter(seller=self.request.user).order_by('-created_at')
+        return self.get_serializer().prepare_queryset(queryset)
 
 
 class MyProductDetailView(generics.RetrieveUpdateAPIView):
@@ -121,4 +247,23 @@ class MyProductDetailView(generics.RetrieveUpdateAPIView):
 
     def get_queryset(self):
         # Solo permitir acceso a productos del usuario actual
-        return Product.objects.filter(seller=self.request.user)
+        return Product.objects.for_catalog().filter(seller=self.request.user)
+
+
+class MyProductBulkUpdateView(generics.GenericAPIView):
+    """Cambiar precio, stock y destacado de varios productos del usuario en una petición"""
+    serializer_class = ProductBulkUpdateSerializer
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        # Se acepta la lista de cambios directamente o dentro de {"items": [...]}
+        data = {'items': request.data} if isinstance(request.data, list) else request.data
+        serializer = self.get_serializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            products = serializer.save()
+        context = {'request': request, 'fieldset': 'pricing'}
+        return Response({
+            'updated': len(products),
+            'results': ProductSerializer(products, many=True, context=context).data,
+        })
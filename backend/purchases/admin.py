@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.utils.html import format_html
-from .models import Purchase, PurchaseItem
+from .models import PaymentEvent, Purchase, PurchaseItem
 
 
 class PurchaseItemInline(admin.TabularInline):
@@ -84,3 +84,21 @@ class PurchaseItemAdmin(admin.ModelAdmin):
         return format_html('<strong>${}</strong>', obj.subtotal)
     subtotal_display.short_description = 'Subtotal'
 
+
+
+@admin.register(PaymentEvent)
+class PaymentEventAdmin(admin.ModelAdmin):
+    list_display = ('id', 'event_type', 'event_id', 'payment_intent_id', 'received_at')
+    list_filter = ('event_type',)
+    search_fields = ('event_id', 'payment_intent_id')
+    readonly_fields = ('event_id', 'event_type', 'payment_intent_id', 'payload', 'received_at')
+
+    # Solo se agregan filas desde el webhook
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,184 @@
+"""
+Compra basada en conjuntos: la cantidad de consultas no depende de las líneas.
+
+1. Un SELECT ... FOR UPDATE (en orden de id) trae todos los productos del
+   pedido; los que tienen el stock repartido en contadores se leen sin
+   bloquear su fila, que es justo lo que el reparto evita, y con la suma
+   de sus contadores (su columna stock se sincroniza periódicamente).
+2. El stock se valida con esas filas y se descuenta con un UPDATE
+   condicional (``stock >= cantidad``) para todos los productos; si alguna
+   fila no cumple, la compra falla sin vender de más. Los repartidos
+   descuentan de un contador (products.inventory.take_stock), también sin
+   tocar lo que retienen otros carritos.
+3. La compra y sus items se insertan con un INSERT y un bulk_create, con
+   los subtotales ya calculados.
+
+Con reservas (cart.reservations), las unidades que el comprador retiene en
+su carrito cuentan como disponibles para él y se liberan al comprar.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import models, transaction
+from django.db.models import Case, F, Q, Value, When
+from cart.models import Cart, CartItem
+from cart.reservations import release_stock, reservations_enabled
+from products.inventory import take_stock
+from products.models import Product
+from .models import Purchase, PurchaseItem
+
+
+class CheckoutError(Exception):
+    """Errores por línea del pedido (``{'items.N': mensaje}``)"""
+
+    def __init__(self, errors):
+        super().__init__(errors)
+        self.errors = errors
+
+
+def fetch_products(lines):
+    """{índice de línea: producto} con una consulta (más otra si hay productos repartidos)"""
+    ids = {line['product_id'] for line in lines if line.get('product_id')}
+    names = {line['product_name'] for line in lines if not line.get('product_id')}
+    lookup = Q(id__in=ids) | Q(name__in=names)
+    products = list(Product.objects.select_for_update().filter(lookup, is_active=True, stock_shards=0).order_by('id'))
+    found_ids = {product.pk for product in products}
+    found_names = {product.name for product in products}
+    if ids - found_ids or names - found_names:
+        products += list(Product.objects.filter(lookup, is_active=True, stock_shards__gt=0).with_live_stock())
+
+    by_id = {product.pk: product for product in products}
+    by_name = {}
+    # Nombre repetido: el más reciente, como el orden por defecto del catálogo
+    for product in sorted(products, key=lambda product: product.created_at, reverse=True):
+        by_name.setdefault(product.name, product)
+    return {
+        index: by_id.get(line['product_id']) if line.get('product_id') else by_name.get(line['product_name'])
+        for index, line in enumerate(lines)
+    }
+
+
+def per_product(values):
+    return Case(
+        *[When(id=product_id, then=Value(value)) for product_id, value in values.items()],
+        output_field=models.IntegerField(),
+    )
+
+
+def take_order_stock(quantities, holds):
+    """Descontar ``{producto: unidades}``; False (sin aplicar nada) si alguno no alcanza"""
+    rows = {product.pk: quantity for product, quantity in quantities.items() if not product.stock_shards}
+    if rows:
+        # Unidades que deben quedar libres además de las propias reservas del comprador
+        needed = {product_id: quantity - holds.get(product_id, 0) for product_id, quantity in rows.items()}
+        if reservations_enabled():
+            condition = Q(stock__gte=F('reserved_stock') + per_product(needed))
+        else:
+            condition = Q(stock__gte=per_product(rows))
+        updated = Product.objects.filter(condition, id__in=rows).update(stock=F('stock') - per_product(rows))
+        if updated != len(rows):
+            return False
+    held = reservations_enabled()
+    for product, quantity in quantities.items():
+        if product.stock_shards and not take_stock(product, quantity, holds.get(product.pk, 0) if held else None):
+            return False
+    return True
+
+
+@transaction.atomic
+def place_order(user, lines, holds=None, **purchase_fields):
+    """
+    Crear la compra de ``lines`` (dicts con product_id o product_name, quantity
+    y price opcional: si falta se usa el precio final del producto).
+
+    ``holds`` son las unidades que el comprador retiene por producto (se leen
+    del carrito si no se pasan). Sin ``total_amount`` se usa la suma de los
+    subtotales. Lanza CheckoutError con los errores por línea si algo no está
+    disponible.
+    """
+    products = fetch_products(lines)
+    errors = {}
+    quantities = defaultdict(int)
+    for index, line in enumerate(lines):
+        product = products[index]
+        if product is None:
+            if line.get('product_id'):
+                errors[f'items.{index}'] = f'Producto con ID {line["product_id"]} no encontrado'
+            else:
+                errors[f'items.{index}'] = f'Producto "{line["product_name"]}" no encontrado'
+            continue
+        quantities[product] += line['quantity']
+    if errors:
+        raise CheckoutError(errors)
+
+    if not reservations_enabled():
+        holds = {}
+    elif holds is None:
+        holds = dict(CartItem.objects.filter(
+            cart__user=user, product__in=list(quantities), reserved_quantity__gt=0
+        ).values_list('product_id', 'reserved_quantity'))
+
+    for index, line in enumerate(lines):
+        product = products[index]
+        available = product.current_stock
+        if reservations_enabled():
+            available += holds.get(product.pk, 0) - product.reserved_stock
+        if quantities[product] > available:
+            errors[f'items.{index}'] = (
+                f'Stock insuficiente para "{product.name}". '
+                f'Disponible: {max(available, 0)}, solicitado: {quantities[product]}'
+            )
+    if errors:
+        raise CheckoutError(errors)
+    if not take_order_stock(quantities, holds):
+        raise CheckoutError({'items': 'El stock cambió durante la compra. Intente nuevamente.'})
+    if holds:
+        release_stock(holds)
+        CartItem.objects.filter(cart__user=user, product_id__in=list(holds)).update(
+            reserved_quantity=0, reserved_until=None
+        )
+
+    items = []
+    for index, line in enumerate(lines):
+        product = products[index]
+        price = Decimal(str(line['price'])) if line.get('price') is not None else product.final_price
+        items.append(PurchaseItem(
+            product=product,
+            product_name=product.name,
+            quantity=line['quantity'],
+            price=price,
+            subtotal=Decimal(line['quantity']) * price,
+        ))
+    purchase_fields.setdefault('total_amount', sum(item.subtotal for item in items))
+    purchase = Purchase.objects.create(user=user, **purchase_fields)
+    for item in items:
+        item.purchase = purchase
+    PurchaseItem.objects.bulk_create(items)
+    return purchase
+
+
+@transaction.atomic
+def place_cart_order(user, **purchase_fields):
+    """
+    Comprar el carrito de ``user`` a los precios actuales y vaciarlo.
+
+    Las consultas no dependen de la cantidad de items: lectura del carrito
+    (bloqueado, para que un cambio simultáneo no se pierda al vaciarlo),
+    compra (place_order), DELETE de los items y versión del carrito.
+    """
+    cart_items = list(
+        CartItem.objects.select_for_update().filter(cart__user=user).values_list('id', 'product_id', 'quantity', 'reserved_quantity')
+    )
+    if not cart_items:
+        raise CheckoutError({'items': 'El carrito está vacío'})
+
+    holds = defaultdict(int)
+    for _, product_id, _, reserved in cart_items:
+        if reserved:
+            holds[product_id] += reserved
+    lines = [{'product_id': product_id, 'quantity': quantity} for _, product_id, quantity, _ in cart_items]
+    purchase = place_order(user, lines, holds=dict(holds), **purchase_fields)
+
+    CartItem.objects.filter(pk__in=[item_id for item_id, _, _, _ in cart_items]).delete()
+    Cart.objects.filter(user=user).touch()
+    return purchase
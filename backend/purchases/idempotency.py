@@ -0,0 +1,132 @@
+"""
+Header ``Idempotency-Key`` para los POST de compras y pagos.
+
+La primera petición con una clave la reclama (una fila en IdempotencyKey,
+confirmada antes de ejecutar la vista), se ejecuta y guarda su respuesta.
+Los reintentos con la misma clave reciben esa respuesta sin volver a tocar
+la base de datos ni la pasarela de pago (con ``Idempotent-Replayed: true``).
+
+- Un duplicado que llega mientras la primera sigue en curso espera hasta
+  IDEMPOTENCY_WAIT segundos a que termine; si no termina, recibe 409.
+- La misma clave con otro cuerpo o en otra ruta es un error (422).
+- Los errores 5xx (y las excepciones) liberan la clave para poder reintentar.
+- Las claves vencen a los IDEMPOTENCY_KEY_TTL segundos y se borran con
+  ``python manage.py purge_idempotency_keys``.
+"""
+import functools
+import hashlib
+import json
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+POLL_INTERVAL = 0.1
+
+
+def fingerprint(request):
+    """sha256 del método, la ruta y el cuerpo (con las claves ordenadas)"""
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(f'{request.method} {request.path}\n{body}'.encode()).hexdigest()
+
+
+def claim(user, key, digest):
+    """(registro, True) si esta petición se quedó con la clave; (registro existente o None, False) si no"""
+    now = timezone.now()
+    expires_at = now + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+    record = IdempotencyKey.objects.filter(user=user, key=key).first()
+    if record is None:
+        try:
+            with transaction.atomic():
+                record = IdempotencyKey.objects.create(
+                    user=user, key=key, fingerprint=digest, locked_at=now, expires_at=expires_at
+                )
+            return record, True
+        except IntegrityError:
+            # Otra petición la reclamó entre medio
+            return IdempotencyKey.objects.filter(user=user, key=key).first(), False
+
+    # Vencida, o en curso pero abandonada (el proceso murió): se toma con un UPDATE condicional
+    abandoned = now - timedelta(seconds=settings.IDEMPOTENCY_LOCK_TIMEOUT)
+    if record.expires_at <= now or (record.status_code is None and record.locked_at <= abandoned):
+        stale = Q(expires_at__lte=now) | Q(status_code__isnull=True, locked_at__lte=abandoned)
+        fields = dict(fingerprint=digest, status_code=None, response=None, locked_at=now, expires_at=expires_at)
+        if IdempotencyKey.objects.filter(stale, pk=record.pk).update(**fields):
+            for name, value in fields.items():
+                setattr(record, name, value)
+            return record, True
+        return IdempotencyKey.objects.filter(pk=record.pk).first(), False
+    return record, False
+
+
+def wait_for(record):
+    """Esperar a que termine la petición que tiene la clave; None si la liberó"""
+    deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT
+    while record is not None and record.status_code is None and time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        record = IdempotencyKey.objects.filter(pk=record.pk).first()
+    return record
+
+
+def error_response(message, status_code):
+    return Response({'error': message}, status=status_code)
+
+
+def idempotent(view):
+    """Aplicar ``Idempotency-Key`` a una vista de función (debajo de @api_view y @permission_classes)"""
+
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None:
+            return view(request, *args, **kwargs)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return error_response(f'{HEADER} debe tener entre 1 y {MAX_KEY_LENGTH} caracteres',
+                                  status.HTTP_400_BAD_REQUEST)
+
+        digest = fingerprint(request)
+        record, claimed = claim(request.user, key, digest)
+        if not claimed:
+            if record is not None and record.fingerprint != digest:
+                return error_response(f'{HEADER} ya se usó con otra petición', status.HTTP_422_UNPROCESSABLE_ENTITY)
+            record = wait_for(record)
+            if record is None:
+                # La primera petición falló y liberó la clave
+                record, claimed = claim(request.user, key, digest)
+            elif record.status_code is not None:
+                return Response(record.response, status=record.status_code, headers={REPLAYED_HEADER: 'true'})
+        if not claimed:
+            response = error_response(f'Hay una petición en curso con este {HEADER}', status.HTTP_409_CONFLICT)
+            response['Retry-After'] = '1'
+            return response
+
+        try:
+            response = view(request, *args, **kwargs)
+        except APIException as exc:
+            # Los errores del API (validación, permisos) se guardan como cualquier respuesta
+            response = api_settings.EXCEPTION_HANDLER(exc, {'request': request})
+            if response is None:
+                IdempotencyKey.objects.filter(pk=record.pk).delete()
+                raise
+        except BaseException:
+            IdempotencyKey.objects.filter(pk=record.pk).delete()
+            raise
+
+        if response.status_code >= 500:
+            IdempotencyKey.objects.filter(pk=record.pk).delete()
+        else:
+            IdempotencyKey.objects.filter(pk=record.pk).update(status_code=response.status_code, response=response.data)
+        return response
+
+    return wrapper
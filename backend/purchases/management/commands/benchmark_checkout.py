@@ -0,0 +1,64 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from products.inventory import take_stock
+from products.models import Product
+from purchases.checkout import place_order
+from purchases.models import Purchase, PurchaseItem
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Compara la compra línea por línea contra la compra basada en conjuntos (todo se revierte al terminar)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('sizes', nargs='*', type=int, default=[10, 40, 200],
+                            help='Cantidad de líneas de cada pedido')
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            user = User.objects.create_user(
+                email='benchmark-checkout@example.com', username='benchmark-checkout', password=None
+            )
+            products = Product.objects.bulk_create([
+                Product(name=f'Producto de prueba {i}', slug=f'benchmark-checkout-{i}', price=10, stock=10 ** 6)
+                for i in range(max(options['sizes']))
+            ])
+            for size in options['sizes']:
+                lines = [
+                    {'product_id': product.pk, 'quantity': 1, 'price': product.final_price}
+                    for product in products[:size]
+                ]
+                for label, checkout in (('línea por línea', self.per_line_order), ('conjuntos', place_order)):
+                    queries, seconds = self.measure(checkout, user, lines, options['repeat'])
+                    self.stdout.write(f'{size:>5} líneas | {label:<16} | {queries:>5} consultas | {seconds * 1000:8.1f} ms')
+            # Nunca dejar los datos sintéticos en la base de datos
+            transaction.set_rollback(True)
+
+    def measure(self, checkout, user, lines, repeat):
+        best = None
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                checkout(user, lines, total_amount=0, status='completed')
+                elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return len(queries), best
+
+    @transaction.atomic
+    def per_line_order(self, user, lines, **purchase_fields):
+        """La compra como se hacía antes: una búsqueda, un INSERT y un UPDATE por línea"""
+        purchase = Purchase.objects.create(user=user, **purchase_fields)
+        for line in lines:
+            product = Product.objects.get(id=line['product_id'], is_active=True)
+            PurchaseItem.objects.create(
+                purchase=purchase, product=product, product_name=product.name,
+                quantity=line['quantity'], price=line['price'],
+            )
+            take_stock(product, line['quantity'])
+        return purchase
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from purchases.webhooks import process_events
+
+
+class Command(BaseCommand):
+    help = (
+        'Aplica a las compras los eventos de pago recibidos por webhook, en lotes '
+        '(una vez, p. ej. con cron, o como worker con --loop)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Eventos por lote y transacción')
+        parser.add_argument('--loop', action='store_true', help='Seguir esperando eventos nuevos')
+        parser.add_argument('--interval', type=float, default=1, help='Segundos entre pasadas con --loop')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size debe ser mayor a 0')
+        while True:
+            start = time.perf_counter()
+            events, updated = process_events(batch_size=options['batch_size'])
+            elapsed = time.perf_counter() - start
+            if events or not options['loop']:
+                self.stdout.write(self.style.SUCCESS(
+                    f'{events} eventos procesados, {updated} compras actualizadas en {elapsed:.2f}s'
+                ))
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
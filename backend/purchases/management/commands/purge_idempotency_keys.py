@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from purchases.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    help = 'Borra las claves de idempotencia vencidas (para ejecutar periódicamente, p. ej. con cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Claves por lote')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size debe ser mayor a 0')
+        start = time.perf_counter()
+        deleted = 0
+        while True:
+            # Lotes chicos por el índice de expires_at: no bloquea la tabla mientras se borra
+            ids = list(
+                IdempotencyKey.objects.filter(expires_at__lte=timezone.now())
+                .values_list('id', flat=True)[:options['batch_size']]
+            )
+            if not ids:
+                break
+            deleted += IdempotencyKey.objects.filter(id__in=ids).delete()[0]
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(f'{deleted} claves borradas en {elapsed:.2f}s'))
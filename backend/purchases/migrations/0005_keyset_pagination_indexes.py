@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 05:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('purchases', '0004_simplify_payment_methods'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='purchase',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='purchases_p_user_id_508812_idx'),
+        ),
+    ]
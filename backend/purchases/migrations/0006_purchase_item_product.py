@@ -0,0 +1,36 @@
+# Generated by Django 4.2.7 on 2026-10-18 05:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def link_products_by_name(apps, schema_editor):
+    """Asociar los items históricos a su producto por nombre (si existe)"""
+    Product = apps.get_model('products', 'Product')
+    PurchaseItem = apps.get_model('purchases', 'PurchaseItem')
+    names = PurchaseItem.objects.filter(product__isnull=True).values_list('product_name', flat=True).distinct()
+    for name in list(names):
+        product_id = Product.objects.filter(name=name).order_by('id').values_list('id', flat=True).first()
+        if product_id:
+            PurchaseItem.objects.filter(product__isnull=True, product_name=name).update(product_id=product_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0008_productrecommendation'),
+        ('purchases', '0005_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='purchaseitem',
+            name='product',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='purchase_items', to='products.product'),
+        ),
+        migrations.RunPython(link_products_by_name, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='purchaseitem',
+            index=models.Index(fields=['purchase', 'product'], name='purchases_p_purchas_00688d_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-18 06:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('purchases', '0008_payment_events'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paymentevent',
+            name='amount_received',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='paymentevent',
+            name='owner_id',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
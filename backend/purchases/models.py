@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.core.serializers.json import DjangoJSONEncoder
 from decimal import Decimal
 
 User = get_user_model()
@@ -23,6 +24,10 @@ class Purchase(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Historial de compras paginado por cursor sobre (created_at, id)
+            models.Index(fields=['user', 'created_at', 'id']),
+        ]
 
     def __str__(self):
         return f"Compra #{self.id} - {self.user.email} - ${self.total_amount}"
@@ -30,11 +35,21 @@ class Purchase(models.Model):
 
 class PurchaseItem(models.Model):
     purchase = models.ForeignKey(Purchase, on_delete=models.CASCADE, related_name='items')
+    # Referencia al producto (para recomendaciones); product_name conserva el nombre histórico
+    product = models.ForeignKey(
+        'products.Product', on_delete=models.SET_NULL, null=True, blank=True, related_name='purchase_items'
+    )
     product_name = models.CharField(max_length=255)
     quantity = models.PositiveIntegerField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
     subtotal = models.DecimalField(max_digits=10, decimal_places=2)
 
+    class Meta:
+        indexes = [
+            # Self-join por compra para la matriz de co-compras
+            models.Index(fields=['purchase', 'product']),
+        ]
+
     def save(self, *args, **kwargs):
         self.subtotal = Decimal(self.quantity) * Decimal(self.price)
         super().save(*args, **kwargs)
@@ -43,3 +58,50 @@ class PurchaseItem(models.Model):
         return f"{self.product_name} x{self.quantity} - ${self.subtotal}"
 
 
+
+
+class IdempotencyKey(models.Model):
+    """Respuesta guardada de una petición con header Idempotency-Key (ver purchases.idempotency)"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    key = models.CharField(max_length=255)
+    # sha256 del método, la ruta y el cuerpo: la misma clave con otra petición es un error
+    fingerprint = models.CharField(max_length=64)
+    # Sin status_code la primera petición sigue en curso
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    locked_at = models.DateTimeField()
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='unique_idempotency_key_per_user'),
+        ]
+
+    def __str__(self):
+        return f"{self.key} ({self.status_code or 'en curso'})"
+
+
+class PaymentEvent(models.Model):
+    """Evento de la pasarela recibido por webhook, tal como llegó (solo se agregan filas; ver purchases.webhooks)"""
+    id = models.BigAutoField(primary_key=True)
+    # Id del evento en la pasarela: las entregas repetidas comparten el mismo
+    event_id = models.CharField(max_length=255, db_index=True)
+    event_type = models.CharField(max_length=100)
+    payment_intent_id = models.CharField(max_length=255, blank=True, db_index=True)
+    # Del PaymentIntent: centavos cobrados y usuario que lo creó (metadata user_id); se comparan con la compra
+    amount_received = models.PositiveBigIntegerField(null=True, blank=True)
+    owner_id = models.CharField(max_length=64, blank=True, default='')
+    payload = models.TextField()
+    received_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.event_type} ({self.event_id})"
+
+
+class PaymentEventCheckpoint(models.Model):
+    """Último PaymentEvent aplicado a las compras"""
+    name = models.CharField(max_length=50, unique=True)
+    last_event_id = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name}: {self.last_event_id}"
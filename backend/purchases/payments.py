@@ -0,0 +1,283 @@
+"""
+Pasarelas de pago.
+
+La pasarela activa se elige con ``PAYMENT_GATEWAY`` en settings:
+
+- ``StripeGateway``: un solo cliente HTTP por proceso (sesión de requests con
+  pool de conexiones), timeouts de conexión y lectura, y un circuit breaker:
+  tras varias fallas seguidas de red o de Stripe, las llamadas fallan de
+  inmediato (503) durante un tiempo en vez de ocupar un worker esperando.
+  La librería de stripe (7.x) no acepta el cliente HTTP ni los reintentos por
+  llamada, así que la pasarela los fija en ``stripe.default_http_client`` y
+  ``stripe.max_network_retries``: afectan a todo uso de stripe en el proceso.
+- ``FakeGateway``: en proceso y sin red, para benchmarks, pruebas y
+  desarrollo sin claves de Stripe (``PAYMENT_GATEWAY=purchases.payments.FakeGateway``).
+
+Ambas verifican los webhooks con el esquema de firma de Stripe
+(header ``Stripe-Signature``, HMAC-SHA256 con marca de tiempo).
+"""
+import hashlib
+import hmac
+import json
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import stripe
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+DEFAULT_PAYMENT_GATEWAY = 'purchases.payments.StripeGateway'
+
+# Antigüedad máxima (segundos) de la firma de un webhook
+WEBHOOK_TOLERANCE = 300
+
+
+@dataclass(frozen=True)
+class PaymentIntent:
+    id: str
+    client_secret: str
+    amount: int
+    currency: str
+
+
+@dataclass(frozen=True)
+class WebhookEvent:
+    id: str
+    type: str
+    # PaymentIntent al que se refiere el evento ('' si no corresponde a uno)
+    payment_intent_id: str
+    # Del PaymentIntent (eventos payment_intent.*): centavos cobrados y metadata user_id de quien lo creó
+    amount_received: int = None
+    owner_id: str = ''
+
+
+class PaymentError(Exception):
+    """Error de la pasarela, con el título y el código HTTP de la respuesta del API"""
+    title = 'Error de la pasarela de pago'
+    status_code = 400
+    help = None
+
+    def as_data(self):
+        data = {'error': self.title, 'message': str(self)}
+        if self.help:
+            data['help'] = self.help
+        return data
+
+
+class GatewayNotConfigured(PaymentError):
+    title = 'Stripe no está configurado. Por favor, configura STRIPE_SECRET_KEY en el archivo .env'
+    status_code = 500
+    help = 'Obtén tus claves de prueba en: https://dashboard.stripe.com/test/apikeys'
+
+
+class GatewayAuthenticationError(PaymentError):
+    title = 'Clave de API de Stripe inválida'
+    status_code = 500
+    help = 'Por favor, verifica que STRIPE_SECRET_KEY sea correcta en el archivo .env'
+
+
+class WebhookNotConfigured(PaymentError):
+    title = 'El webhook de pagos no está configurado. Por favor, configura STRIPE_WEBHOOK_SECRET en el archivo .env'
+    status_code = 500
+
+
+class InvalidWebhook(PaymentError):
+    title = 'Webhook inválido'
+
+
+class GatewayUnavailable(PaymentError):
+    title = 'La pasarela de pago no está disponible. Intente nuevamente en unos minutos.'
+    status_code = 503
+
+
+class CircuitBreaker:
+    """
+    Tras ``threshold`` fallas seguidas se abre durante ``reset_timeout``
+    segundos (las llamadas fallan sin intentarse); después deja pasar una
+    llamada de prueba: si funciona se cierra, si falla se vuelve a abrir.
+    """
+
+    def __init__(self, threshold=5, reset_timeout=30):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def allow(self):
+        """Si se puede intentar una llamada ahora"""
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if self.probing or time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.probing = True
+            return True
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.probing or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+            self.probing = False
+
+
+class PaymentGateway(ABC):
+    """Interfaz común para las pasarelas de pago (una subclase incompleta falla al instanciarse)"""
+
+    @abstractmethod
+    def create_payment_intent(self, amount, currency='usd', metadata=None, idempotency_key=None):
+        """Crear un intento de pago por ``amount`` (en centavos); devuelve un PaymentIntent"""
+
+    @abstractmethod
+    def parse_webhook(self, payload, signature):
+        """Verificar la firma de ``payload`` (bytes) y devolver el WebhookEvent"""
+
+
+def verify_webhook(payload, signature, secret):
+    """Evento de un webhook con firma de Stripe; InvalidWebhook si la firma o el cuerpo no son válidos"""
+    try:
+        stripe.WebhookSignature.verify_header(payload.decode('utf-8'), signature, secret, WEBHOOK_TOLERANCE)
+        data = json.loads(payload)
+        obj = data.get('data', {}).get('object', {})
+        # Eventos del PaymentIntent, o de objetos que lo referencian (cargos, reembolsos)
+        if obj.get('object') == 'payment_intent':
+            return WebhookEvent(
+                data['id'], data['type'], obj.get('id') or '',
+                amount_received=obj.get('amount_received'),
+                owner_id=str((obj.get('metadata') or {}).get('user_id') or ''),
+            )
+        return WebhookEvent(data['id'], data['type'], obj.get('payment_intent') or '')
+    except stripe.error.SignatureVerificationError as error:
+        raise InvalidWebhook(str(error)) from error
+    except (ValueError, KeyError, AttributeError) as error:
+        raise InvalidWebhook('El cuerpo del evento no es válido') from error
+
+
+class StripeGateway(PaymentGateway):
+    """
+    Stripe con cliente HTTP compartido, timeouts y circuit breaker.
+
+    Al crearse reemplaza el cliente HTTP y los reintentos globales de stripe
+    (ver módulo); por eso se usa una sola instancia, la de get_payment_gateway().
+    """
+
+    # Fallas de la pasarela (no del pedido): cuentan para el circuit breaker
+    unavailable_errors = (stripe.error.APIConnectionError, stripe.error.APIError, stripe.error.RateLimitError)
+
+    def __init__(self):
+        self.api_key = settings.STRIPE_SECRET_KEY
+        self.breaker = CircuitBreaker(settings.PAYMENT_BREAKER_THRESHOLD, settings.PAYMENT_BREAKER_RESET)
+        timeout = (min(settings.PAYMENT_CONNECT_TIMEOUT, settings.PAYMENT_TIMEOUT), settings.PAYMENT_TIMEOUT)
+        try:
+            import requests
+            from requests.adapters import HTTPAdapter
+        except ImportError:
+            # Sin requests: el cliente por defecto de stripe (sin pool de conexiones)
+            stripe.default_http_client = stripe.new_default_http_client(timeout=settings.PAYMENT_TIMEOUT)
+        else:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings.PAYMENT_POOL_SIZE)
+            session.mount('https://', adapter)
+            stripe.default_http_client = stripe.RequestsClient(timeout=timeout, session=session)
+        # Reintentos de red con la misma clave de idempotencia (los agrega la librería)
+        stripe.max_network_retries = settings.PAYMENT_MAX_RETRIES
+
+    def is_configured(self):
+        return bool(self.api_key) and 'placeholder' not in self.api_key.lower()
+
+    def create_payment_intent(self, amount, currency='usd', metadata=None, idempotency_key=None):
+        if not self.is_configured():
+            raise GatewayNotConfigured('STRIPE_SECRET_KEY no está configurada')
+        if not self.breaker.allow():
+            raise GatewayUnavailable('Demasiadas fallas seguidas de Stripe')
+        try:
+            # La clave va en cada llamada (no se usa stripe.api_key); el cliente HTTP
+            # y los reintentos son los globales que fijó __init__
+            intent = stripe.PaymentIntent.create(
+                api_key=self.api_key,
+                idempotency_key=idempotency_key,
+                amount=amount,
+                currency=currency,
+                metadata=metadata or {},
+            )
+        except self.unavailable_errors as error:
+            self.breaker.record_failure()
+            raise GatewayUnavailable(str(error)) from error
+        except stripe.error.AuthenticationError as error:
+            self.breaker.record_success()
+            raise GatewayAuthenticationError(str(error)) from error
+        except stripe.error.StripeError as error:
+            # Rechazo del pedido (tarjeta, parámetros): Stripe respondió bien
+            self.breaker.record_success()
+            raise PaymentError(str(error)) from error
+        self.breaker.record_success()
+        return PaymentIntent(intent.id, intent.client_secret, amount, currency)
+
+    def parse_webhook(self, payload, signature):
+        if not settings.STRIPE_WEBHOOK_SECRET:
+            raise WebhookNotConfigured('STRIPE_WEBHOOK_SECRET no está configurada')
+        return verify_webhook(payload, signature, settings.STRIPE_WEBHOOK_SECRET)
+
+
+class FakeGateway(PaymentGateway):
+    """Pasarela en proceso: ids ``pi_fake_...`` y ``PAYMENT_FAKE_LATENCY`` segundos de demora simulada"""
+
+    # Claves de idempotencia recordadas (las más viejas se olvidan)
+    max_keys = 10000
+
+    def __init__(self):
+        self.latency = settings.PAYMENT_FAKE_LATENCY
+        self.lock = threading.Lock()
+        self.intents_by_key = OrderedDict()
+
+    def create_payment_intent(self, amount, currency='usd', metadata=None, idempotency_key=None):
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            if idempotency_key in self.intents_by_key:
+                return self.intents_by_key[idempotency_key]
+            intent_id = f'pi_fake_{uuid.uuid4().hex[:24]}'
+            intent = PaymentIntent(intent_id, f'{intent_id}_secret_{uuid.uuid4().hex[:24]}', amount, currency)
+            if idempotency_key is not None:
+                self.intents_by_key[idempotency_key] = intent
+                if len(self.intents_by_key) > self.max_keys:
+                    self.intents_by_key.popitem(last=False)
+        return intent
+
+    def parse_webhook(self, payload, signature):
+        return verify_webhook(payload, signature, settings.PAYMENT_FAKE_WEBHOOK_SECRET)
+
+    def sign_webhook(self, payload):
+        """Header ``Stripe-Signature`` para ``payload`` (bytes), para simular los envíos de la pasarela"""
+        timestamp = int(time.time())
+        signed = f'{timestamp}.'.encode() + payload
+        digest = hmac.new(settings.PAYMENT_FAKE_WEBHOOK_SECRET.encode(), signed, hashlib.sha256).hexdigest()
+        return f't={timestamp},v1={digest}'
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_payment_gateway():
+    """Obtener la instancia (una por proceso) de la pasarela configurada"""
+    global _gateway
+    if _gateway is None:
+        # Con hilos, dos primeras peticiones simultáneas crearían dos pasarelas
+        # (y dos clientes HTTP globales de stripe)
+        with _gateway_lock:
+            if _gateway is None:
+                _gateway = import_string(getattr(settings, 'PAYMENT_GATEWAY', DEFAULT_PAYMENT_GATEWAY))()
+    return _gateway
@@ -1,16 +1,18 @@
 from rest_framework import serializers
 from .models import Purchase, PurchaseItem
-from products.models import Product
-from django.db import transaction
+from decimal import Decimal, InvalidOperation
+from .checkout import CheckoutError, place_cart_order, place_order
+from .webhooks import initial_status, settle_purchase
+from ecommerce.serializers import SparseFieldsetMixin
 
 
-class PurchaseItemSerializer(serializers.ModelSerializer):
+class PurchaseItemSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = PurchaseItem
         fields = ('id', 'product_name', 'quantity', 'price', 'subtotal')
 
 
-class PurchaseSerializer(serializers.ModelSerializer):
+class PurchaseSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     items = PurchaseItemSerializer(many=True, read_only=True)
     user_email = serializers.EmailField(source='user.email', read_only=True)
 
@@ -22,6 +24,13 @@ class PurchaseSerializer(serializers.ModelSerializer):
         )
         read_only_fields = ('id', 'user', 'created_at', 'updated_at')
 
+    def prepare_queryset(self, queryset):
+        if self.wants('user_email'):
+            queryset = queryset.select_related('user')
+        if self.wants('items'):
+            queryset = queryset.prefetch_related('items')
+        return queryset
+
 
 class CreatePurchaseSerializer(serializers.Serializer):
     total_amount = serializers.DecimalField(max_digits=10, decimal_places=2)
@@ -36,100 +45,83 @@ class CreatePurchaseSerializer(serializers.Serializer):
     )
 
     def validate(self, attrs):
-        """Validar stock antes de crear la compra"""
+        """Validar la forma de cada item; el stock se valida al crear la compra, con las filas bloqueadas"""
         items_data = attrs.get('items', [])
         
         if not items_data:
             raise serializers.ValidationError({'items': 'La compra debe tener al menos un item'})
         
-        # Validar stock para cada item
         errors = {}
+        lines = []
         for idx, item_data in enumerate(items_data):
             product_id = item_data.get('product_id')
             product_name = item_data.get('product_name')
-            quantity = item_data.get('quantity')
-            
-            if not quantity or quantity <= 0:
-                errors[f'items.{idx}'] = 'quantity debe ser mayor a 0'
+            try:
+                quantity = int(item_data.get('quantity') or 0)
+                price = item_data.get('price')
+                price = None if price is None else Decimal(str(price))
+            except (TypeError, ValueError, InvalidOperation):
+                errors[f'items.{idx}'] = 'quantity y price deben ser numéricos'
                 continue
-            
-            # Buscar el producto por ID (preferido) o por nombre
-            product = None
-            if product_id:
+            if product_id not in (None, ''):
+                # Como el antiguo Product.objects.get(id=...): se acepta el id como texto ("2")
                 try:
-                    product = Product.objects.get(id=product_id, is_active=True)
-                except Product.DoesNotExist:
-                    errors[f'items.{idx}'] = f'Producto con ID {product_id} no encontrado'
+                    product_id = int(str(product_id).strip())
+                except ValueError:
+                    errors[f'items.{idx}'] = 'product_id debe ser numérico'
                     continue
-            elif product_name:
-                try:
-                    product = Product.objects.get(name=product_name, is_active=True)
-                except Product.DoesNotExist:
-                    errors[f'items.{idx}'] = f'Producto "{product_name}" no encontrado'
-                    continue
-                except Product.MultipleObjectsReturned:
-                    product = Product.objects.filter(name=product_name, is_active=True).first()
-            else:
-                errors[f'items.{idx}'] = 'product_id o product_name es requerido'
-                continue
             
-            # Validar stock disponible
-            if product and not product.is_available(quantity):
-                errors[f'items.{idx}'] = f'Stock insuficiente para "{product.name}". Disponible: {product.stock}, solicitado: {quantity}'
+            if quantity <= 0:
+                errors[f'items.{idx}'] = 'quantity debe ser mayor a 0'
+            elif not product_id and not product_name:
+                errors[f'items.{idx}'] = 'product_id o product_name es requerido'
+            elif price is not None and (not price.is_finite() or price < 0):
+                errors[f'items.{idx}'] = 'price no es válido'
+            else:
+                lines.append({'product_id': product_id, 'product_name': product_name, 'quantity': quantity, 'price': price})
         
         if errors:
             raise serializers.ValidationError(errors)
         
+        attrs['items'] = lines
         return attrs
 
-    @transaction.atomic
     def create(self, validated_data):
-        items_data = validated_data.pop('items')
-        # Si no hay stripe_payment_intent_id, no lo incluir en la creación
-        stripe_id = validated_data.pop('stripe_payment_intent_id', None)
-        
-        # Crear la compra
-        purchase = Purchase.objects.create(
-            user=self.context['request'].user,
-            stripe_payment_intent_id=stripe_id,
-            **validated_data,
-            status='completed'
-        )
-        
-        # Crear items y actualizar stock
-        for item_data in items_data:
-            product_id = item_data.get('product_id')
-            product_name = item_data.get('product_name')
-            quantity = item_data['quantity']
-            
-            # Buscar el producto por ID (preferido) o por nombre
-            if product_id:
-                product = Product.objects.get(id=product_id, is_active=True)
-            else:
-                try:
-                    product = Product.objects.get(name=product_name, is_active=True)
-                except Product.MultipleObjectsReturned:
-                    product = Product.objects.filter(name=product_name, is_active=True).first()
-            
-            # Validar stock nuevamente (por si acaso cambió entre validación y creación)
-            if not product.is_available(quantity):
-                raise serializers.ValidationError(
-                    f'Stock insuficiente para "{product.name}". Disponible: {product.stock}, solicitado: {quantity}'
-                )
-            
-            # Crear el item de compra
-            PurchaseItem.objects.create(
-                purchase=purchase,
-                product_name=product.name,
-                quantity=quantity,
-                price=item_data['price'],
+        # Una consulta para los productos, un UPDATE condicional para el stock y un bulk_create para los items
+        # Con PaymentIntent, el estado lo confirman los webhooks del pago (purchases.webhooks)
+        payment_intent_id = validated_data.pop('stripe_payment_intent_id', None) or None
+        try:
+            purchase = place_order(
+                self.context['request'].user,
+                validated_data.pop('items'),
+                stripe_payment_intent_id=payment_intent_id,
+                status=initial_status(payment_intent_id),
+                **validated_data,
             )
-            
-            # Actualizar stock del producto
-            product.stock -= quantity
-            if product.stock < 0:
-                product.stock = 0
-            product.save()
-        
+        except CheckoutError as error:
+            raise serializers.ValidationError(error.errors)
+        settle_purchase(purchase)
         return purchase
 
+
+class CartCheckoutSerializer(serializers.Serializer):
+    """Comprar el carrito del usuario: los items y precios salen del servidor"""
+    stripe_payment_intent_id = serializers.CharField(max_length=255, required=False, allow_null=True, allow_blank=True)
+    payment_method = serializers.ChoiceField(choices=[
+        ('card', 'Tarjeta'),
+        ('paypal', 'PayPal'),
+    ], default='card')
+
+    def create(self, validated_data):
+        payment_intent_id = validated_data.pop('stripe_payment_intent_id', None) or None
+        try:
+            purchase = place_cart_order(
+                self.context['request'].user,
+                stripe_payment_intent_id=payment_intent_id,
+                status=initial_status(payment_intent_id),
+                **validated_data,
+            )
+        except CheckoutError as error:
+            raise serializers.ValidationError(error.errors)
+        settle_purchase(purchase)
+        return purchase
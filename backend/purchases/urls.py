@@ -2,6 +2,8 @@ from django.urls import path
 from .views import (
     PurchaseHistoryView, 
     create_purchase, 
+    checkout_cart,
+    payment_webhook,
     create_payment_intent,
     get_purchase_detail,
 )
@@ -10,6 +12,8 @@ urlpatterns = [
     path('history/', PurchaseHistoryView.as_view(), name='purchase_history'),
     path('create-payment-intent/', create_payment_intent, name='create_payment_intent'),
     path('create/', create_purchase, name='create_purchase'),
+    path('checkout/', checkout_cart, name='checkout_cart'),
+    path('webhook/', payment_webhook, name='payment_webhook'),
     path('<int:purchase_id>/', get_purchase_detail, name='purchase_detail'),
 ]
 
@@ -0,0 +1,163 @@
+"""
+Eventos de pago recibidos por webhook.
+
+El endpoint solo verifica la firma y agrega el evento crudo a PaymentEvent:
+un INSERT, sin leer ni bloquear compras, para responder enseguida aunque
+lleguen miles de eventos por minuto. ``process_events`` (comando
+``process_payment_events``, en un worker o con cron) los aplica en lotes:
+
+- Recorre los eventos en orden de llegada con un cursor
+  (PaymentEventCheckpoint, bloqueado para que procese un solo worker a la
+  vez); los eventos nunca se modifican.
+- Descarta las entregas repetidas por id de evento (la pasarela reintenta).
+- Toma el último estado de cada PaymentIntent del lote y lo aplica con un
+  UPDATE por estado, buscando por stripe_payment_intent_id (único e
+  indexado), sin cargar ni bloquear las compras de a una. Una compra
+  completada no cambia de estado.
+- Una compra solo se completa si el monto cobrado (``amount_received``) y
+  el usuario que creó el PaymentIntent (metadata ``user_id``, ver
+  views.create_payment_intent) coinciden con los suyos; si no, queda
+  pendiente.
+
+Las compras sin PaymentIntent (checkout sin pasarela) se crean completadas
+y los eventos no las tocan.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import PaymentEvent, PaymentEventCheckpoint, Purchase
+
+CHECKPOINT = 'payment_events'
+
+# Estado de la compra según el tipo de evento (los demás tipos se guardan pero no cambian nada)
+EVENT_STATUSES = {
+    'payment_intent.succeeded': 'completed',
+    'payment_intent.payment_failed': 'failed',
+    'payment_intent.canceled': 'failed',
+    'payment_intent.processing': 'pending',
+}
+# Un pago acreditado no vuelve a pendiente ni pasa a fallido
+FINAL_STATUSES = ('completed',)
+
+# Los eventos más nuevos que esto esperan al próximo lote: un INSERT con id menor
+# que todavía no confirmó quedaría detrás del cursor
+SETTLE_SECONDS = 2
+
+
+def record_event(event, payload):
+    """Agregar el evento verificado (payments.WebhookEvent) con su cuerpo crudo"""
+    return PaymentEvent.objects.create(
+        event_id=event.id,
+        event_type=event.type,
+        payment_intent_id=event.payment_intent_id,
+        amount_received=event.amount_received,
+        owner_id=event.owner_id,
+        payload=payload,
+    )
+
+
+def initial_status(payment_intent_id):
+    """
+    Estado de una compra nueva: sin PaymentIntent se da por completada; con
+    uno, pendiente hasta que settle_purchase o los webhooks la confirmen.
+    """
+    return 'pending' if payment_intent_id else 'completed'
+
+
+def settle_purchase(purchase):
+    """Aplicar a una compra recién creada el último evento ya recibido de su PaymentIntent (puede llegar antes)"""
+    if not purchase.stripe_payment_intent_id:
+        return
+    event = (
+        PaymentEvent.objects.filter(payment_intent_id=purchase.stripe_payment_intent_id, event_type__in=EVENT_STATUSES)
+        .order_by('-id').values_list('event_type', 'amount_received', 'owner_id').first()
+    )
+    if event is not None:
+        event_type, amount_received, owner_id = event
+        if apply_statuses({purchase.stripe_payment_intent_id: (EVENT_STATUSES[event_type], amount_received, owner_id)}):
+            purchase.refresh_from_db(fields=['status', 'updated_at'])
+
+
+def paid_purchase(intent_id, amount_received, owner_id):
+    """Condición de la compra que ``amount_received`` centavos de ``owner_id`` pagan; None si no se puede verificar"""
+    if amount_received is None or not owner_id.isdigit():
+        return None
+    return Q(stripe_payment_intent_id=intent_id, total_amount=Decimal(amount_received) / 100, user_id=int(owner_id))
+
+
+def apply_statuses(statuses):
+    """
+    Aplicar ``{payment_intent_id: (estado, amount_received, owner_id)}`` con un
+    UPDATE por estado; devuelve las compras actualizadas.
+    """
+    conditions_by_status = defaultdict(list)
+    for intent_id, (status, amount_received, owner_id) in statuses.items():
+        if status == 'completed':
+            # Completar solo si el pago corresponde a la compra (monto y usuario)
+            condition = paid_purchase(intent_id, amount_received, owner_id)
+            if condition is None:
+                continue
+        else:
+            condition = Q(stripe_payment_intent_id=intent_id)
+        conditions_by_status[status].append(condition)
+    updated = 0
+    for status, conditions in conditions_by_status.items():
+        match = Q()
+        for condition in conditions:
+            match |= condition
+        updated += (
+            Purchase.objects.filter(match)
+            .exclude(status__in=(status, *FINAL_STATUSES))
+            .update(status=status, updated_at=timezone.now())
+        )
+    return updated
+
+
+def process_batch(batch_size=1000):
+    """Aplicar el siguiente lote de eventos; devuelve (eventos leídos, compras actualizadas)"""
+    with transaction.atomic():
+        checkpoint, _ = PaymentEventCheckpoint.objects.select_for_update().get_or_create(name=CHECKPOINT)
+        settled = timezone.now() - timedelta(seconds=SETTLE_SECONDS)
+        events = list(
+            PaymentEvent.objects.filter(id__gt=checkpoint.last_event_id, received_at__lte=settled)
+            .order_by('id').values_list(
+                'id', 'event_id', 'event_type', 'payment_intent_id', 'amount_received', 'owner_id'
+            )[:batch_size]
+        )
+        if not events:
+            return 0, 0
+
+        # Entregas repetidas: las ya aplicadas en lotes anteriores y las repetidas dentro del lote
+        seen = set(
+            PaymentEvent.objects.filter(
+                id__lte=checkpoint.last_event_id, event_id__in={event[1] for event in events}
+            ).values_list('event_id', flat=True)
+        )
+        statuses = {}
+        for _, event_id, event_type, intent_id, amount_received, owner_id in events:
+            if event_id in seen:
+                continue
+            seen.add(event_id)
+            status = EVENT_STATUSES.get(event_type)
+            if status and intent_id and statuses.get(intent_id, (None,))[0] not in FINAL_STATUSES:
+                statuses[intent_id] = (status, amount_received, owner_id)
+        updated = apply_statuses(statuses)
+
+        checkpoint.last_event_id = events[-1][0]
+        checkpoint.save(update_fields=['last_event_id'])
+    return len(events), updated
+
+
+def process_events(batch_size=1000):
+    """Aplicar todos los eventos pendientes en lotes; devuelve (eventos leídos, compras actualizadas)"""
+    total_events = total_updated = 0
+    while True:
+        events, updated = process_batch(batch_size)
+        total_events += events
+        total_updated += updated
+        if events < batch_size:
+            return total_events, total_updated
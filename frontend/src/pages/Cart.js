@@ -5,6 +5,24 @@ import { useAuth } from '../context/AuthContext';
 import api from '../services/api';
 import './Cart.css';
 
+// Aplicar una respuesta ?view=delta al carrito en caché (sin volver a pedirlo)
+function applyCartDelta(old, delta) {
+  if (!old) return old;
+  const changed = new Map(delta.items.map((item) => [item.id, item]));
+  return {
+    ...old,
+    ...delta.cart,
+    items: old.items
+      .filter((item) => !delta.removed.includes(item.id))
+      .map((item) => (changed.has(item.id) ? { ...item, ...changed.get(item.id) } : item)),
+  };
+}
+
+// Unidades que puede tener el item: el stock libre más lo que ya retiene (reservas)
+function availableFor(item) {
+  return (item.product.available_stock ?? item.product.stock ?? 0) + (item.reserved_quantity || 0);
+}
+
 function Cart() {
   const { isAuthenticated } = useAuth();
   const navigate = useNavigate();
@@ -23,9 +41,12 @@ function Cart() {
   // Mutación para actualizar cantidad (con optimistic update)
   const updateQuantityMutation = useMutation({
     mutationFn: async ({ itemId, quantity }) => {
-      const response = await api.put(`/api/cart/items/${itemId}/`, { quantity });
+      const response = await api.put(`/api/cart/items/${itemId}/?view=delta`, { quantity });
       return response.data;
     },
+    onSuccess: (delta) => {
+      queryClient.setQueryData(['cart'], (old) => applyCartDelta(old, delta));
+    },
     onError: (err) => {
       const errorMsg = err.response?.data?.error || 'Error al actualizar la cantidad';
       alert(errorMsg);
@@ -56,16 +77,16 @@ function Cart() {
         queryClient.setQueryData(['cart'], context.previousCart);
       }
     },
-    onSettled: () => {
-      // Invalidar para refrescar datos del servidor
-      queryClient.invalidateQueries({ queryKey: ['cart'] });
-    },
   });
 
   // Mutación para eliminar item (con optimistic update)
   const removeItemMutation = useMutation({
     mutationFn: async (itemId) => {
-      await api.delete(`/api/cart/items/${itemId}/remove/`);
+      const response = await api.delete(`/api/cart/items/${itemId}/remove/?view=delta`);
+      return response.data;
+    },
+    onSuccess: (delta) => {
+      queryClient.setQueryData(['cart'], (old) => applyCartDelta(old, delta));
     },
     onMutate: async (itemId) => {
       await queryClient.cancelQueries({ queryKey: ['cart'] });
@@ -86,9 +107,6 @@ function Cart() {
         queryClient.setQueryData(['cart'], context.previousCart);
       }
     },
-    onSettled: () => {
-      queryClient.invalidateQueries({ queryKey: ['cart'] });
-    },
   });
 
   // Mutación para vaciar carrito
@@ -228,11 +246,11 @@ function Cart() {
                     disabled={
                       updateQuantityMutation.isPending ||
                       !item.product.is_available ||
-                      item.quantity >= (item.product.stock || 0)
+                      item.quantity >= availableFor(item)
                     }
                     className="quantity-btn"
                     title={
-                      item.quantity >= (item.product.stock || 0)
+                      item.quantity >= availableFor(item)
                         ? 'Stock insuficiente'
                         : 'Aumentar cantidad'
                     }
@@ -242,15 +260,15 @@ function Cart() {
                 </div>
                 <div className="cart-item-stock">
                   {item.product.stock !== undefined && (
-                    <span className={`stock-info ${item.product.stock === 0 ? 'out-of-stock' : item.product.stock <= 5 ? 'low-stock' : ''}`}>
-                      Stock: {item.product.stock}
+                    <span className={`stock-info ${availableFor(item) === 0 ? 'out-of-stock' : availableFor(item) <= 5 ? 'low-stock' : ''}`}>
+                      Stock: {availableFor(item)}
                     </span>
                   )}
                 </div>
                 <div className="cart-item-subtotal">
                   ${item.subtotal}
                 </div>
-                {item.quantity > (item.product.stock || 0) && (
+                {item.quantity > availableFor(item) && (
                   <div className="stock-warning">
                     ⚠️ Cantidad excede el stock disponible
                   </div>
@@ -1,9 +1,23 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { useQuery, useQueryClient, useMutation } from '@tanstack/react-query';
 import api from '../services/api';
 import './Checkout.css';
 
+// Unidades que puede tener el item: el stock libre más lo que ya retiene (reservas)
+function availableFor(item) {
+  return (item.product.available_stock ?? item.product.stock ?? 0) + (item.reserved_quantity || 0);
+}
+
+// Clave para Idempotency-Key (randomUUID solo existe en contextos seguros: HTTPS o localhost)
+function newIdempotencyKey() {
+  if (window.crypto?.randomUUID) {
+    return window.crypto.randomUUID();
+  }
+  const bytes = window.crypto.getRandomValues(new Uint8Array(16));
+  return Array.from(bytes, (byte) => byte.toString(16).padStart(2, '0')).join('');
+}
+
 function Checkout() {
   const navigate = useNavigate();
   const queryClient = useQueryClient();
@@ -120,27 +134,25 @@ function Checkout() {
     }
   };
 
-  // Mutación para crear la compra
-  const createPurchaseMutation = useMutation({
-    mutationFn: async () => {
-      const purchaseData = {
-        total_amount: total.toFixed(2),
-        payment_method: 'card',
-        items: cart.items.map((item) => ({
-          product_id: item.product.id,
-          product_name: item.product.name,
-          quantity: item.quantity,
-          price: item.product.final_price,
-        })),
-      };
+  // Una clave por intento de compra: se reutiliza al reintentar y se descarta al terminar
+  const idempotencyKeyRef = useRef(null);
 
-      const response = await api.post('/api/purchases/create/', purchaseData);
+  // Mutación para comprar el carrito: el servidor toma los items y precios del carrito y lo vacía
+  const createPurchaseMutation = useMutation({
+    mutationFn: async (idempotencyKey) => {
+      // Con la misma clave, un reintento devuelve la misma compra en vez de crear otra
+      const response = await api.post(
+        '/api/purchases/checkout/',
+        { payment_method: 'card' },
+        { headers: { 'Idempotency-Key': idempotencyKey } }
+      );
       return response.data;
     },
     onSuccess: async (data) => {
-      // Limpiar el carrito después de la compra exitosa
-      await api.delete('/api/cart/clear/');
-      
+      idempotencyKeyRef.current = null;
+      // La respuesta ya es la boleta: no hace falta volver a pedirla
+      queryClient.setQueryData(['purchase', String(data.id)], data);
+
       // Invalidar y refrescar cache para historial y carrito
       queryClient.invalidateQueries(['purchaseHistory']);
       queryClient.invalidateQueries(['cart']);
@@ -157,6 +169,12 @@ function Checkout() {
       }
     },
     onError: (err) => {
+      // Un rechazo definitivo (4xx salvo 409, compra en curso) queda guardado con la clave:
+      // tras corregir el carrito hay que reintentar con otra. Sin respuesta o con 5xx se reutiliza
+      const statusCode = err.response?.status;
+      if (statusCode && statusCode < 500 && statusCode !== 409) {
+        idempotencyKeyRef.current = null;
+      }
       const errorData = err.response?.data;
       let errorMsg = 'Error al procesar la compra';
       
@@ -167,10 +185,11 @@ function Checkout() {
           errorMsg = errorData.detail;
         } else if (errorData.error) {
           errorMsg = errorData.error;
-        } else if (errorData.items) {
-          // Errores de validación de items
-          const itemErrors = Object.entries(errorData.items)
-            .map(([key, value]) => `${key}: ${Array.isArray(value) ? value.join(', ') : value}`)
+        } else if (Object.keys(errorData).some((key) => key.startsWith('items'))) {
+          // Errores de validación de items ('items' o 'items.N')
+          const itemErrors = Object.entries(errorData)
+            .filter(([key]) => key.startsWith('items'))
+            .map(([, value]) => (Array.isArray(value) ? value.join(', ') : value))
             .join('\n');
           errorMsg = 'Error en los productos:\n' + itemErrors;
         } else {
@@ -201,9 +220,9 @@ function Checkout() {
     if (cart && cart.items) {
       const stockErrors = [];
       for (const item of cart.items) {
-        if (item.quantity > (item.product.stock || 0)) {
+        if (item.quantity > availableFor(item)) {
           stockErrors.push(
-            `${item.product.name}: cantidad solicitada (${item.quantity}) excede el stock disponible (${item.product.stock || 0})`
+            `${item.product.name}: cantidad solicitada (${item.quantity}) excede el stock disponible (${availableFor(item)})`
           );
         }
       }
@@ -216,7 +235,10 @@ function Checkout() {
 
     setLoading(true);
     setError('');
-    createPurchaseMutation.mutate();
+    if (!idempotencyKeyRef.current) {
+      idempotencyKeyRef.current = newIdempotencyKey();
+    }
+    createPurchaseMutation.mutate(idempotencyKeyRef.current);
   };
 
   if (cartLoading) {